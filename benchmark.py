@@ -0,0 +1,60 @@
+import itertools
+import json
+import sys
+
+from utils.benchmark.argparser import ArgParser
+from utils.benchmark.report import compare, format_table, summarize, write_csv, write_json
+from utils.benchmark.runner import run_inprocess, run_subprocess
+
+
+def main():
+    parser = ArgParser()
+    print("Benchmark arguments:")
+    print(parser)
+    print("")
+
+    client_options = {
+        "timeout": parser.timeout,
+        "segment_size": parser.segment_size,
+        "window_size": parser.window_size,
+        "congestion_control": parser.congestion_control,
+    }
+    run_scenario = run_subprocess if parser.subprocess else run_inprocess
+    runs = []
+    port = parser.port
+    for size, drop, delay in itertools.product(parser.sizes, parser.drops, parser.delays):
+        for run in range(parser.repeat):
+            # fresh ports, so late datagrams of one run never reach the next
+            if port > 65533:
+                port = parser.port
+            result = run_scenario(size, drop, delay, run, parser.seed + run, port, parser.limit, client_options)
+            port += 2
+            runs.append(result)
+            outcome = f"{result['completion']:.3f}s, {result['goodput']:.2f} Mbit/s" if result["delivered"] else "failed"
+            print(f"size={size} drop={drop} delay={delay} run={run}: {outcome}, {result['datagrams']} packets", flush=True)
+
+    results = summarize(runs)
+    print("")
+    print(format_table(results))
+    if parser.json:
+        write_json(parser.json, parser.settings(), runs, results)
+    if parser.csv:
+        write_csv(parser.csv, results)
+
+    if parser.baseline:
+        with open(parser.baseline) as file:
+            baseline = json.load(file)
+        if baseline["settings"] != parser.settings():
+            print(f"\nThe baseline ran with other settings, {baseline['settings']}")
+        table, regressions = compare(results, baseline, parser.tolerance)
+        print("\nPercent better (+) or worse (-) than the baseline:")
+        print(table)
+        if regressions:
+            print(f"\nWorse than the baseline by more than {parser.tolerance}%:")
+            print("\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
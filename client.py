@@ -10,31 +10,73 @@ def main():
     print(parser)
     print("")
 
-    reliableUDP = ReliableUDP(timeout=parser.timeout).create()
+    reliableUDP = ReliableUDP(
+        timeout=parser.timeout,
+        segment_size=parser.segment_size,
+        window_size=parser.window_size,
+        congestion_control=parser.congestion_control,
+        batch_delay=parser.batch_delay,
+        profile=parser.profile,
+    ).create()
     send = lambda x: reliableUDP.send(x, parser.target, parser.target_port)
 
-    if parser.input:
-        # Command-line argument provided
-        send(parser.input)
-    elif not sys.stdin.isatty():
-        # Input is being piped or redirected
-        std_input = sys.stdin.read()
-        send(std_input)
-    else:
-        # Interactive user input
-        print("Enter your input (type 'exit' to finish):")
-        while True:
-            try:
-                line = input()
-                if line.lower() == "exit":
+    failed = False
+
+    def report():
+        # the protocol only records why a message was given up on, printing it is up to the client
+        nonlocal failed
+        failed = True
+        if reliableUDP.sender is not None and reliableUDP.sender.abort_reason is not None:
+            print(f"\033[91m{reliableUDP.sender.abort_reason}\033[0m", file=sys.stderr)
+
+    def connect():
+        try:
+            reliableUDP.connect(parser.target, parser.target_port)
+        except ConnectionError as error:
+            # older servers take a single message per handshake, send() then opens one for each
+            print(f"{error}, every message gets a handshake of its own")
+
+    try:
+        if parser.input:
+            # Command-line argument provided
+            if not send(parser.input):
+                report()
+        elif not sys.stdin.isatty() and parser.batch_delay is not None:
+            # Piped lines are messages of their own, coalesced into as few segments as the delay allows
+            connect()
+            for line in sys.stdin.buffer:
+                if not send(line.rstrip(b"\n")):
+                    report()
+        elif not sys.stdin.isatty():
+            # Input is being piped or redirected, read it as the window moves instead of all at once
+            if not send(sys.stdin.buffer):
+                report()
+        else:
+            # Interactive user input, every line is a message on one persistent connection
+            print("Enter your input (type 'exit' to finish):")
+            connect()
+            while True:
+                try:
+                    line = input()
+                    if line.lower() == "exit":
+                        break
+                    if not send(line):
+                        report()
+                except ConnectionError as error:
+                    # the line stays buffered and goes out again with the next one
+                    print(error)
+                except (KeyboardInterrupt, EOFError):
                     break
-                send(line)
-            except (KeyboardInterrupt, EOFError):
-                break
 
-    reliableUDP.close()
+        reliableUDP.close()
+    except ConnectionError as error:
+        # a persistent connection that still gets no answer after a fresh handshake, its messages are lost
+        print(f"\033[91m{error}\033[0m", file=sys.stderr)
+        failed = True
+    if reliableUDP.send_stats is not None:
+        print(reliableUDP.send_stats)
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    main()
-    sys.exit(0)
+    sys.exit(main())
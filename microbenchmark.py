@@ -0,0 +1,35 @@
+import os
+import sys
+
+from utils.benchmark.argparser import MicroArgParser
+from utils.benchmark.micro import BASELINE_PATH, BENCHMARKS, confirm, format_table, load, regressions, run, save
+
+
+def main():
+    parser = MicroArgParser(list(BENCHMARKS), BASELINE_PATH)
+    print("Microbenchmark arguments:")
+    print(parser)
+    print("")
+
+    results = run(parser.names, parser.repeat, parser.warmup)
+    if parser.save or not os.path.isfile(parser.baseline):
+        print(format_table(results))
+        save(parser.baseline, results)
+        print(f"\nSaved as the baseline in {parser.baseline}")
+        return
+
+    baseline = load(parser.baseline)
+    found = regressions(results, baseline, parser.threshold)
+    if found:
+        results = confirm(results, found, parser.repeat, parser.warmup)
+        found = regressions(results, baseline, parser.threshold)
+    print(format_table(results, baseline))
+    if found:
+        print(f"\nWorse than the baseline (more than {parser.threshold}% slower, or more memory blocks retained per op):")
+        print("\n".join(f"{name}: {change}" for name, change in found))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -1,20 +1,26 @@
 import ipaddress
-import random
 import signal
 import sys
-import time
-from concurrent.futures import ThreadPoolExecutor
-from threading import Thread
-from socket import AF_INET, SOCK_DGRAM, socket
-from utils.cli import CLI
-from utils.packet import Packet
+from collections import OrderedDict
+from selectors import DefaultSelector, EVENT_READ
+from threading import Lock, RLock, Thread
+from socket import AF_INET, SOCK_DGRAM, socket, socketpair
+from time import monotonic
+from typing import List, Optional
+from utils.constants import PROXY_MEMORY
+from utils.packet import layouts
 from utils.proxy.argparser import ArgParser
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-import sys
+from utils.proxy.bottleneck import Bottleneck
+from utils.proxy.export import MetricsExporter
+from utils.proxy.impairment import Decision, Impairment
+from utils.proxy.metrics import TrafficStats
+from utils.proxy.nat import Flow, NATTable
+from utils.proxy.scheduler import DelayScheduler
+from utils.proxy.trace import TraceWriter, read_schedule
+from utils.sequence import SEQ_MODULO, unwrap
 
 class Proxy:
-    MAX_MEMORY = 500
+    BUFFER_SIZE = 65535
 
     def __init__(
         self,
@@ -28,72 +34,186 @@ class Proxy:
         server_drop: float,
         server_delay: float,
         server_delay_time: tuple[float, float],
+        memory: int = PROXY_MEMORY,
+        flow_rules: Optional[List[tuple]] = None,
+        client_rate: int = 0,
+        client_queue: int = 0,
+        client_red: bool = False,
+        server_rate: int = 0,
+        server_queue: int = 0,
+        server_red: bool = False,
+        client_loss: Optional[tuple] = None,
+        client_jitter: Optional[tuple] = None,
+        client_reorder: tuple[float, int] = (0, 1),
+        client_duplicate: float = 0,
+        server_loss: Optional[tuple] = None,
+        server_jitter: Optional[tuple] = None,
+        server_reorder: tuple[float, int] = (0, 1),
+        server_duplicate: float = 0,
+        seed: Optional[int] = None,
+        trace: Optional[str] = None,
+        replay: Optional[str] = None,
     ):
         self.listen_ip = listen_ip
         self.listen_port = listen_port
         self.socket = socket(AF_INET, SOCK_DGRAM)
         self.client_config = {
-            "ip": None,
-            "port": None,
             "drop": client_drop,
             "delay": client_delay,
             "delay_time": client_delay_time,
+            # bottleneck link: bits/s (0 for unlimited), queued datagrams (0 for unlimited), RED instead of tail drop
+            "rate": client_rate,
+            "queue": client_queue,
+            "red": client_red,
+            # settings of the impairment models, see MODELS in utils/proxy/impairment.py
+            "loss": client_loss,
+            "jitter": client_jitter,
+            "reorder": client_reorder,
+            "duplicate": client_duplicate,
         }
         self.server_config = {
-            "ip": target_ip,
+            # normalized once, every datagram is compared with and sent to it
+            "ip": str(ipaddress.ip_address(target_ip)),
             "port": target_port,
             "drop": server_drop,
             "delay": server_delay,
             "delay_time": server_delay_time,
+            "rate": server_rate,
+            "queue": server_queue,
+            "red": server_red,
+            "loss": server_loss,
+            "jitter": server_jitter,
+            "reorder": server_reorder,
+            "duplicate": server_duplicate,
+        }
+        # every client gets an upstream socket of its own, so replies find their way back
+        self.selector = DefaultSelector()
+        # cleared by stop(), the receiving loop ends at its next turn and stop() closes the sockets once it has
+        self.running = True
+        # held by the receiving loop, reentrant for a signal handler that interrupts it on the same thread
+        self.receiving = RLock()
+        # stop() writes to one end so that a select() in progress returns right away
+        self.wakeup, self.waker = socketpair()
+        self.nat = NATTable(self.selector, (self.server_config["ip"], target_port), flow_rules)
+        # key of recent datagrams, see segment_key(), least recently seen first
+        self.packets = OrderedDict()
+        self.memory = memory
+        # (from server, connection id) -> latest sequence number of recent transfers on 16 bit layouts, least recently
+        # seen first
+        self.sequences = OrderedDict()
+        # the receiving thread and the delay scheduler both record datagrams, in the memory above and in the
+        # counters and latency histograms of live_stats
+        self.packets_lock = Lock()
+        # releases delayed datagrams on time from one thread
+        self.scheduler = DelayScheduler()
+        # seeded random decisions of each direction, the same seed replays the same drops, delays and reorders
+        # or the ones of a recorded run, for comparing two builds under identical conditions
+        schedule = read_schedule(replay) if replay else {}
+        self.impairments = {
+            "client": Impairment(self.client_config, seed, "client", schedule.get("client")),
+            "server": Impairment(self.server_config, seed, "server", schedule.get("server")),
         }
-        self.packets = []
+        # every datagram with its fate, written from the receiving thread only
+        self.trace = TraceWriter(trace) if trace else None
+        # one link per direction, shared by every flow
+        self.bottlenecks = {
+            target: Bottleneck(impairment.config, impairment.random["red"]) for target, impairment in self.impairments.items()
+        }
+        # datagrams from each side, fixed memory however long the proxy runs
         self.live_stats = {
-            "client_sent": 0,
-            "client_received": 0,
-            "client_dropped": 0,
-            "client_retransmitted": 0,
-            "client_latency": [],
-            "server_sent": 0,
-            "server_received": 0,
-            "server_dropped": 0,
-            "server_retransmitted": 0,
-            "server_latency": [],
+            "client": TrafficStats(),
+            "server": TrafficStats(),
         }
 
     def set_config(self, target, field, value):
         config = self.client_config if target == "client" else self.server_config
         config[field] = value
 
-    def get_config(self, target, field):
+    def get_config(self, target, field, flow: Optional[Flow] = None):
         config = self.client_config if target == "client" else self.server_config
+        if flow is not None:
+            return flow.config[target].get(field, config[field])
         return config[field]
 
-    def forward(self, data, forawrd_to, delay, drop, is_source_server):
-        if delay:
-            time.sleep(delay/1000)
+    def forward(self, data, sock, forawrd_to, delay, drop, is_source_server):
         self.record_packet(is_source_server, data, drop, delay)
         if drop:
             return
-        self.socket.sendto(data, forawrd_to)
+        self.transmit(data, sock, forawrd_to)
+
+    def transmit(self, data, sock, forward_to):
+        try:
+            sock.sendto(data, forward_to)
+        except OSError:
+            # the flow expired while the datagram was delayed
+            pass
 
     def record_packet(self, is_source_server, data, is_dropped, delay_time):
-        source = "server" if is_source_server else "client"
-        packet = Packet(data)
-        self.live_stats[f"{source}_sent"] += 1
+        source = self.live_stats["server" if is_source_server else "client"]
+        destination = self.live_stats["client" if is_source_server else "server"]
+        with self.packets_lock:
+            digest = self.segment_key(is_source_server, data)
+            source.sent += 1
+            if is_dropped:
+                source.dropped += 1
+            else:
+                destination.received += 1
+                source.record_latency(delay_time or 0)
 
-        if is_dropped:
-            self.live_stats[f"{source}_dropped"] += 1
-        else:
-            self.live_stats[f"{"client" if is_source_server else "server"}_received"] += 1
-            self.live_stats[f"{source}_latency"].append(delay_time or 0)
+            if digest in self.packets:
+                source.retransmitted += 1
+                self.packets.move_to_end(digest)
+            else:
+                self.packets[digest] = None
+                if len(self.packets) > self.memory:
+                    self.packets.popitem(last=False)
 
-        if packet in self.packets:
-            self.live_stats[f"{source}_retransmitted"] += 1
-        self.packets.append(packet)
-        if len(self.packets) > Proxy.MAX_MEMORY:
-            self.packets.pop(0)
+    def segment_key(self, is_source_server, data):
+        # a data segment is known by its connection and its sequence number unwrapped to 32 bits. Every send carries a
+        # fresh timestamp, and the first segments of a transfer go out on a 16 bit layout but may be resent on a wide
+        # one. ACKs and layouts this build does not know are compared on their raw bytes
+        try:
+            layout = layouts.detect(data)
+        except ValueError:
+            return hash(data)
+        get = layout.getters
+        if len(data) < layout.length or "conn_id" not in get or get["ack"](data):
+            return hash(data)
+        flow = (is_source_server, get["conn_id"](data))
+        seq_num = get["seq_num"](data)
+        if "seq_num_hi" in get:
+            return (flow, seq_num + get["seq_num_hi"](data) * SEQ_MODULO)
+        if not get["syn"](data):
+            # the initial sequence number fits 16 bits, the ones after it are unwrapped against the latest of the flow
+            seq_num = unwrap(seq_num, self.sequences.get(flow, seq_num))
+        self.sequences[flow] = seq_num
+        self.sequences.move_to_end(flow)
+        if len(self.sequences) > self.memory:
+            self.sequences.popitem(last=False)
+        return (flow, seq_num)
+
+    def snapshot(self) -> dict:
+        # read by the metrics exporter and the live graph while the histograms are being recorded into
+        with self.packets_lock:
+            # the queues drain with time, not with datagrams, so their depth is read now rather than on the last enqueue
+            now = monotonic()
+            for target, bottleneck in self.bottlenecks.items():
+                self.live_stats[target].queue_depth = bottleneck.depth(now)
+            stats = {
+                "client": self.live_stats["client"].snapshot(),
+                "server": self.live_stats["server"].snapshot(),
+            }
+        return {
+            **stats,
+            "flows": len(self.nat.flows),
+            "delayed": len(self.scheduler),
+        }
 
     def live_graph(self):
+        # only the interactive mode pays for importing matplotlib
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+
         fig, ((client_ax1, server_ax1), (client_ax2, server_ax2)) = plt.subplots(2, 2, figsize=(15, 8))
         def update(_):
             table = {
@@ -106,15 +226,20 @@ class Proxy:
                 ax2.clear()
 
                 labels = ["sent", "received", "dropped", "retransmitted"]
-                metrics = [target + "_" + x for x in labels]
-                values = [self.live_stats[m] for m in metrics]
+                stats = self.live_stats[target]
+                with self.packets_lock:
+                    values = [getattr(stats, label) for label in labels]
+                    latency = stats.histogram.summary()
+                    recent = list(stats.latency)
                 ax1.bar(labels, values, color=["blue", "green", "red", "purple"])
                 ax1.set_title(f"Packet Stats - {target}")
                 ax1.set_ylabel("Count")
 
-                latencies = self.live_stats[f"{target}_latency"]
-                ax2.plot(latencies[-50:], label="Latency (last 50 packets)", color="black")
-                ax2.set_title(f"Latency Observed - {target}")
+                ax2.plot(recent, label=f"Latency (last {stats.latency.maxlen} packets)", color="black")
+                if latency["count"]:
+                    ax2.set_title(f"Latency Observed - {target} (p50 {latency['p50']:.0f}ms, p99 {latency['p99']:.0f}ms, max {latency['max']:.0f}ms)")
+                else:
+                    ax2.set_title(f"Latency Observed - {target}")
                 ax2.set_ylabel("Milliseconds")
                 ax2.set_xlabel("Packet Index")
                 ax2.legend()
@@ -124,47 +249,115 @@ class Proxy:
         plt.show()
 
     def recv_packet(self):
-        with ThreadPoolExecutor() as executor:
-            while True:
-                data, (ip, port) = self.socket.recvfrom(1024)
-                is_server = (
-                    ip == self.server_config["ip"] and port == self.server_config["port"]
-                )
-                if not is_server:
-                    self.client_config["ip"] = ip
-                    self.client_config["port"] = port
-                forward_to = (
-                    str(
-                        ipaddress.ip_address(
-                            self.client_config["ip"]
-                            if is_server
-                            else self.server_config["ip"]
-                        )
-                    ),
-                    self.client_config["port"] if is_server else self.server_config["port"],
-                )
-                config = self.server_config if is_server else self.client_config
-                drop_prob = config["drop"]
-                delay_prob = config["delay"]
-                delay_time_min, delay_time_max = config["delay_time"]
-                delay_time = random.uniform(delay_time_min, delay_time_max or delay_time_min)
-
-                should_drop = random.random() <= (drop_prob / 100)
-                should_delay = random.random() <= (delay_prob / 100)
-                executor.submit(self.forward, data, forward_to, delay_time if (should_delay and not should_drop) else None, should_drop, is_server)
+        with self.receiving:
+            self.selector.register(self.socket, EVENT_READ, None)
+            self.selector.register(self.wakeup, EVENT_READ, self.wakeup)
+            while self.running:
+                # wake up for held back datagrams that no later one came to release
+                timeout = NATTable.SWEEP_INTERVAL
+                for impairment in self.impairments.values():
+                    deadline = impairment.next_deadline()
+                    if deadline is not None:
+                        timeout = min(timeout, max(0, deadline - monotonic()))
+                for key, _ in self.selector.select(timeout):
+                    flow = key.data
+                    if flow is self.wakeup:
+                        # stop() was called
+                        continue
+                    if flow is None:
+                        # a client, forwarded to the server from the upstream socket of its flow
+                        data, client = self.socket.recvfrom(Proxy.BUFFER_SIZE)
+                        flow = self.nat.flow(client)
+                        self.dispatch(data, flow, flow.upstream, self.nat.server, False)
+                    else:
+                        # the server, replying to one flow
+                        try:
+                            data = flow.upstream.recv(Proxy.BUFFER_SIZE)
+                        except OSError:
+                            continue
+                        flow.last_activity = monotonic()
+                        self.dispatch(data, flow, self.socket, flow.client, True)
+                now = monotonic()
+                for impairment in self.impairments.values():
+                    for send in impairment.expired(now):
+                        send()
+                self.nat.expire()
+
+    def dispatch(self, data, flow: Flow, sock, forward_to, is_server, decision: Optional[Decision] = None):
+        target = "server" if is_server else "client"
+        impairment = self.impairments[target]
+        stats = self.live_stats[target]
+        released = decision is not None
+        if decision is None:
+            decision = impairment.decide(
+                self.get_config(target, "drop", flow),
+                self.get_config(target, "delay", flow),
+                self.get_config(target, "delay_time", flow),
+            )
+            if decision.hold:
+                stats.reordered += 1
+                impairment.hold(decision.hold, lambda: self.dispatch(data, flow, sock, forward_to, is_server, decision), monotonic())
+                return
+
+        should_drop = decision.drop is not None
+        delay = decision.delay or None
+        wait = 0.0
+        if not should_drop:
+            bottleneck = self.bottlenecks[target]
+            wait = bottleneck.enqueue(len(data), monotonic())
+            if wait is None:
+                stats.queue_dropped += 1
+                should_drop = True
+            elif bottleneck.config["rate"]:
+                stats.queue_delay.record(wait * 1000)
+                if wait:
+                    delay = (delay or 0) + wait * 1000
+        if self.trace is not None:
+            source, destination = (self.nat.server, flow.client) if is_server else (flow.client, self.nat.server)
+            self.trace.record(target, data, source, destination, decision, "queue" if wait is None else decision.drop, (wait or 0) * 1000)
+        if delay:
+            self.scheduler.schedule(delay / 1000, self.forward, data, sock, forward_to, delay, should_drop, is_server)
+        else:
+            self.forward(data, sock, forward_to, delay, should_drop, is_server)
+
+        if not should_drop and decision.duplicate:
+            # the copy follows the original and is not counted as a retransmission
+            stats.duplicated += 1
+            if delay:
+                self.scheduler.schedule(delay / 1000, self.transmit, data, sock, forward_to)
+            else:
+                self.transmit(data, sock, forward_to)
+        if not released:
+            for send in impairment.passed():
+                send()
 
     def run(self):
         self.socket.bind((str(ipaddress.ip_address(self.listen_ip)), self.listen_port))
+        Thread(target=self.scheduler.run, daemon=True).start()
         self.recv_packet()
 
     def stop(self):
-        self.socket.close()
+        if not self.running:
+            return
+        self.running = False
+        self.waker.send(b"\0")
+        self.scheduler.stop()
+        with self.receiving:
+            if self.trace is not None:
+                self.trace.close()
+            self.nat.close_all()
+            self.socket.close()
+            self.selector.close()
+            self.wakeup.close()
+            self.waker.close()
 
 
-def signal_handler(_sig, _frame, proxy: Proxy, cli: CLI):
+def signal_handler(_sig, _frame, proxy: Proxy, cli, exporter: MetricsExporter):
     print("Shutting down gracefully...")
     proxy.stop()  # Stop the proxy loop
-    cli.stop()
+    exporter.stop()
+    if cli is not None:
+        cli.stop()
     sys.exit(0)
 
 
@@ -182,7 +375,48 @@ if __name__ == "__main__":
         server_drop=parser.server_drop,
         server_delay=parser.server_delay,
         server_delay_time=parser.server_delay_time,
+        memory=parser.memory,
+        flow_rules=parser.flows,
+        client_rate=parser.client_rate,
+        client_queue=parser.client_queue,
+        client_red=parser.client_red,
+        server_rate=parser.server_rate,
+        server_queue=parser.server_queue,
+        server_red=parser.server_red,
+        client_loss=parser.client_loss,
+        client_jitter=parser.client_jitter,
+        client_reorder=parser.client_reorder,
+        client_duplicate=parser.client_duplicate,
+        server_loss=parser.server_loss,
+        server_jitter=parser.server_jitter,
+        server_reorder=parser.server_reorder,
+        server_duplicate=parser.server_duplicate,
+        seed=parser.seed,
+        trace=parser.trace,
+        replay=parser.replay,
     )
+    exporter = MetricsExporter(proxy.snapshot, parser.metrics_file, parser.metrics_port).start()
+
+    if parser.headless:
+        # no curses and no matplotlib, the numbers go to the metrics file or endpoint
+        signal.signal(
+            signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, proxy, None, exporter)
+        )
+        signal.signal(
+            signal.SIGTERM, lambda sig, frame: signal_handler(sig, frame, proxy, None, exporter)
+        )
+        print(parser)
+        if exporter.server is not None:
+            print(f"Metrics at http://127.0.0.1:{exporter.server.server_address[1]}/metrics")
+        try:
+            proxy.run()
+        except OSError:
+            # the socket was closed by the signal handler
+            pass
+        sys.exit(0)
+
+    from utils.cli import CLI
+
     cli = CLI(
         [
             str(parser),
@@ -258,13 +492,99 @@ if __name__ == "__main__":
                 "get_value": lambda: proxy.get_config("server", "delay_time")[1],
                 "set_value": lambda x: proxy.set_config("server", "delay_time", (proxy.get_config("server", "delay_time")[0],max(x, proxy.get_config("server", "delay_time")[0]))),
             },
+            {
+                "name": "Client rate",
+                "min": 0,
+                "step": 1000,
+                "suffix": " kbit/s (0 for unlimited)",
+                "get_value": lambda: proxy.get_config("client", "rate") // 1000,
+                "set_value": lambda x: proxy.set_config("client", "rate", x * 1000),
+            },
+            {
+                "name": "Client queue",
+                "min": 0,
+                "step": 10,
+                "suffix": " packets (0 for unlimited)",
+                "get_value": lambda: proxy.get_config("client", "queue"),
+                "set_value": lambda x: proxy.set_config("client", "queue", x),
+            },
+            {
+                "name": "Client RED",
+                "min": 0,
+                "max": 1,
+                "step": 1,
+                "suffix": " (0 for tail drop)",
+                "get_value": lambda: int(proxy.get_config("client", "red")),
+                "set_value": lambda x: proxy.set_config("client", "red", bool(x)),
+            },
+            {
+                "name": "Server rate",
+                "min": 0,
+                "step": 1000,
+                "suffix": " kbit/s (0 for unlimited)",
+                "get_value": lambda: proxy.get_config("server", "rate") // 1000,
+                "set_value": lambda x: proxy.set_config("server", "rate", x * 1000),
+            },
+            {
+                "name": "Server queue",
+                "min": 0,
+                "step": 10,
+                "suffix": " packets (0 for unlimited)",
+                "get_value": lambda: proxy.get_config("server", "queue"),
+                "set_value": lambda x: proxy.set_config("server", "queue", x),
+            },
+            {
+                "name": "Server RED",
+                "min": 0,
+                "max": 1,
+                "step": 1,
+                "suffix": " (0 for tail drop)",
+                "get_value": lambda: int(proxy.get_config("server", "red")),
+                "set_value": lambda x: proxy.set_config("server", "red", bool(x)),
+            },
+            {
+                "name": "Client reorder",
+                "min": 0,
+                "max": 100,
+                "step": 5,
+                "suffix": "%",
+                "get_value": lambda: proxy.get_config("client", "reorder")[0],
+                "set_value": lambda x: proxy.set_config("client", "reorder", (x, proxy.get_config("client", "reorder")[1])),
+            },
+            {
+                "name": "Client duplicate",
+                "min": 0,
+                "max": 100,
+                "step": 5,
+                "suffix": "%",
+                "get_value": lambda: proxy.get_config("client", "duplicate"),
+                "set_value": lambda x: proxy.set_config("client", "duplicate", x),
+            },
+            {
+                "name": "Server reorder",
+                "min": 0,
+                "max": 100,
+                "step": 5,
+                "suffix": "%",
+                "get_value": lambda: proxy.get_config("server", "reorder")[0],
+                "set_value": lambda x: proxy.set_config("server", "reorder", (x, proxy.get_config("server", "reorder")[1])),
+            },
+            {
+                "name": "Server duplicate",
+                "min": 0,
+                "max": 100,
+                "step": 5,
+                "suffix": "%",
+                "get_value": lambda: proxy.get_config("server", "duplicate"),
+                "set_value": lambda x: proxy.set_config("server", "duplicate", x),
+            },
         ],
         10,
     )
 
     # Register signal handler
     signal.signal(
-        signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, proxy, cli)
+        signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, proxy, cli, exporter)
     )
 
 
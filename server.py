@@ -10,12 +10,26 @@ def main():
     print(parser)
     print("")
 
-    reliableUDP = ReliableUDP().create()
+    reliableUDP = ReliableUDP(profile=parser.profile).create()
     reliableUDP.bind(parser.listen_ip, parser.listen_port)
-    while True:
-        message = reliableUDP.recv()
-        if message:
-            print(message)
+    try:
+        while True:
+            # write every message as it arrives, so large transfers are never held in memory
+            received = False
+            try:
+                for chunk in reliableUDP.recv_stream():
+                    sys.stdout.buffer.write(chunk)
+                    sys.stdout.buffer.flush()
+                    received = True
+            except ConnectionError as error:
+                # the part that arrived is already written, the next message still starts on a line of its own
+                print(f"\033[91m{error}\033[0m", file=sys.stderr)
+            if received:
+                sys.stdout.buffer.write(b"\n")
+                sys.stdout.buffer.flush()
+    except KeyboardInterrupt:
+        if reliableUDP.recv_stats is not None:
+            print(reliableUDP.recv_stats, file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+import asyncio
+import random
+import unittest
+from socket import AF_INET, SOCK_DGRAM, socket
+from threading import Thread
+from unittest import mock
+
+from utils.asyncReliableUDP import AsyncReliableUDP
+from utils.reliableUDP import ReliableUDP
+
+LOOPBACK = "127.0.0.1"
+
+
+def port_of(endpoint: AsyncReliableUDP) -> int:
+    return endpoint.transport.get_extra_info("sockname")[1]
+
+
+def lossy(endpoint: AsyncReliableUDP, drop: float, seed: int):
+    # drops outgoing datagrams of an endpoint at random, the same ones on every run
+    rng = random.Random(seed)
+    sendto = endpoint.sendto
+    endpoint.sendto = endpoint.receiver.send = lambda data, addr: None if rng.random() < drop else sendto(data, addr)
+
+
+class AsyncTransportTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await AsyncReliableUDP().create(LOOPBACK, 0)
+        self.port = port_of(self.server)
+        self.client = await AsyncReliableUDP(timeout=0.05, segment_size=500).create()
+
+    async def asyncTearDown(self):
+        self.client.close()
+        self.server.close()
+
+    async def receive(self, count: int):
+        return [await asyncio.wait_for(self.server.recv(), 5) for _ in range(count)]
+
+    async def test_concurrent_transfers_over_a_lossy_link(self):
+        lossy(self.server, 0.1, 1)
+        lossy(self.client, 0.1, 2)
+        messages = [f"message {i} " * (i * 40) for i in range(20)]
+        results = await asyncio.gather(*(self.client.send(message, LOOPBACK, self.port) for message in messages))
+        self.assertTrue(all(results))
+        self.assertEqual(sorted(await self.receive(len(messages))), sorted(messages))
+
+    async def test_persistent_connection(self):
+        await self.client.connect(LOOPBACK, self.port)
+        for message in ("one", "", "three"):
+            await self.client.send(message)
+        self.assertTrue(await self.client.disconnect())
+        self.assertEqual(await self.receive(3), ["one", "", "three"])
+
+    async def test_sync_client(self):
+        sender = Thread(target=lambda: ReliableUDP(timeout=0.1).create().send("from sync", LOOPBACK, self.port), daemon=True)
+        sender.start()
+        self.assertEqual(await self.receive(1), ["from sync"])
+
+    async def test_streamed_delivery(self):
+        chunks = []
+        done = asyncio.get_running_loop().create_future()
+
+        def on_data(addr, chunk, is_last):
+            chunks.append(chunk)
+            if is_last:
+                done.set_result(True)
+
+        streaming = await AsyncReliableUDP(on_data=on_data).create(LOOPBACK, 0)
+        try:
+            message = bytes(range(256)) * 10
+            self.assertTrue(await self.client.send(message, LOOPBACK, port_of(streaming)))
+            await asyncio.wait_for(done, 5)
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(b"".join(chunks), message)
+        finally:
+            streaming.close()
+
+    @mock.patch("utils.protocol.RETRIES", 3)
+    async def test_silent_receiver(self):
+        silent = socket(AF_INET, SOCK_DGRAM)
+        silent.bind((LOOPBACK, 0))
+        try:
+            self.assertFalse(await self.client.send("lost", LOOPBACK, silent.getsockname()[1]))
+        finally:
+            silent.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+
+from utils.proxy.bottleneck import Bottleneck
+
+# 1000 bytes a second
+RATE = 8000
+
+
+class Draw:
+    # stands in for the seeded rng of the proxy
+    def __init__(self, value: float):
+        self.value = value
+
+    def random(self) -> float:
+        return self.value
+
+
+class BottleneckTest(unittest.TestCase):
+    def test_unlimited_rate_never_waits(self):
+        bottleneck = Bottleneck({ "rate": 0, "queue": 1 })
+        self.assertEqual([bottleneck.enqueue(10 ** 6, 0.0) for _ in range(5)], [0.0] * 5)
+        self.assertEqual(len(bottleneck), 0)
+
+    def test_burst_then_rate(self):
+        bottleneck = Bottleneck({ "rate": RATE })
+        self.assertEqual([bottleneck.enqueue(1000, 0.0) for _ in range(5)], [0.0, 0.0, 0.0, 1.0, 2.0])
+        self.assertEqual(len(bottleneck), 2)
+        # an idle link refills up to the burst, no further
+        self.assertEqual([bottleneck.enqueue(1000, 60.0) for _ in range(4)], [0.0, 0.0, 0.0, 1.0])
+
+    def test_settings_apply_right_away(self):
+        config = { "rate": RATE }
+        bottleneck = Bottleneck(config)
+        bottleneck.enqueue(3000, 0.0)
+        config["rate"] = 2 * RATE
+        self.assertEqual(bottleneck.enqueue(1000, 0.0), 0.5)
+
+    def test_tail_drop(self):
+        bottleneck = Bottleneck({ "rate": RATE, "queue": 2 })
+        waits = [bottleneck.enqueue(1000, 0.0) for _ in range(6)]
+        self.assertEqual(waits, [0.0, 0.0, 0.0, 1.0, 2.0, None])
+        # once the head left there is room again
+        self.assertEqual(bottleneck.enqueue(1000, 1.0), 2.0)
+
+    def test_depth_drains_with_time(self):
+        bottleneck = Bottleneck({ "rate": RATE })
+        for _ in range(6):
+            bottleneck.enqueue(1000, 0.0)
+        self.assertEqual([bottleneck.depth(now) for now in (0.0, 1.0, 2.5, 3.0)], [3, 2, 1, 0])
+        # reading the depth leaves the queue alone
+        self.assertEqual(len(bottleneck), 3)
+
+    def test_red_drops_early(self):
+        config = { "rate": RATE, "queue": 100, "red": True }
+        low, high = Bottleneck.RED_MIN * 100, Bottleneck.RED_MAX * 100
+        bottleneck = Bottleneck(config, Draw(0.0))
+        # below the minimum nothing is dropped early
+        bottleneck.average = low - 1
+        self.assertIsNotNone(bottleneck.enqueue(100, 0.0))
+        # between the thresholds it is up to the draw
+        bottleneck.average = (low + high) / 2
+        self.assertIsNone(bottleneck.enqueue(100, 0.0))
+        bottleneck.random = Draw(0.99)
+        bottleneck.average = (low + high) / 2
+        self.assertIsNotNone(bottleneck.enqueue(100, 0.0))
+        # past the maximum every arrival goes, however short the queue
+        bottleneck.average = high + 1
+        self.assertIsNone(bottleneck.enqueue(100, 0.0))
+
+    def test_red_is_reproducible(self):
+        def run(seed):
+            bottleneck = Bottleneck({ "rate": RATE, "queue": 50, "red": True }, random.Random(seed))
+            # the queue fills at twice the rate it drains
+            waits = []
+            for i in range(2000):
+                queued = bottleneck.depth(i * 0.5)
+                waits.append((queued, bottleneck.enqueue(1000, i * 0.5)))
+            return waits
+
+        waits = run(1)
+        self.assertEqual(waits, run(1))
+        self.assertNotEqual(waits, run(2))
+        # some arrivals are dropped before the queue is full
+        self.assertTrue(any(wait is None and queued < 50 for queued, wait in waits))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+from socket import AF_INET, SOCK_DGRAM, socket
+from threading import Thread
+
+from utils.congestion import create_congestion_control
+from utils.packet import EXTENDED_HEADER, MAX_SEGMENT_SIZE, SACK_BLOCKS, SACK_HEADER, WIDE_HEADER, Packet, custom_header
+from utils.protocol import Sender
+from utils.reliableUDP import ReliableUDP
+from utils.rtt import RTTEstimator
+from utils.schema import LayoutRegistry
+from utils.sequence import unwrap
+from utils.stream import SendBuffer
+
+LOOPBACK = "127.0.0.1"
+
+# the layouts of the builds before 32 bit sequence numbers, which fail on every other version
+old_extended_header = {
+    "conn_id": 4,
+    "timestamp": 4,
+    "window": 2,
+}
+old_layouts = LayoutRegistry(custom_header, "version")
+old_layouts.register(EXTENDED_HEADER, old_extended_header)
+old_layouts.register(SACK_HEADER, {
+    **old_extended_header,
+    "sack_count": 1,
+    **{f"sack_{i}_{edge}": 4 for i in range(1, SACK_BLOCKS + 1) for edge in ("start", "end")},
+})
+
+
+class OldReceiver:
+    # what a receiver of those builds does with one transfer: every segment is answered with a cumulative ACK
+    # on EXTENDED_HEADER and 16 bit sequence numbers, the FIN is repeated until the sender acknowledges it
+    def __init__(self):
+        self.socket = socket(AF_INET, SOCK_DGRAM)
+        self.socket.bind((LOOPBACK, 0))
+        self.socket.settimeout(5)
+        self.port = self.socket.getsockname()[1]
+        self.versions = set()
+        self.message = bytearray()
+        self.error = None
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def answer(self, addr, conn_id, ack_num, fin = False):
+        layout = old_layouts.get(EXTENDED_HEADER)
+        header = bytearray(layout.length)
+        layout.pack(header, "version", EXTENDED_HEADER)
+        layout.pack(header, "ack", 1)
+        layout.pack(header, "fin", 1 if fin else 0)
+        layout.pack(header, "conn_id", conn_id)
+        layout.pack(header, "window", 256)
+        layout.pack(header, "ack_num", ack_num)
+        self.socket.sendto(bytes(header), addr)
+
+    def run(self):
+        random_number = None
+        segments = {}
+        length = None
+        try:
+            while True:
+                data, addr = self.socket.recvfrom(ReliableUDP.BUFFER_SIZE)
+                layout = old_layouts.detect(data)
+                self.versions.add(layout.version)
+                get = lambda name: layout.unpack(data, name)
+                if get("ack") == 1:
+                    if length is not None and get("ack_num") == 1:
+                        return
+                    continue
+                if get("syn") == 1:
+                    random_number = get("seq_num")
+                if random_number is None:
+                    continue
+                offset = unwrap(get("seq_num") - random_number, len(self.message))
+                segments[offset] = data[layout.length:]
+                if get("fin") == 1:
+                    length = offset + len(segments[offset])
+                while len(self.message) in segments and segments[len(self.message)]:
+                    self.message += segments.pop(len(self.message))
+                self.answer(addr, get("conn_id"), random_number + len(self.message))
+                if length is not None and len(self.message) == length:
+                    self.answer(addr, get("conn_id"), random_number + length, fin=True)
+        except ValueError as error:
+            # a layout it cannot parse ends the receiver, as it did in those builds
+            self.error = error
+        except OSError:
+            # closed, or nothing more to receive
+            pass
+
+    def close(self):
+        self.thread.join(5)
+        self.socket.close()
+
+
+class CompatibilityTest(unittest.TestCase):
+    def test_new_sender_reaches_old_receiver(self):
+        receiver = OldReceiver()
+        message = bytes(range(256)) * 400
+        sender = ReliableUDP(timeout=0.2).create()
+        try:
+            sender.send(message, LOOPBACK, receiver.port)
+        finally:
+            sender.socket.close()
+            receiver.close()
+        self.assertIsNone(receiver.error)
+        self.assertEqual(receiver.versions, {EXTENDED_HEADER})
+        self.assertEqual(bytes(receiver.message), message)
+
+    def test_largest_segments_reach_old_receiver(self):
+        # segments stay within the half of the 16 bit sequence space that old receivers can acknowledge
+        receiver = OldReceiver()
+        message = bytes(range(256)) * 1000
+        sender = ReliableUDP(timeout=0.2, segment_size=MAX_SEGMENT_SIZE).create()
+        try:
+            sender.send(message, LOOPBACK, receiver.port)
+        finally:
+            sender.socket.close()
+            receiver.close()
+        self.assertIsNone(receiver.error)
+        self.assertEqual(bytes(receiver.message), message)
+
+    def test_old_receiver_refuses_persistent_connection(self):
+        receiver = OldReceiver()
+        sender = ReliableUDP(timeout=0.2).create()
+        try:
+            with self.assertRaises(ConnectionError):
+                sender.connect(LOOPBACK, receiver.port)
+        finally:
+            sender.socket.close()
+            receiver.socket.close()
+        self.assertIsNone(receiver.error)
+        self.assertEqual(receiver.versions, {EXTENDED_HEADER})
+
+    def test_wide_layouts_follow_the_confirming_ack(self):
+        sent = []
+        sender = Sender(SendBuffer(b"x" * 5000), 1000, sent.append, RTTEstimator(), create_congestion_control("none"), 2)
+        sender.poll()
+        first = [Packet(data) for data in sent]
+        self.assertEqual([packet.layout.version for packet in first], [EXTENDED_HEADER, EXTENDED_HEADER])
+        self.assertTrue(all(packet.get("wide") == 1 for packet in first))
+
+        ack = Packet(version=WIDE_HEADER).set("ack", 1).set("conn_id", sender.conn_id).set("window", 256)
+        ack.set_wide("ack_num", sender.random_number + 1000)
+        sent.clear()
+        self.assertTrue(sender.on_ack(ack))
+        sender.poll()
+        self.assertTrue(sender.is_wide)
+        self.assertEqual({Packet(data).layout.version for data in sent}, {WIDE_HEADER})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import math
+import unittest
+
+from utils.congestion import CongestionControl, Reno, Vegas, create_congestion_control
+
+
+class RenoTest(unittest.TestCase):
+    def test_slow_start_then_congestion_avoidance(self):
+        reno = Reno()
+        reno.ssthresh = 8
+        reno.on_ack(2, 0.1)
+        reno.on_ack(4, 0.1)
+        self.assertEqual(reno.cwnd, 8)
+        # about one segment per window of ACKs
+        reno.on_ack(8, 0.1)
+        self.assertAlmostEqual(reno.cwnd, 9)
+
+    def test_loss_halves_the_window(self):
+        reno = Reno()
+        reno.cwnd = 10
+        reno.on_loss()
+        self.assertEqual((reno.cwnd, reno.ssthresh), (5, 5))
+
+    def test_timeout_restarts_slow_start(self):
+        reno = Reno()
+        reno.cwnd = 10
+        reno.on_timeout()
+        self.assertEqual((reno.cwnd, reno.ssthresh), (1, 5))
+        reno.on_ack(1, None)
+        self.assertEqual(reno.cwnd, 2)
+
+    def test_ssthresh_floor(self):
+        reno = Reno()
+        reno.cwnd = 1
+        reno.on_loss()
+        self.assertEqual(reno.ssthresh, Reno.MIN_SSTHRESH)
+
+    def test_reset(self):
+        reno = Reno()
+        reno.on_ack(10, 0.1)
+        reno.on_timeout()
+        reno.reset()
+        self.assertEqual((reno.cwnd, reno.ssthresh), (Reno.INITIAL_WINDOW, math.inf))
+
+
+class VegasTest(unittest.TestCase):
+    def avoiding(self, cwnd):
+        vegas = Vegas()
+        vegas.cwnd = cwnd
+        vegas.ssthresh = 1
+        vegas.on_ack(1, 0.1)
+        return vegas
+
+    def test_grows_while_nothing_queues(self):
+        vegas = self.avoiding(10)
+        vegas.on_ack(10, 0.1)
+        self.assertEqual(vegas.queued, 0)
+        self.assertAlmostEqual(vegas.cwnd, 10 + 1 / 10 + 10 / (10 + 1 / 10))
+
+    def test_holds_between_alpha_and_beta(self):
+        vegas = self.avoiding(10)
+        cwnd = vegas.cwnd
+        # a third longer than the base RTT: 2.5 segments queued
+        vegas.on_ack(10, 0.1 * 4 / 3)
+        self.assertAlmostEqual(vegas.queued, cwnd / 4)
+        self.assertEqual(vegas.cwnd, cwnd)
+
+    def test_shrinks_above_beta(self):
+        vegas = self.avoiding(10)
+        cwnd = vegas.cwnd
+        vegas.on_ack(10, 0.2)
+        self.assertGreater(vegas.queued, Vegas.BETA)
+        self.assertAlmostEqual(vegas.cwnd, cwnd - 10 / cwnd)
+
+    def test_leaves_slow_start_once_queues_build(self):
+        vegas = Vegas()
+        vegas.on_ack(2, 0.1)
+        self.assertEqual(vegas.cwnd, 4)
+        vegas.on_ack(4, 0.2)
+        self.assertEqual((vegas.cwnd, vegas.ssthresh), (4, 4))
+
+    def test_falls_back_to_reno_without_a_sample(self):
+        vegas = Vegas()
+        vegas.on_ack(2, None)
+        self.assertEqual(vegas.cwnd, 4)
+        self.assertIsNone(vegas.base_rtt)
+
+
+class FactoryTest(unittest.TestCase):
+    def test_names(self):
+        self.assertIsInstance(create_congestion_control("vegas"), Vegas)
+        self.assertEqual(create_congestion_control("none").window(), 1 << 30)
+        self.assertIs(type(create_congestion_control("none")), CongestionControl)
+        with self.assertRaises(ValueError):
+            create_congestion_control("cubic")
+
+
+if __name__ == "__main__":
+    unittest.main()
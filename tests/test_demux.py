@@ -0,0 +1,95 @@
+import unittest
+
+from utils.congestion import create_congestion_control
+from utils.packet import EXTENDED_HEADER, Packet
+from utils.protocol import Receiver, Sender
+from utils.rtt import RTTEstimator
+from utils.stream import SendBuffer
+
+ADDR = ("127.0.0.1", 4000)
+OTHER = ("127.0.0.1", 4001)
+
+
+class Peer:
+    # a sender and the datagrams it put on the wire
+    def __init__(self, message: bytes, addr):
+        self.addr = addr
+        self.sent = []
+        self.sender = Sender(SendBuffer(message), 100, self.sent.append, RTTEstimator(), create_congestion_control("none"), 8)
+
+
+class DemuxTest(unittest.TestCase):
+    def setUp(self):
+        # acks go back to the peer of the address and connection id they carry
+        self.peers = []
+        self.receiver = Receiver(self.route)
+        self.completed = []
+
+    def route(self, data, addr):
+        packet = Packet(data)
+        for peer in self.peers:
+            if peer.addr == addr and peer.sender.conn_id == packet.get("conn_id"):
+                peer.sender.on_ack(packet)
+                if peer.sender.peer_fin is not None:
+                    peer.sender.acknowledge_fin()
+
+    def peer(self, message: bytes, addr = ADDR) -> Peer:
+        peer = Peer(message, addr)
+        self.peers.append(peer)
+        return peer
+
+    def deliver(self, peer: Peer, datagram: bytes):
+        packet = Packet(datagram)
+        if packet.get("ack") == 1:
+            self.receiver.on_ack(packet, peer.addr)
+            return
+        received = self.receiver.on_data(packet, peer.addr)
+        if received is None:
+            return
+        conn, offset = received
+        if self.receiver.acknowledge(conn, offset):
+            self.completed.append((conn.key, bytes(conn.take_message())))
+            self.receiver.send_fin(conn)
+
+    def run_interleaved(self, peers):
+        # one segment of each sender in turn, until every transfer is closed
+        for _ in range(100):
+            for peer in peers:
+                peer.sender.poll()
+            pending = [(peer, peer.sent.pop(0)) for peer in peers if peer.sent]
+            if not pending:
+                break
+            for peer, datagram in pending:
+                self.deliver(peer, datagram)
+
+    def test_senders_on_one_address_are_kept_apart(self):
+        first = self.peer(b"a" * 450)
+        second = self.peer(b"b" * 320)
+        self.run_interleaved([first, second])
+        self.assertEqual(sorted(message for _, message in self.completed), [b"a" * 450, b"b" * 320])
+        self.assertEqual({key for key, _ in self.completed}, {(ADDR, first.sender.conn_id), (ADDR, second.sender.conn_id)})
+        self.assertEqual(self.receiver.connections, {})
+
+    def test_same_connection_id_on_two_addresses(self):
+        first = self.peer(b"first" * 50)
+        second = self.peer(b"second" * 50, OTHER)
+        second.sender.conn_id = first.sender.conn_id
+        self.run_interleaved([first, second])
+        self.assertEqual(dict(self.completed), {(ADDR, first.sender.conn_id): b"first" * 50, (OTHER, first.sender.conn_id): b"second" * 50})
+
+    def test_retransmitted_syn_of_a_closed_transfer_is_ignored(self):
+        peer = self.peer(b"once")
+        peer.sender.poll()
+        syn = peer.sent[0]
+        self.run_interleaved([peer])
+        self.assertEqual(len(self.completed), 1)
+        self.assertIsNone(self.receiver.on_data(Packet(syn), ADDR))
+        self.assertEqual(self.receiver.connections, {})
+
+    def test_ack_of_an_unknown_connection_is_not_ours(self):
+        packet = Packet(version=EXTENDED_HEADER).set("ack", 1).set("conn_id", 12345).set("ack_num", 1)
+        self.assertFalse(self.receiver.on_ack(packet, ADDR))
+
+
+if __name__ == "__main__":
+    unittest.main()
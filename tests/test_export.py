@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import unittest
+from urllib.request import urlopen
+
+from utils.proxy.export import PREFIX, MetricsExporter, to_prometheus
+from utils.proxy.metrics import TrafficStats
+
+
+def snapshot() -> dict:
+    client, server = TrafficStats(), TrafficStats()
+    client.sent = 10
+    client.dropped = 2
+    client.record_latency(4)
+    client.record_latency(6)
+    server.queue_depth = 3
+    server.queue_dropped = 1
+    return {
+        "client": client.snapshot(),
+        "server": server.snapshot(),
+        "flows": 1,
+        "delayed": 5,
+    }
+
+
+def samples(text: str) -> dict:
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+class PrometheusTest(unittest.TestCase):
+    def test_series(self):
+        series = samples(to_prometheus(snapshot()))
+        self.assertEqual(series[f'{PREFIX}_datagrams_total{{side="client",event="sent"}}'], "10")
+        self.assertEqual(series[f'{PREFIX}_datagrams_total{{side="client",event="dropped"}}'], "2")
+        self.assertEqual(series[f'{PREFIX}_latency_milliseconds_count{{side="client"}}'], "2")
+        self.assertEqual(float(series[f'{PREFIX}_latency_milliseconds_sum{{side="client"}}']), 10)
+        self.assertEqual(series[f'{PREFIX}_queue_depth{{side="server"}}'], "3")
+        self.assertEqual(series[f'{PREFIX}_queue_dropped_total{{side="server"}}'], "1")
+        self.assertEqual(series[f"{PREFIX}_flows"], "1")
+        self.assertEqual(series[f"{PREFIX}_delayed"], "5")
+
+    def test_empty_quantiles_are_nan(self):
+        series = samples(to_prometheus(snapshot()))
+        self.assertEqual(series[f'{PREFIX}_latency_milliseconds{{side="server",quantile="0.5"}}'], "NaN")
+        self.assertEqual(series[f'{PREFIX}_latency_milliseconds_sum{{side="server"}}'], "0")
+
+    def test_families_are_typed_once(self):
+        types = [line.split()[2] for line in to_prometheus(snapshot()).splitlines() if line.startswith("# TYPE")]
+        self.assertEqual(len(types), len(set(types)))
+        self.assertTrue(all(name.startswith(PREFIX) for name in types))
+
+
+class MetricsExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_file_format_follows_the_extension(self):
+        path = os.path.join(self.directory.name, "metrics.json")
+        MetricsExporter(snapshot, path).write()
+        with open(path) as file:
+            self.assertEqual(json.load(file), snapshot())
+        path = os.path.join(self.directory.name, "metrics.prom")
+        MetricsExporter(snapshot, path).write()
+        with open(path) as file:
+            self.assertEqual(file.read(), to_prometheus(snapshot()))
+        # the temporary file is renamed over the target
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["metrics.json", "metrics.prom"])
+
+    def test_stop_writes_the_last_snapshot(self):
+        path = os.path.join(self.directory.name, "metrics.json")
+        exporter = MetricsExporter(snapshot, path, interval=60).start()
+        self.assertFalse(os.path.exists(path))
+        exporter.stop()
+        self.assertTrue(os.path.exists(path))
+
+    def test_http(self):
+        exporter = MetricsExporter(snapshot, port=0).start()
+        try:
+            host, port = exporter.server.server_address
+            with urlopen(f"http://{host}:{port}/metrics") as response:
+                self.assertEqual(response.read().decode(), to_prometheus(snapshot()))
+            with urlopen(f"http://{host}:{port}/metrics.json") as response:
+                self.assertEqual(json.load(response), snapshot())
+            with self.assertRaises(Exception):
+                urlopen(f"http://{host}:{port}/other")
+        finally:
+            exporter.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+from utils.fsm import FSM, FSMStats
+
+
+def counter(limit: int, actions = None):
+    # COUNT loops on itself with the count threaded through the actions, then exits with it
+    def count(value):
+        if actions is not None:
+            actions.append(value)
+        return ("COUNT", value + 1) if value < limit else (FSM.STATE.EXIT, value)
+
+    return FSM([
+        { "source": FSM.STATE.START, "dest": "COUNT", "action": count },
+        { "source": "COUNT", "dest": "COUNT", "action": count },
+        { "source": "COUNT", "dest": FSM.STATE.EXIT, "action": lambda value: value * 10 },
+    ], initial_state="COUNT")
+
+
+class FSMTest(unittest.TestCase):
+    def test_threads_arguments_and_returns_the_exit_result(self):
+        actions = []
+        fsm = counter(3, actions)
+        self.assertEqual(fsm.run(0), 30)
+        self.assertEqual(actions, [0, 1, 2, 3])
+        self.assertEqual(fsm.prev_state, FSM.STATE.EXIT)
+
+    def test_runs_again_from_the_initial_state(self):
+        fsm = counter(3)
+        self.assertEqual(fsm.run(0), 30)
+        self.assertEqual(fsm.run(2), 30)
+
+    def test_plain_state_results(self):
+        fsm = FSM([
+            { "source": FSM.STATE.START, "dest": "A", "action": lambda: "B" },
+            { "source": "A", "dest": "B", "action": lambda: FSM.STATE.EXIT },
+            { "source": "B", "dest": FSM.STATE.EXIT, "action": lambda: "done" },
+        ], initial_state="A")
+        self.assertEqual(fsm.run(), "done")
+
+    def test_undefined_transition(self):
+        fsm = FSM([
+            { "source": FSM.STATE.START, "dest": "A", "action": lambda: "B" },
+            { "source": "A", "dest": FSM.STATE.EXIT },
+        ], initial_state="A")
+        with self.assertRaises(Exception):
+            fsm.run()
+        self.assertEqual((fsm.prev_state, fsm.curret_state), ("A", "B"))
+
+    def test_table_is_validated(self):
+        start = { "source": FSM.STATE.START, "dest": "A" }
+        with self.assertRaises(ValueError):
+            FSM([start, { "source": "A" }], initial_state="A")
+        with self.assertRaises(ValueError):
+            FSM([start, { "source": "A", "dest": FSM.STATE.EXIT }, { "source": "A", "dest": FSM.STATE.EXIT }], initial_state="A")
+        with self.assertRaises(ValueError):
+            FSM([{ "source": "A", "dest": FSM.STATE.EXIT }], initial_state="A")
+        with self.assertRaises(ValueError):
+            # B is a dead end
+            FSM([start, { "source": "A", "dest": "B" }], initial_state="A")
+
+
+class HooksTest(unittest.TestCase):
+    def test_hooks_see_every_transition(self):
+        fsm = counter(2)
+        entered, exited = [], []
+        fsm.add_hook(lambda source, dest, now: entered.append((source, dest)), lambda source, dest, now: exited.append((source, dest)))
+        # hooks take the observed path, which has to give the same result as the fast one
+        self.assertEqual(fsm.run(0), 20)
+        expected = [(FSM.STATE.START, "COUNT"), ("COUNT", "COUNT"), ("COUNT", "COUNT"), ("COUNT", FSM.STATE.EXIT)]
+        self.assertEqual(entered, expected)
+        self.assertEqual(exited, expected)
+
+    def test_stats(self):
+        fsm = counter(2)
+        stats = FSMStats(max_samples=2).attach(fsm)
+        fsm.run(0)
+        fsm.run(0)
+        report = stats.report()
+        self.assertEqual(report["states"]["COUNT"]["count"], 6)
+        self.assertEqual(report["transitions"]["COUNT -> COUNT"]["count"], 4)
+        self.assertEqual(report["transitions"]["START -> COUNT"]["count"], 2)
+        self.assertEqual(report["states"]["EXIT"]["count"], 2)
+        self.assertEqual(len(stats.states["COUNT"][2]), 2)
+        self.assertIn("COUNT -> EXIT", str(stats))
+        stats.reset()
+        self.assertEqual(stats.report(), { "states": {}, "transitions": {} })
+
+
+if __name__ == "__main__":
+    unittest.main()
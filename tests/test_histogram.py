@@ -0,0 +1,58 @@
+import random
+import unittest
+
+from utils.proxy.metrics import LatencyHistogram, TrafficStats
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_buckets_are_contiguous(self):
+        # every value lands in the bucket whose bounds hold it
+        for value in list(range(0, 1000)) + [1 << 20, (1 << 30) + 12345]:
+            index = LatencyHistogram.index(value)
+            self.assertLessEqual(LatencyHistogram.value_at(index), value)
+            self.assertLess(value, LatencyHistogram.value_at(index + 1))
+
+    def test_relative_error(self):
+        for value in (200, 5000, 123456, 10 ** 8):
+            index = LatencyHistogram.index(value)
+            width = LatencyHistogram.value_at(index + 1) - LatencyHistogram.value_at(index)
+            self.assertLessEqual(width / value, 1 / 64)
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        values = list(range(1, 1001))
+        random.Random(1).shuffle(values)
+        for milliseconds in values:
+            histogram.record(milliseconds)
+        for q, expected in zip(LatencyHistogram.PERCENTILES, (500, 900, 990)):
+            self.assertAlmostEqual(histogram.percentile(q), expected, delta=expected / 64)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 1000)
+        self.assertAlmostEqual(summary["mean"], 500.5)
+        self.assertEqual(summary["max"], 1000)
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.05)
+        self.assertEqual(histogram.percentile(0.5), 0.05)
+
+    def test_never_past_the_maximum(self):
+        histogram = LatencyHistogram()
+        histogram.record(1234.5)
+        self.assertLessEqual(histogram.percentile(0.99), 1234.5)
+
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().summary(), { "count": 0, "mean": None, "p50": None, "p90": None, "p99": None, "max": None })
+
+
+class TrafficStatsTest(unittest.TestCase):
+    def test_recent_latencies_are_bounded(self):
+        stats = TrafficStats(recent=3)
+        for milliseconds in range(10):
+            stats.record_latency(milliseconds)
+        self.assertEqual(list(stats.latency), [7, 8, 9])
+        self.assertEqual(stats.snapshot()["latency"]["count"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
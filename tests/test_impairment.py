@@ -0,0 +1,89 @@
+import random
+import unittest
+
+from utils.proxy.impairment import MODELS, Decision, Impairment, create_impairment_model
+
+
+def draw(impairment: Impairment, count: int, drop = 0, delay = 0, delay_time = (0, 0)):
+    return [vars(impairment.decide(drop, delay, delay_time)) for _ in range(count)]
+
+
+class ModelsTest(unittest.TestCase):
+    def test_create(self):
+        for name, model in MODELS.items():
+            self.assertIsInstance(create_impairment_model(name, random.Random()), model)
+        with self.assertRaises(ValueError):
+            create_impairment_model("corrupt", random.Random())
+
+    def test_burst_loss(self):
+        # p = 100 moves the channel to bad on the first datagram, r = 0 keeps it there
+        impairment = Impairment({ "loss": (100, 0, 0, 100) }, seed=1)
+        self.assertEqual({ decision["drop"] for decision in draw(impairment, 20) }, { "loss" })
+        impairment = Impairment({ "loss": (0, 100, 0, 100) }, seed=1)
+        self.assertEqual({ decision["drop"] for decision in draw(impairment, 20) }, { None })
+
+    def test_dropped_datagrams_are_not_delayed_or_duplicated(self):
+        impairment = Impairment({ "duplicate": 100, "jitter": ("normal", 50, 0) }, seed=1)
+        for decision in draw(impairment, 10, drop=100, delay=100, delay_time=(10, 20)):
+            self.assertEqual((decision["drop"], decision["delay"], decision["duplicate"]), ("drop", 0.0, False))
+
+    def test_delay_and_jitter_add_up(self):
+        impairment = Impairment({ "jitter": ("normal", 50, 0) }, seed=1)
+        for decision in draw(impairment, 10, delay=100, delay_time=(10, 20)):
+            self.assertTrue(60 <= decision["delay"] <= 70)
+
+    def test_reorder(self):
+        impairment = Impairment({ "reorder": (100, 3) }, seed=1)
+        self.assertEqual({ decision["hold"] for decision in draw(impairment, 10) }, { 3 })
+
+
+class ImpairmentTest(unittest.TestCase):
+    CONFIG = { "loss": (5, 50, 1, 50), "jitter": ("pareto", 5, 2), "duplicate": 10, "reorder": (10, 2) }
+
+    def test_seeded_runs_repeat(self):
+        first = draw(Impairment(self.CONFIG, seed=7, name="client"), 500, drop=10, delay=20, delay_time=(5, 50))
+        second = draw(Impairment(self.CONFIG, seed=7, name="client"), 500, drop=10, delay=20, delay_time=(5, 50))
+        self.assertEqual(first, second)
+        # each direction draws its own
+        other = draw(Impairment(self.CONFIG, seed=7, name="server"), 500, drop=10, delay=20, delay_time=(5, 50))
+        self.assertNotEqual(first, other)
+
+    def test_models_draw_independently(self):
+        # turning jitter on leaves the drops of the same seed as they were
+        plain = draw(Impairment({}, seed=3), 500, drop=30)
+        jittered = draw(Impairment({ "jitter": ("normal", 10, 5) }, seed=3), 500, drop=30)
+        self.assertEqual([decision["drop"] for decision in plain], [decision["drop"] for decision in jittered])
+
+    def test_schedule_is_replayed_then_drawn(self):
+        scheduled = Decision(1, drop="loss")
+        impairment = Impairment({}, seed=1, schedule={ 1: scheduled })
+        decisions = [impairment.decide(0, 0, (0, 0)) for _ in range(3)]
+        self.assertIs(decisions[1], scheduled)
+        self.assertEqual([decision.seq for decision in decisions], [0, 1, 2])
+        self.assertIsNone(decisions[2].drop)
+
+    def test_held_datagrams(self):
+        impairment = Impairment({})
+        sent = []
+        impairment.hold(2, lambda: sent.append("a"), 0.0)
+        impairment.hold(1, lambda: sent.append("b"), 0.05)
+        self.assertEqual(impairment.next_deadline(), Impairment.REORDER_TIMEOUT)
+        for send in impairment.passed():
+            send()
+        self.assertEqual(sent, ["b"])
+        for send in impairment.passed():
+            send()
+        self.assertEqual(sent, ["b", "a"])
+        self.assertIsNone(impairment.next_deadline())
+
+    def test_held_datagrams_time_out(self):
+        impairment = Impairment({})
+        impairment.hold(5, lambda: "a", 0.0)
+        impairment.hold(5, lambda: "b", 1.0)
+        self.assertEqual([send() for send in impairment.expired(Impairment.REORDER_TIMEOUT)], ["a"])
+        self.assertEqual(impairment.expired(0.5), [])
+        self.assertEqual(len(impairment.held), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
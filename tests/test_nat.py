@@ -0,0 +1,60 @@
+import unittest
+from selectors import DefaultSelector
+from unittest import mock
+
+from utils.proxy.nat import NATTable
+
+SERVER = ("127.0.0.1", 5000)
+CLIENT = ("10.0.0.1", 4000)
+
+
+class NATTableTest(unittest.TestCase):
+    def setUp(self):
+        self.selector = DefaultSelector()
+        self.nat = NATTable(self.selector, SERVER, [
+            ("10.0.0.1", None, { "client": { "drop": 50 } }),
+            ("10.0.0.1", 4001, { "server": { "delay": 100 } }),
+        ], idle_timeout=10)
+
+    def tearDown(self):
+        self.nat.close_all()
+        self.selector.close()
+
+    def test_a_flow_per_client(self):
+        flow = self.nat.flow(CLIENT)
+        self.assertIs(self.nat.flow(CLIENT), flow)
+        other = self.nat.flow(("10.0.0.2", 4000))
+        self.assertIsNot(other, flow)
+        # each flow talks to the server from a port of its own
+        self.assertNotEqual(flow.upstream.getsockname(), other.upstream.getsockname())
+        self.assertEqual(flow.upstream.getpeername(), SERVER)
+        self.assertIs(self.selector.get_key(flow.upstream).data, flow)
+
+    def test_rules_match_address_and_port(self):
+        self.assertEqual(self.nat.flow(CLIENT).config, { "client": { "drop": 50 }, "server": {} })
+        self.assertEqual(self.nat.flow(("10.0.0.1", 4001)).config, { "client": { "drop": 50 }, "server": { "delay": 100 } })
+        self.assertEqual(self.nat.flow(("10.0.0.2", 4001)).config, { "client": {}, "server": {} })
+
+    def test_idle_flows_expire(self):
+        with mock.patch("utils.proxy.nat.monotonic", return_value=100.0):
+            idle = self.nat.flow(CLIENT)
+            busy = self.nat.flow(("10.0.0.2", 4000))
+        with mock.patch("utils.proxy.nat.monotonic", return_value=108.0):
+            self.nat.flow(("10.0.0.2", 4000))
+        self.nat.next_sweep = 0
+        with mock.patch("utils.proxy.nat.monotonic", return_value=111.0):
+            self.nat.expire()
+        self.assertEqual(list(self.nat.flows), [("10.0.0.2", 4000)])
+        self.assertEqual(idle.upstream.fileno(), -1)
+        self.assertIs(self.nat.flows[("10.0.0.2", 4000)], busy)
+
+    def test_sweeps_are_rate_limited(self):
+        self.nat.flow(CLIENT)
+        self.nat.next_sweep = float("inf")
+        with mock.patch("utils.proxy.nat.monotonic", return_value=10 ** 6):
+            self.nat.expire()
+        self.assertIn(CLIENT, self.nat.flows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from utils.packet import EXTENDED_HEADER, MESSAGE_HEADER, SACK_HEADER, WIDE_HEADER, Packet, custom_header, field_labels, layouts
+from utils.schema import HeaderLayout, LayoutRegistry
+from utils.wireshark import DISSECTOR_PATH, DISSECTOR_PORTS
+
+
+class HeaderLayoutTest(unittest.TestCase):
+    def test_fields_round_trip(self):
+        # whole bytes, bit fields inside one byte and a field that spans two bytes at a bit offset
+        layout = HeaderLayout({ "a": 2, "b": 1/8, "c": 3/8, "d": 12/8, "e": 4 })
+        self.assertEqual(layout.length, 2 + 1 + 1 + 4)
+        values = { "a": 0xBEEF, "b": 1, "c": 5, "d": 0xABC, "e": 0xDEADBEEF }
+        header = bytearray(layout.length)
+        for name, value in values.items():
+            layout.pack(header, name, value)
+        for name, value in values.items():
+            self.assertEqual(layout.unpack(header, name), value)
+
+    def test_values_are_masked_to_their_field(self):
+        layout = HeaderLayout({ "flag": 1/8, "rest": 7/8 })
+        header = bytearray(layout.length)
+        layout.pack(header, "rest", 0x7F)
+        layout.pack(header, "flag", 3)
+        self.assertEqual(layout.unpack(header, "flag"), 1)
+        self.assertEqual(layout.unpack(header, "rest"), 0x7F)
+
+    def test_unknown_field(self):
+        layout = HeaderLayout(custom_header)
+        with self.assertRaises(ValueError):
+            layout.unpack(bytearray(layout.length), "missing")
+
+    def test_packet_matches_the_bit_string_layout(self):
+        # the field order and widths of the original header, read back from the bytes on the wire
+        packet = Packet().set("seq_num", 0x1234).set("ack_num", 0x5678).set("syn", 1).set("fin", 1)
+        self.assertEqual(packet.to_byte(), bytes([0x12, 0x34, 0x56, 0x78, 0b10100000]))
+        self.assertEqual(packet.get_header_field("seq_num"), "1234")
+        self.assertEqual(packet.get_header_field("syn", 2), "1")
+        self.assertEqual(Packet(packet.to_byte()), packet)
+
+
+class LayoutRegistryTest(unittest.TestCase):
+    def test_detects_the_layout_from_the_version(self):
+        for version in (0, EXTENDED_HEADER, SACK_HEADER, WIDE_HEADER, MESSAGE_HEADER):
+            packet = Packet(version=version).set("seq_num", 7)
+            packet.set_payload(b"payload")
+            parsed = Packet(packet.to_byte())
+            self.assertEqual(parsed.layout.version, version)
+            self.assertEqual(parsed.get("seq_num"), 7)
+            self.assertEqual(parsed.payload, b"payload")
+
+    def test_unknown_version(self):
+        header = bytearray(layouts.base.length)
+        layouts.base.pack(header, "version", 31)
+        with self.assertRaises(ValueError):
+            Packet(bytes(header))
+
+    def test_short_datagram_reads_as_the_base_layout(self):
+        self.assertEqual(layouts.detect(b"\x00\x01").version, 0)
+
+    def test_register_rejects_clashes(self):
+        registry = LayoutRegistry(custom_header, "version")
+        registry.register(1, { "extra": 1 })
+        with self.assertRaises(ValueError):
+            registry.register(1, { "other": 1 })
+        with self.assertRaises(ValueError):
+            registry.register(2, { "seq_num": 2 })
+        with self.assertRaises(ValueError):
+            registry.register(32, { "extra": 1 })
+
+    def test_wide_fields_join_their_upper_half(self):
+        packet = Packet(version=WIDE_HEADER).set_wide("seq_num", 0x12345678)
+        self.assertEqual(packet.get("seq_num"), 0x5678)
+        self.assertEqual(Packet(packet.to_byte()).get_wide("seq_num"), 0x12345678)
+        # the 16 bit layouts keep only the lower half
+        self.assertEqual(Packet(version=EXTENDED_HEADER).set_wide("seq_num", 0x12345678).get_wide("seq_num"), 0x5678)
+
+    def test_batch_round_trip(self):
+        packet = Packet(version=MESSAGE_HEADER).set_batch(b"onetwothree", [3, 6, 11])
+        self.assertEqual(Packet(packet.to_byte()).get_batch(), ([3, 6, 11], b"onetwothree"))
+        plain = Packet(version=MESSAGE_HEADER)
+        plain.set_payload(b"plain")
+        self.assertEqual(Packet(plain.to_byte()).get_batch(), ([], b"plain"))
+
+    def test_dissector_is_up_to_date(self):
+        # regenerate with python -m utils.wireshark
+        with open(DISSECTOR_PATH) as file:
+            self.assertEqual(file.read(), layouts.generate_dissector(field_labels, DISSECTOR_PORTS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from threading import Thread
+from time import sleep
+from unittest import mock
+
+from utils.reliableUDP import ReliableUDP
+
+LOOPBACK = "127.0.0.1"
+
+
+class Server:
+    def __init__(self):
+        self.endpoint = ReliableUDP().create()
+        self.endpoint.bind(LOOPBACK, 0)
+        self.port = self.endpoint.socket.getsockname()[1]
+        self.messages = []
+        self.muted = False
+        send = self.endpoint.receiver.send
+        self.endpoint.receiver.send = lambda data, addr: None if self.muted else send(data, addr)
+        Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        try:
+            while True:
+                self.messages.append(self.endpoint.recv())
+        except OSError:
+            pass
+
+    def received(self, count):
+        for _ in range(100):
+            if len(self.messages) >= count:
+                break
+            sleep(0.01)
+        return self.messages
+
+
+class PersistentConnectionTest(unittest.TestCase):
+    def test_empty_messages(self):
+        for batch_delay in (None, 0.05):
+            server = Server()
+            client = ReliableUDP(timeout=0.1, batch_delay=batch_delay).create().connect(LOOPBACK, server.port)
+            try:
+                for message in ("", "one", "", "", "two", ""):
+                    client.send(message)
+                client.flush()
+                self.assertEqual(server.received(6), ["", "one", "", "", "two", ""])
+            finally:
+                client.close()
+                server.endpoint.socket.close()
+
+    @mock.patch("utils.protocol.REOPEN_AFTER", 0.2)
+    @mock.patch("utils.protocol.IDLE_TIMEOUT", 0.4)
+    def test_idle_connection_reopens(self):
+        server = Server()
+        client = ReliableUDP(timeout=0.1).create().connect(LOOPBACK, server.port)
+        try:
+            client.send("before")
+            # long enough for the receiver's sweep to drop the connection
+            sleep(1.6)
+            client.send("after")
+            self.assertEqual(server.received(2), ["before", "after"])
+        finally:
+            client.close()
+            server.endpoint.socket.close()
+
+    @mock.patch("utils.protocol.RETRIES", 3)
+    def test_lost_connection_keeps_messages(self):
+        server = Server()
+        client = ReliableUDP(timeout=0.05, segment_size=100).create().connect(LOOPBACK, server.port)
+        try:
+            client.send("first")
+            server.muted = True
+            with self.assertRaises(ConnectionError):
+                client.send("x" * 1000)
+            server.muted = False
+            client.send("last")
+            self.assertEqual(server.received(3), ["first", "x" * 1000, "last"])
+        finally:
+            client.close()
+            server.endpoint.socket.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from proxy import Proxy
+from utils.packet import EXTENDED_HEADER, WIDE_HEADER, Packet
+
+LOOPBACK = "127.0.0.1"
+
+
+def segment(seq_num: int, version = WIDE_HEADER, syn = 0, timestamp = 1, conn_id = 9) -> bytes:
+    packet = Packet(version=version).set("conn_id", conn_id).set("syn", syn).set("timestamp", timestamp)
+    packet.set_wide("seq_num", seq_num)
+    packet.set_payload(b"x" * 10)
+    return packet.to_byte()
+
+
+class RetransmissionCountTest(unittest.TestCase):
+    def setUp(self):
+        self.proxy = Proxy(LOOPBACK, 0, LOOPBACK, 0, 0, 0, (0, 0), 0, 0, (0, 0), memory=3)
+        self.proxy.stop()
+
+    def record(self, *datagrams, from_server = False):
+        for data in datagrams:
+            self.proxy.record_packet(from_server, data, False, 0.0)
+        return self.proxy.live_stats["server" if from_server else "client"].retransmitted
+
+    def test_resends_are_counted(self):
+        self.assertEqual(self.record(segment(100), segment(110), segment(100, timestamp=2)), 1)
+        # ACKs and datagrams of unknown layouts are compared on their bytes
+        self.assertEqual(self.record(b"\x00" * 5, b"\x00" * 5, from_server=True), 1)
+
+    def test_least_recently_seen_are_forgotten(self):
+        self.assertEqual(self.record(segment(100), segment(110), segment(120), segment(130), segment(100)), 0)
+        self.assertEqual(len(self.proxy.packets), 3)
+
+    def test_a_resend_refreshes_its_entry(self):
+        self.assertEqual(self.record(segment(100), segment(110), segment(120), segment(100), segment(130), segment(100)), 2)
+
+    def test_resend_on_the_wide_layout(self):
+        # the first segments go out on the 16 bit layout before the receiver accepted 32 bit sequence numbers
+        isn = 65530
+        first = [segment(isn, EXTENDED_HEADER, syn=1), segment((isn + 10) % 65536, EXTENDED_HEADER)]
+        resent = [segment(isn + 10), segment(isn, syn=1)]
+        self.assertEqual(self.record(*first, *resent), 2)
+        self.assertEqual(self.record(segment(isn + 20)), 2)
+
+    def test_connections_are_kept_apart(self):
+        self.assertEqual(self.record(segment(100, conn_id=1), segment(100, conn_id=2)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
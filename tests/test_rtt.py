@@ -0,0 +1,132 @@
+import unittest
+
+from utils.congestion import create_congestion_control
+from utils.packet import EXTENDED_HEADER, Packet
+from utils.protocol import RETRIES, Sender
+from utils.rtt import RTTEstimator
+from utils.stream import SendBuffer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def ack(sender: Sender, acked: int, timestamp = 0) -> Packet:
+    # what a receiver answers, timestamp 0 is what builds without timestamps echo
+    packet = Packet(version=EXTENDED_HEADER).set("ack", 1).set("conn_id", sender.conn_id).set("window", 8)
+    packet.set("timestamp", timestamp)
+    return packet.set_wide("ack_num", sender.random_number + acked)
+
+
+class RTTEstimatorTest(unittest.TestCase):
+    def test_smoothing(self):
+        # RFC 6298: the first sample sets srtt and half of it as rttvar, later ones are averaged in
+        rtt = RTTEstimator()
+        rtt.sample(0.1)
+        self.assertAlmostEqual(rtt.srtt, 0.1)
+        self.assertAlmostEqual(rtt.rto, 0.1 + 4 * 0.05)
+        rtt.sample(0.2)
+        self.assertAlmostEqual(rtt.rttvar, 0.75 * 0.05 + 0.25 * 0.1)
+        self.assertAlmostEqual(rtt.srtt, 0.875 * 0.1 + 0.125 * 0.2)
+        self.assertAlmostEqual(rtt.rto, rtt.srtt + 4 * rtt.rttvar)
+
+    def test_clamping(self):
+        rtt = RTTEstimator(min_rto=0.05, max_rto=2)
+        rtt.sample(0.001)
+        self.assertEqual(rtt.rto, 0.05)
+        rtt.sample(10)
+        self.assertEqual(rtt.rto, 2)
+
+    def test_backoff(self):
+        rtt = RTTEstimator(initial_rto=1, max_rto=5)
+        for expected in (2, 4, 5, 5):
+            rtt.backoff()
+            self.assertEqual(rtt.rto, expected)
+        self.assertEqual(rtt.backoffs, 4)
+        # without a sample the timeout falls back to where it started
+        rtt.restore()
+        self.assertEqual((rtt.rto, rtt.backoffs), (1, 0))
+
+    def test_sample_ends_backoff(self):
+        rtt = RTTEstimator()
+        rtt.sample(0.1)
+        rtt.backoff()
+        rtt.backoff()
+        rtt.sample(0.1)
+        self.assertEqual(rtt.backoffs, 0)
+        self.assertLess(rtt.rto, 1)
+
+
+class SenderTimingTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.sent = []
+        self.sender = Sender(
+            SendBuffer(b"x" * 10), 100, self.sent.append, RTTEstimator(initial_rto=1),
+            create_congestion_control("reno"), 8, clock=self.clock,
+        )
+
+    def timestamp(self, datagram: bytes) -> int:
+        return Packet(datagram).get("timestamp")
+
+    def test_clean_segment_is_sampled(self):
+        self.sender.poll()
+        self.clock.now = 0.3
+        self.assertTrue(self.sender.on_ack(ack(self.sender, 10)))
+        self.assertEqual(list(self.sender.rtt.samples), [0.3])
+
+    def test_karn_rule_without_timestamps(self):
+        # the ACK may answer either send, so it is not a sample, but the backoff still ends
+        self.sender.poll()
+        self.clock.now = 1.0
+        self.sender.poll()
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.sender.rtt.backoffs, 1)
+        self.clock.now = 1.2
+        self.sender.on_ack(ack(self.sender, 10))
+        self.assertEqual(list(self.sender.rtt.samples), [])
+        self.assertEqual((self.sender.rtt.rto, self.sender.rtt.backoffs), (1, 0))
+
+    def test_echoed_timestamp_times_the_retransmission(self):
+        self.sender.poll()
+        self.clock.now = 1.0
+        self.sender.poll()
+        self.assertNotEqual(self.timestamp(self.sent[0]), self.timestamp(self.sent[1]))
+        self.clock.now = 1.2
+        self.sender.on_ack(ack(self.sender, 10, self.timestamp(self.sent[1])))
+        self.assertEqual(len(self.sender.rtt.samples), 1)
+        self.assertAlmostEqual(self.sender.rtt.samples[0], 0.2)
+
+    def test_gives_up_after_retries_initial_timeouts(self):
+        # backoff alone would wait RETRIES timeouts of up to MAX_RTO each
+        self.sender.poll()
+        while self.sender.poll():
+            self.clock.now = self.sender.deadline()
+        # the first timeout at 1 second, then RETRIES seconds without an answer
+        self.assertAlmostEqual(self.clock.now, 1 + RETRIES)
+        self.assertIn("0 bytes delivered", self.sender.abort_reason)
+
+    def test_an_answer_restarts_the_budget(self):
+        sender = Sender(
+            SendBuffer(b"x" * 300), 100, self.sent.append, RTTEstimator(initial_rto=1),
+            create_congestion_control("none"), 1, clock=self.clock,
+        )
+        sender.poll()
+        self.clock.now = 1.0
+        sender.poll()
+        self.assertEqual(sender.stalled_since, 1)
+        self.clock.now = RETRIES
+        sender.on_ack(ack(sender, 100))
+        self.assertIsNone(sender.stalled_since)
+        # past the budget counted from the first timeout, but the next segment only just timed out
+        self.clock.now = RETRIES + 2
+        self.assertTrue(sender.poll())
+        self.assertIsNone(sender.abort_reason)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from utils.congestion import create_congestion_control
+from utils.packet import Packet
+from utils.protocol import Receiver, Sender
+from utils.rtt import RTTEstimator
+from utils.sequence import SEQ_MODULO
+from utils.stream import SendBuffer
+
+ADDR = ("127.0.0.1", 4000)
+SEGMENT = 100
+
+
+class SackTest(unittest.TestCase):
+    def setUp(self):
+        self.message = bytes(range(200)) * 3
+        self.sent = []
+        self.acks = []
+        self.sender = Sender(
+            SendBuffer(self.message), SEGMENT, self.sent.append, RTTEstimator(),
+            create_congestion_control("none"), 8,
+        )
+        self.receiver = Receiver(lambda data, addr: self.acks.append(data))
+
+    def offset(self, datagram: bytes) -> int:
+        return (Packet(datagram).get("seq_num") - self.sender.random_number) % SEQ_MODULO
+
+    def deliver(self, datagram: bytes):
+        # the segment reaches the receiver and its ACK the sender
+        received = self.receiver.on_data(Packet(datagram), ADDR)
+        self.assertIsNotNone(received)
+        self.receiver.acknowledge(*received)
+        self.sender.on_ack(Packet(self.acks[-1]))
+        return received[0]
+
+    def test_only_the_gap_is_retransmitted(self):
+        self.sender.poll()
+        self.assertEqual([self.offset(datagram) for datagram in self.sent], [0, 100, 200, 300, 400, 500])
+        first_flight = self.sent[:]
+        for datagram in first_flight[:1] + first_flight[2:]:
+            conn = self.deliver(datagram)
+        self.assertEqual(Packet(self.acks[-1]).get("sack_count"), 1)
+        self.assertEqual(self.sender.retransmit_queue, [100])
+
+        self.sender.poll()
+        retransmitted = self.sent[len(first_flight):]
+        self.assertEqual([self.offset(datagram) for datagram in retransmitted], [100])
+        self.deliver(retransmitted[0])
+        self.assertTrue(self.sender.delivered)
+        self.assertEqual(bytes(conn.take_message()), self.message)
+
+    def test_sacked_segments_do_not_time_out(self):
+        self.sender.poll()
+        first_flight = self.sent[:]
+        for datagram in first_flight[:1] + first_flight[2:]:
+            self.deliver(datagram)
+        self.assertEqual([offset for offset, segment in self.sender.in_flight.items() if segment[4]], [200, 300, 400, 500])
+        self.assertEqual([offset for offset, segment in self.sender.in_flight.items() if not segment[4]], [100])
+
+    def test_blocks_merge_and_the_latest_goes_first(self):
+        self.sender.poll()
+        for index in (0, 2, 3, 5):
+            conn = self.deliver(self.sent[index])
+        ack = Packet(self.acks[-1])
+        blocks = [
+            ((ack.get(f"sack_{i}_start") - conn.random_number) % SEQ_MODULO, (ack.get(f"sack_{i}_end") - conn.random_number) % SEQ_MODULO)
+            for i in range(1, ack.get("sack_count") + 1)
+        ]
+        self.assertEqual(blocks, [(500, 600), (200, 400)])
+        self.assertEqual(conn.sack_blocks(250), [[200, 400], [500, 600]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from threading import Event, Thread
+from time import monotonic
+
+from utils.proxy.scheduler import DelayScheduler
+
+
+class DelaySchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DelayScheduler()
+        self.thread = Thread(target=self.scheduler.run, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.thread.join(1)
+
+    def test_releases_in_order_of_release_time(self):
+        released = []
+        done = Event()
+        start = monotonic()
+
+        def release(name):
+            released.append((name, monotonic() - start))
+            if len(released) == 3:
+                done.set()
+
+        self.scheduler.schedule(0.15, release, "late")
+        self.scheduler.schedule(0.05, release, "early")
+        self.scheduler.schedule(0.1, release, "middle")
+        self.assertTrue(done.wait(2))
+        self.assertEqual([name for name, _ in released], ["early", "middle", "late"])
+        for (_, elapsed), delay in zip(released, (0.05, 0.1, 0.15)):
+            self.assertGreaterEqual(elapsed, delay)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_equal_release_times_keep_arrival_order(self):
+        released = []
+        done = Event()
+        for i in range(5):
+            self.scheduler.schedule(0, lambda i=i: (released.append(i), len(released) == 5 and done.set()))
+        self.assertTrue(done.wait(2))
+        self.assertEqual(released, list(range(5)))
+
+    def test_stop_ends_the_thread(self):
+        self.scheduler.schedule(60, lambda: None)
+        self.scheduler.stop()
+        self.thread.join(1)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_stop_before_run(self):
+        scheduler = DelayScheduler()
+        scheduler.stop()
+        thread = Thread(target=scheduler.run, daemon=True)
+        thread.start()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
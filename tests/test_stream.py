@@ -0,0 +1,49 @@
+import unittest
+from socket import AF_INET, SOCK_DGRAM, socket
+from threading import Thread
+from unittest import mock
+
+from utils.packet import EXTENDED_HEADER, Packet
+from utils.reliableUDP import ReliableUDP
+
+LOOPBACK = "127.0.0.1"
+
+
+class RecvStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ReliableUDP().create()
+        self.server.bind(LOOPBACK, 0)
+        self.port = self.server.socket.getsockname()[1]
+
+    def tearDown(self):
+        self.server.socket.close()
+
+    def send(self, message):
+        client = ReliableUDP(timeout=0.1).create()
+        try:
+            client.send(message, LOOPBACK, self.port)
+        finally:
+            client.socket.close()
+
+    @mock.patch("utils.protocol.SWEEP_INTERVAL", 0.05)
+    @mock.patch("utils.protocol.IDLE_TIMEOUT", 0.2)
+    def test_sender_dying_mid_stream_does_not_block_the_next(self):
+        # the first segment of a longer message, and then nothing: the client died
+        dead = socket(AF_INET, SOCK_DGRAM)
+        packet = Packet(version=EXTENDED_HEADER).set("syn", 1).set("conn_id", 7).set("wide", 1)
+        packet.set_wide("seq_num", 100).set_payload(b"partial")
+        dead.sendto(packet.to_byte(), (LOOPBACK, self.port))
+        dead.close()
+
+        chunks = []
+        with self.assertRaises(ConnectionError):
+            for chunk in self.server.recv_stream():
+                chunks.append(chunk)
+                # a second client comes along while the first is being streamed
+                Thread(target=self.send, args=("hello",), daemon=True).start()
+        self.assertEqual(chunks, [b"partial"])
+        self.assertEqual(b"".join(self.server.recv_stream()), b"hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
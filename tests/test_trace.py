@@ -0,0 +1,92 @@
+import os
+import socket
+import struct
+import tempfile
+import time
+import unittest
+
+from utils.proxy.impairment import Decision, Impairment
+from utils.proxy.trace import ENHANCED_PACKET, LINKTYPE_RAW, SECTION_HEADER, TraceWriter, checksum, read_schedule
+
+CLIENT = ("10.0.0.1", 4000)
+SERVER = ("10.0.0.2", 5000)
+
+
+def blocks(path: str):
+    with open(path, "rb") as file:
+        data = file.read()
+    offset = 0
+    while offset < len(data):
+        block_type, length = struct.unpack_from("<II", data, offset)
+        # the length is repeated at the end of every block
+        assert struct.unpack_from("<I", data, offset + length - 4)[0] == length
+        yield block_type, data[offset + 8:offset + length - 4]
+        offset += length
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "trace.pcapng")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pcapng(self):
+        writer = TraceWriter(self.path)
+        before = int(time.time() * 1_000_000)
+        writer.record("client", b"hello", CLIENT, SERVER, Decision(0), None, 0.0)
+        writer.close()
+        (section_type, section), (interface_type, interface), (packet_type, packet) = blocks(self.path)
+        self.assertEqual(section_type, SECTION_HEADER)
+        self.assertEqual(struct.unpack_from("<I", section)[0], 0x1A2B3C4D)
+        self.assertEqual(struct.unpack_from("<H", interface)[0], LINKTYPE_RAW)
+        self.assertEqual(packet_type, ENHANCED_PACKET)
+        _, high, low, captured, length = struct.unpack_from("<IIIII", packet)
+        self.assertLessEqual(before, (high << 32) | low)
+        self.assertLessEqual((high << 32) | low, int(time.time() * 1_000_000))
+        self.assertEqual((captured, length), (33, 33))
+        ip = packet[20:40]
+        self.assertEqual(checksum(ip), 0)
+        self.assertEqual((socket.inet_ntoa(ip[12:16]), socket.inet_ntoa(ip[16:20])), (CLIENT[0], SERVER[0]))
+        self.assertEqual(struct.unpack_from("!HHH", packet, 40), (CLIENT[1], SERVER[1], 13))
+        self.assertEqual(packet[48:53], b"hello")
+
+    def test_schedule_round_trip(self):
+        writer = TraceWriter(self.path)
+        writer.record("client", b"a", CLIENT, SERVER, Decision(0, delay=20.125, hold=2), None, 1.5)
+        writer.record("client", b"bb", CLIENT, SERVER, Decision(1, drop="loss"), "loss", 0.0)
+        writer.record("server", b"ccc", SERVER, CLIENT, Decision(0, duplicate=True), None, 0.0)
+        # the bottleneck decides queue drops again on replay
+        writer.record("server", b"dddd", SERVER, CLIENT, Decision(1), "queue", 0.0)
+        writer.close()
+        schedule = read_schedule(self.path)
+        self.assertEqual({ side: sorted(decisions) for side, decisions in schedule.items() }, { "client": [0, 1], "server": [0, 1] })
+        self.assertEqual((schedule["client"][0].delay, schedule["client"][0].hold), (20.125, 2))
+        self.assertEqual(schedule["client"][1].drop, "loss")
+        self.assertTrue(schedule["server"][0].duplicate)
+        self.assertIsNone(schedule["server"][1].drop)
+
+    def test_replay_repeats_a_run(self):
+        config = { "loss": (5, 50, 1, 50), "jitter": ("normal", 10, 5), "duplicate": 10, "reorder": (10, 2) }
+        impairment = Impairment(config, seed=3, name="client")
+        writer = TraceWriter(self.path)
+        recorded = []
+        for _ in range(200):
+            decision = impairment.decide(10, 20, (5, 50))
+            writer.record("client", b"x", CLIENT, SERVER, decision, decision.drop, 0.0)
+            recorded.append(decision)
+        writer.close()
+        # an unseeded run replaying the trace takes the same decisions, to the precision of the trace
+        replay = Impairment(config, name="client", schedule=read_schedule(self.path)["client"])
+        for decision in recorded:
+            replayed = replay.decide(0, 0, (0, 0))
+            self.assertEqual(
+                (replayed.seq, replayed.drop, replayed.duplicate, replayed.hold),
+                (decision.seq, decision.drop, decision.duplicate, decision.hold),
+            )
+            self.assertAlmostEqual(replayed.delay, decision.delay, delta=0.0005)
+
+
+if __name__ == "__main__":
+    unittest.main()
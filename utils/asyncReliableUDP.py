@@ -0,0 +1,320 @@
+import asyncio
+import ipaddress
+from random import getrandbits
+from socket import AF_INET, SO_RCVBUF, SOL_SOCKET
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+from utils.congestion import create_congestion_control
+from utils.packet import BATCH_LIMIT, MAX_SEGMENT_SIZE, Packet
+from utils.protocol import Receiver, Sender
+from utils.reliableUDP import ReliableUDP
+from utils.rtt import RTTEstimator
+from utils.stream import SendBuffer
+
+
+class Transfer:
+    # one outgoing message or persistent connection, its Sender driven by ACKs and loop timers instead of a blocking socket
+    def __init__(self, endpoint: "AsyncReliableUDP", source: SendBuffer, target, segment_size: int):
+        self.endpoint = endpoint
+        self.loop = endpoint.loop
+        self.target = target
+        self.sender = Sender(
+            source,
+            segment_size,
+            lambda data: endpoint.sendto(data, target),
+            RTTEstimator(initial_rto=endpoint.timeout),
+            create_congestion_control(endpoint.congestion_control),
+            endpoint.window_size,
+            clock=self.loop.time,
+        )
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.done = self.loop.create_future()
+        # (offset, future) of flush() calls waiting for the receiver to acknowledge up to offset
+        self.waiters: List[Tuple[int, asyncio.Future]] = []
+
+    @property
+    def conn_id(self) -> int:
+        return self.sender.conn_id
+
+    def poll(self):
+        # sends what the windows allow after an ACK, a timeout or an appended message
+        if self.done.done():
+            return
+        if not self.sender.poll():
+            return self.finish(self.sender.delivered)
+        self.arm()
+
+    def arm(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        # an idle persistent connection has nothing that could time out
+        if self.sender.in_flight:
+            self.timer = self.loop.call_at(self.sender.deadline(), self.on_timeout)
+
+    def on_timeout(self):
+        self.timer = None
+        self.poll()
+
+    def on_ack(self, packet: Packet):
+        if not self.sender.on_ack(packet):
+            return
+        for offset, future in [waiter for waiter in self.waiters if self.sender.is_acknowledged(waiter[0])]:
+            if not future.done():
+                future.set_result(True)
+        self.waiters = [waiter for waiter in self.waiters if not self.sender.is_acknowledged(waiter[0])]
+        if self.sender.peer_fin is not None:
+            self.sender.acknowledge_fin()
+            return self.finish(True)
+        self.poll()
+
+    def acknowledged(self, offset: int) -> asyncio.Future:
+        # resolves to True once the receiver holds everything up to offset, False if the transfer ends before
+        future = self.loop.create_future()
+        if self.sender.is_acknowledged(offset):
+            future.set_result(True)
+        elif self.done.done():
+            future.set_result(False)
+        else:
+            self.waiters.append((offset, future))
+            self.poll()
+        return future
+
+    def finish(self, result: bool):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.endpoint.transfers.pop(self.conn_id, None)
+        for offset, future in self.waiters:
+            if not future.done():
+                future.set_result(result and self.sender.is_acknowledged(offset))
+        self.waiters = []
+        if not self.done.done():
+            self.done.set_result(result)
+
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, endpoint: "AsyncReliableUDP"):
+        self.endpoint = endpoint
+
+    def datagram_received(self, data, addr):
+        self.endpoint.datagram_received(data, addr)
+
+
+class AsyncReliableUDP():
+    # same protocol as ReliableUDP, see utils/protocol.py, but every transfer is a set of loop callbacks, so one
+    # event loop drives any number of concurrent senders and receivers over a single socket
+    # bursts from thousands of transfers overflow the default socket buffer, the kernel caps this at net.core.rmem_max
+    RECEIVE_BUFFER = 1 << 22
+
+    def __init__(self, timeout=1, segment_size: Optional[int] = None, window_size = 8, congestion_control = "reno", batch_delay: Optional[float] = None, on_data: Optional[Callable] = None):
+        self.loop: asyncio.AbstractEventLoop
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        if segment_size is not None and not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise ValueError(f"Segment size {segment_size} does not fit a UDP datagram, expected 1 to {MAX_SEGMENT_SIZE} bytes")
+        self.timeout = timeout
+        self.segment_size = segment_size
+        self.window_size = window_size
+        self.congestion_control = congestion_control
+        # validate the algorithm name up front rather than on the first send
+        create_congestion_control(congestion_control)
+        # sender: connection id -> Transfer
+        self.transfers = {}
+        # sender: target -> segment size, so the path MTU is only looked up once per peer
+        self.segment_sizes = {}
+        # sender: address, open buffer and transfer of a persistent connection, see connect()
+        self.peer: Tuple[str, int] = ("", 0)
+        self.stream: Optional[SendBuffer] = None
+        self.connection: Optional[Transfer] = None
+        # sender: seconds a message on a persistent connection may wait to share a segment with the ones after it, None sends right away
+        self.batch_delay = batch_delay
+        self.batch_size = 0
+        self.batch_timer: Optional[asyncio.TimerHandle] = None
+        # receiver: every connection of the bound socket, woken up by one timer for FIN retransmissions and the idle sweep
+        self.receiver = Receiver(self.sendto, timeout)
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.messages: asyncio.Queue = asyncio.Queue()
+        # receiver: on_data(address, chunk, is_last) gets every message in order as it arrives, instead of recv()
+        self.on_data = on_data
+
+    async def create(self, ip = None, port = 0):
+        self.loop = asyncio.get_running_loop()
+        self.receiver.clock = self.loop.time
+        local_addr = (str(ipaddress.ip_address(ip)), port) if ip is not None else None
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: DatagramProtocol(self),
+            local_addr=local_addr,
+            family=AF_INET,
+        )
+        self.transport.get_extra_info("socket").setsockopt(SOL_SOCKET, SO_RCVBUF, AsyncReliableUDP.RECEIVE_BUFFER)
+        return self
+
+    def sendto(self, data: bytes, addr):
+        if self.transport is not None:
+            self.transport.sendto(data, addr)
+
+    def get_segment_size(self, target) -> int:
+        if self.segment_size:
+            return self.segment_size
+        if target not in self.segment_sizes:
+            self.segment_sizes[target] = ReliableUDP.path_segment_size(*target)
+        return self.segment_sizes[target]
+
+    def open_transfer(self, source: SendBuffer, target) -> Transfer:
+        transfer = Transfer(self, source, target, self.get_segment_size(target))
+        while transfer.conn_id in self.transfers:
+            transfer.sender.conn_id = getrandbits(32)
+        self.transfers[transfer.conn_id] = transfer
+        transfer.poll()
+        return transfer
+
+    async def connect(self, ip, port):
+        # one handshake for many messages, each send() then costs a single round trip until disconnect()
+        self.peer = (str(ipaddress.ip_address(ip)), port)
+        self.stream = SendBuffer(None, coalesce=self.batch_delay is not None)
+        self.batch_size = self.get_segment_size(self.peer)
+        self.connection = connection = self.open_transfer(self.stream, self.peer)
+        # the handshake shows whether the receiver frames messages, builds before persistent connections do not
+        if not await connection.acknowledged(0):
+            self.connection = self.stream = None
+            raise ConnectionError(f"No answer from {ip}:{port}")
+        if not connection.sender.is_wide:
+            connection.finish(False)
+            self.connection = self.stream = None
+            raise ConnectionError(f"{ip}:{port} does not support persistent connections")
+        return self
+
+    async def disconnect(self) -> bool:
+        # raises while messages are not acknowledged, the connection stays open for another try then
+        await self.flush()
+        connection, stream = self.connection, self.stream
+        self.connection = self.stream = None
+        if connection is None or stream is None or connection.done.done() or connection.sender.is_idle():
+            # lost, or quiet for so long that the receiver dropped it without a FIN
+            if connection is not None:
+                connection.finish(False)
+            return True
+        stream.close()
+        connection.poll()
+        return await connection.done
+
+    def reopen(self) -> Transfer:
+        # the receiver and NATs on the way forget a connection that stays quiet, it starts over with the messages
+        # that are not acknowledged as a whole
+        connection = self.connection
+        if connection is not None and not connection.done.done() and not connection.sender.is_idle():
+            return connection
+        if connection is not None:
+            connection.finish(False)
+        self.stream = self.stream.reopen()
+        self.connection = self.open_transfer(self.stream, self.peer)
+        return self.connection
+
+    async def flush(self):
+        # sends the messages waiting for a batch and returns once the receiver acknowledged them. If it never does they
+        # stay buffered, the next flush() sends them again after a fresh SYN
+        if self.batch_timer is not None:
+            self.batch_timer.cancel()
+            self.batch_timer = None
+        if self.stream is None or not self.stream.pending:
+            return
+        if not await self.reopen().acknowledged(self.stream.end):
+            ip, port = self.peer
+            raise ConnectionError(f"Connection to {ip}:{port} lost, {self.stream.pending} bytes are not acknowledged")
+
+    def flush_batch(self):
+        self.batch_timer = None
+        if self.stream is not None and self.stream.pending:
+            self.reopen().poll()
+
+    async def send(self, message: Union[str, bytes, Iterable], ip = None, port = None) -> bool:
+        if self.stream is not None:
+            message = message.encode() if isinstance(message, str) else message
+            if not isinstance(message, (bytes, bytearray)):
+                message = b"".join(chunk.encode() if isinstance(chunk, str) else chunk for chunk in message)
+            self.stream.append(message)
+            if self.batch_delay is None or self.stream.pending >= self.batch_size or len(self.stream.boundaries) >= BATCH_LIMIT:
+                await self.flush()
+            elif self.batch_timer is None:
+                # Nagle-like: the first message of a batch waits at most batch_delay for others to fill its segment
+                self.batch_timer = self.loop.call_later(self.batch_delay, self.flush_batch)
+            return True
+        # segments are cut on byte offsets, so multi-byte characters survive being split across packets
+        transfer = self.open_transfer(SendBuffer(message), (str(ipaddress.ip_address(ip)), port))
+        try:
+            return await transfer.done
+        finally:
+            transfer.finish(False)
+
+    async def recv(self) -> str:
+        return await self.messages.get()
+
+    def datagram_received(self, data, addr):
+        try:
+            packet = Packet(data)
+        except ValueError:
+            # a header layout this version does not know
+            return
+        if packet.get("ack") == 1:
+            if self.receiver.on_ack(packet, addr):
+                return
+            if packet.has("conn_id"):
+                transfer = self.transfers.get(packet.get("conn_id"))
+            else:
+                transfer = next((transfer for transfer in self.transfers.values() if transfer.target == addr), None)
+            if transfer is not None:
+                transfer.on_ack(packet)
+            return
+
+        received = self.receiver.on_data(packet, addr)
+        if received is None:
+            return
+        conn, offset = received
+        is_complete = self.receiver.acknowledge(conn, offset)
+        self.deliver(conn)
+        if is_complete:
+            self.receiver.send_fin(conn)
+        self.arm()
+
+    def deliver(self, conn):
+        # a persistent connection can complete several messages with one segment
+        if self.on_data is None:
+            while conn.message_end() is not None:
+                self.messages.put_nowait(conn.take_message().decode(errors="replace"))
+            return
+        while conn.buffer is not None:
+            chunk, is_last = conn.take_chunk()
+            if not chunk and not is_last:
+                break
+            self.on_data(conn.addr, chunk, is_last)
+
+    def arm(self):
+        # only moved forward, most datagrams leave the earliest deadline where it was
+        deadline = self.receiver.deadline()
+        if deadline is None or (self.timer is not None and self.timer.when() <= deadline):
+            return
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.loop.call_at(deadline, self.on_timeout)
+
+    def on_timeout(self):
+        self.timer = None
+        now = self.loop.time()
+        self.receiver.sweep(now)
+        while (conn := self.receiver.due(now)) is not None:
+            self.receiver.send_fin(conn)
+        self.arm()
+
+    def close(self):
+        if self.batch_timer is not None:
+            self.batch_timer.cancel()
+            self.batch_timer = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        for transfer in list(self.transfers.values()):
+            transfer.finish(False)
+        self.connection = self.stream = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
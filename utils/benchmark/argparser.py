@@ -0,0 +1,213 @@
+import argparse
+import sys
+from typing import List, Optional
+
+from utils.constants import BENCHMARK_PORT, CLIENT_DEFAULT_CONGESTION_CONTROL, CLIENT_DEFAULT_TIMEOUT, CLIENT_DEFAULT_WINDOW_SIZE
+from utils.congestion import ALGORITHMS
+from utils.packet import DATA_HEADER_SIZE, MAX_SEGMENT_SIZE
+from utils.reliableUDP import ReliableUDP
+from utils.validations import validate_between, validate_file, validate_greater_than, validate_list, validate_port, validate_range, validate_size
+
+
+# the path MTU of loopback is 64 KiB, the runs default to the segments of an Ethernet path instead
+SEGMENT_SIZE = ReliableUDP.DEFAULT_MTU - ReliableUDP.IP_UDP_HEADER_SIZE - DATA_HEADER_SIZE
+
+
+class ArgParser:
+    def __init__(self):
+        parser = argparse.ArgumentParser(
+            description="Benchmark of the Reliable UDP project. Sends payloads through the proxy on loopback for every combination of size, drop and delay."
+        )
+        parser.add_argument(
+            "--sizes",
+            type=validate_list(validate_size),
+            default=[1 << 10, 64 << 10, 1 << 20],
+            help="Payload sizes to send, comma separated. eg) 1k,64k,1M",
+        )
+        parser.add_argument(
+            "--drops",
+            type=validate_list(validate_range(min=0, max=100)),
+            default=[0, 1, 5],
+            help="Drop chances(0%% -100%%) of the proxy in both directions, comma separated.",
+        )
+        parser.add_argument(
+            "--delays",
+            type=validate_list(validate_range(min=0)),
+            default=[0, 20],
+            help="Delays in milliseconds the proxy adds to every packet in both directions, comma separated.",
+        )
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            type=lambda value: validate_greater_than(value, 1),
+            default=3,
+            help="Runs of every combination, the median is reported.",
+        )
+        parser.add_argument(
+            "--subprocess",
+            action="store_true",
+            help="Run server, proxy and client as the scripts in separate processes instead of threads of this one. "
+                 "Slower to start, and completion times include the start of the client, but nothing shares the GIL.",
+        )
+        parser.add_argument(
+            "--seed",
+            type=lambda value: validate_greater_than(value, 0),
+            default=1,
+            help="Seed of the proxy, run N of every combination uses seed + N so two builds see the same drops.",
+        )
+        parser.add_argument(
+            "--port",
+            type=validate_port,
+            default=BENCHMARK_PORT,
+            help="First loopback port, every run takes the next two for its proxy and server.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=validate_range(min=0),
+            default=60,
+            help="Seconds a single transfer may take before the run counts as failed.",
+        )
+        parser.add_argument(
+            "--timeout",
+            "-t",
+            type=validate_range(min=0),
+            default=CLIENT_DEFAULT_TIMEOUT,
+            help="Timeout for client",
+        )
+        parser.add_argument(
+            "--segment-size",
+            "-s",
+            type=lambda value: validate_between(value, 1, MAX_SEGMENT_SIZE),
+            default=SEGMENT_SIZE,
+            help=f"Payload bytes per packet. Defaults to {SEGMENT_SIZE}, what a 1500 byte MTU leaves after IP, UDP and protocol headers.",
+        )
+        parser.add_argument(
+            "--window-size",
+            "-w",
+            type=lambda value: validate_greater_than(value, 1),
+            default=CLIENT_DEFAULT_WINDOW_SIZE,
+            help="Number of segments that can be in flight before waiting for an ACK.",
+        )
+        parser.add_argument(
+            "--congestion-control",
+            "-c",
+            choices=list(ALGORITHMS),
+            default=CLIENT_DEFAULT_CONGESTION_CONTROL,
+            help="Congestion control algorithm. 'none' only uses the window size.",
+        )
+        parser.add_argument(
+            "--json",
+            default=None,
+            help="Write the settings, every run and the medians to this file, usable as a --baseline later.",
+        )
+        parser.add_argument(
+            "--csv",
+            default=None,
+            help="Write the medians of every combination to this file.",
+        )
+        parser.add_argument(
+            "--baseline",
+            type=validate_file,
+            default=None,
+            help="JSON written by an earlier --json run to compare with. Exits with 1 when a combination got worse than the tolerance.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=validate_range(min=0),
+            default=10,
+            help="Percent a median may get worse than the baseline before it counts as a regression.",
+        )
+        args = parser.parse_args()
+
+        self.sizes: List[int] = args.sizes
+        self.drops: List[float] = args.drops
+        self.delays: List[float] = args.delays
+        self.repeat: int = args.repeat
+        self.subprocess: bool = args.subprocess
+        self.seed: int = args.seed
+        self.port: int = args.port
+        self.limit: float = args.limit
+        self.timeout: float = args.timeout
+        self.segment_size: int = args.segment_size
+        self.window_size: int = args.window_size
+        self.congestion_control: str = args.congestion_control
+        self.json: Optional[str] = args.json
+        self.csv: Optional[str] = args.csv
+        self.baseline: Optional[str] = args.baseline
+        self.tolerance: float = args.tolerance
+
+    def settings(self) -> dict:
+        # what a baseline has to match for its numbers to be comparable
+        return {
+            "subprocess": self.subprocess,
+            "seed": self.seed,
+            "timeout": self.timeout,
+            "segment_size": self.segment_size,
+            "window_size": self.window_size,
+            "congestion_control": self.congestion_control,
+        }
+
+    def __str__(self):
+        return f"Sizes: {self.sizes}, drops: {self.drops}%, delays: {self.delays}ms, runs: {self.repeat}, {'subprocesses' if self.subprocess else 'in-process'}, {self.settings()}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class MicroArgParser:
+    def __init__(self, benchmarks: List[str], baseline: str):
+        parser = argparse.ArgumentParser(
+            description="Microbenchmarks of the per-packet code of the Reliable UDP project: nanoseconds, peak memory and retained memory blocks per operation."
+        )
+        parser.add_argument(
+            "names",
+            nargs="*",
+            default=[],
+            help=f"Benchmarks to run, all by default. One or more of {', '.join(benchmarks)}.",
+        )
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            type=lambda value: validate_greater_than(value, 1),
+            default=7,
+            help="Timed repeats of every benchmark, each at least 0.2s long. The fastest is compared.",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=validate_range(min=0),
+            default=0.5,
+            help="Seconds every benchmark runs before it is timed.",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=baseline,
+            help="Results to compare with, exits with 1 when a benchmark is slower by more than the threshold or retains more memory blocks per op.",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=validate_range(min=0),
+            default=25,
+            help="Percent a benchmark may be slower than the baseline, for the noise between runs.",
+        )
+        parser.add_argument(
+            "--save",
+            action="store_true",
+            help="Write the results to the baseline file instead of comparing with it, keeping the benchmarks that did not run.",
+        )
+        args = parser.parse_args()
+
+        unknown = [name for name in args.names if name not in benchmarks]
+        if unknown:
+            sys.exit(f"Invalid benchmark {', '.join(unknown)}. Use one or more of {', '.join(benchmarks)}.")
+        self.names: List[str] = args.names or benchmarks
+        self.repeat: int = args.repeat
+        self.warmup: float = args.warmup
+        self.baseline: str = args.baseline
+        self.threshold: float = args.threshold
+        self.save: bool = args.save
+
+    def __str__(self):
+        return f"Benchmarks: {', '.join(self.names)}, repeats: {self.repeat}, warm-up: {self.warmup}s, baseline: {self.baseline}, threshold: {self.threshold}%"
+
+    def __repr__(self):
+        return self.__str__()
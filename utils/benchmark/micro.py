@@ -0,0 +1,187 @@
+import gc
+import itertools
+import json
+import os
+import timeit
+import tracemalloc
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from proxy import Proxy
+from utils.constants import PROXY_MEMORY
+from utils.fsm import FSM
+from utils.packet import MESSAGE_HEADER, Packet
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+SEGMENT = 1200 # payload bytes of the datagrams the benchmarks work on
+FSM_STEPS = 100 # round trips through the machine per run
+ALLOCATION_OPS = 1000 # ops whose results are kept to count the memory blocks each one leaves behind
+
+# name -> setup returning the op and how many ops one call of it is
+BENCHMARKS: Dict[str, Callable[[], Tuple[Callable[[], object], int]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def datagram(seq_num: int, payload = "x" * SEGMENT) -> bytes:
+    packet = Packet(version=MESSAGE_HEADER)
+    packet.set_wide("seq_num", seq_num).set("ack_num", 1).set("eom", 1)
+    packet.set_payload(payload)
+    return packet.to_byte()
+
+
+@benchmark("packet_parse")
+def packet_parse():
+    data = datagram(70000)
+    return (lambda: Packet(data)), 1
+
+
+@benchmark("packet_build")
+def packet_build():
+    payload = "x" * SEGMENT
+
+    def build():
+        packet = Packet(version=MESSAGE_HEADER)
+        packet.set_header_field("seq_num", "1f4")
+        packet.set_header_field("ack_num", "2a")
+        packet.set_header_field("ack", "1")
+        packet.set_payload(payload)
+        return packet.to_byte()
+
+    return build, 1
+
+
+@benchmark("get_payload")
+def get_payload():
+    packet = Packet(datagram(70000))
+    return packet.get_payload, 1
+
+
+@benchmark("fsm_step")
+def fsm_step():
+    # START -> A, then A -> B -> A until FSM_STEPS, then A -> EXIT: 2 * FSM_STEPS + 2 actions a run
+    def forth(n):
+        return ("B", n + 1) if n < FSM_STEPS else (FSM.STATE.EXIT, n)
+
+    fsm = FSM(
+        [
+            {"source": FSM.STATE.START, "dest": "A", "action": forth},
+            {"source": "A", "dest": "B", "action": lambda n: ("A", n)},
+            {"source": "B", "dest": "A", "action": forth},
+            {"source": "A", "dest": FSM.STATE.EXIT, "action": lambda n: n},
+        ],
+        initial_state="A",
+    )
+    return (lambda: fsm.run(0)), 2 * FSM_STEPS + 2
+
+
+@benchmark("proxy_record_packet")
+def proxy_record_packet():
+    proxy = Proxy("127.0.0.1", 0, "127.0.0.1", 0, 0, 0, (0, 0), 0, 0, (0, 0))
+    proxy.stop()
+    # every new datagram is followed by a retransmission of one sent 50 before, twice as many as the proxy
+    # remembers, so lookups hit and miss and the oldest entries get evicted
+    fresh = [datagram(seq_num) for seq_num in range(2 * PROXY_MEMORY)]
+    sequence = itertools.cycle([sent for seq_num, data in enumerate(fresh) for sent in (data, fresh[seq_num - 50])])
+    return (lambda: proxy.record_packet(False, next(sequence), False, 0.0)), 1
+
+
+def timing(op: Callable[[], object], ops: int, repeat: int, warmup: float) -> Dict[str, float]:
+    # warm up caches and lazy state, then time repeats of enough calls for at least 0.2s each, without the GC
+    deadline = perf_counter() + warmup
+    while perf_counter() < deadline:
+        op()
+    timer = timeit.Timer(op)
+    number, _ = timer.autorange()
+    per_op = sorted(elapsed / number / ops * 1e9 for elapsed in timer.repeat(repeat, number))
+    return { "ns": per_op[0], "median_ns": per_op[len(per_op) // 2] }
+
+
+def allocations(op: Callable[[], object], ops: int) -> Dict[str, float]:
+    # peak_bytes: peak memory above the start while one call runs, temporaries included
+    # retained_blocks: memory blocks still held per op after ALLOCATION_OPS calls whose results are kept. Temporaries
+    # freed within the op are not counted, tracemalloc only sees the blocks alive when a snapshot is taken
+    gc.collect()
+    tracemalloc.start()
+    try:
+        # memory allocated before tracing is freed unseen, so the op first turns over what it holds on to
+        for _ in range(ALLOCATION_OPS):
+            op()
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        op()
+        _, peak = tracemalloc.get_traced_memory()
+        # sized up front, so it does not grow while the ops are counted
+        kept = [None] * ALLOCATION_OPS
+        before = tracemalloc.take_snapshot()
+        for index in range(ALLOCATION_OPS):
+            kept[index] = op()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    # the snapshots themselves are not the op's
+    own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    blocks = sum(stat.count_diff for stat in after.filter_traces(own).compare_to(before.filter_traces(own), "lineno"))
+    return { "peak_bytes": (peak - start) / ops, "retained_blocks": blocks / ALLOCATION_OPS / ops }
+
+
+def run(names: List[str], repeat: int, warmup: float) -> Dict[str, dict]:
+    results = {}
+    for name in names:
+        op, ops = BENCHMARKS[name]()
+        results[name] = { **timing(op, ops, repeat, warmup), **allocations(op, ops) }
+    return results
+
+
+def format_table(results: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> str:
+    rows = [["benchmark", "ns/op", "median ns/op", "peak bytes/op", "retained blocks/op"] + (["baseline ns/op", "change %"] if baseline else [])]
+    for name, result in results.items():
+        row = [name, f"{result['ns']:.1f}", f"{result['median_ns']:.1f}", f"{result['peak_bytes']:.0f}", f"{result['retained_blocks']:.2f}"]
+        if baseline:
+            old = baseline.get(name)
+            row += [f"{old['ns']:.1f}", f"{(result['ns'] / old['ns'] - 1) * 100:+.1f}"] if old else ["-", "-"]
+        rows.append(row)
+    widths = [max(len(row[index]) for row in rows) for index in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width) if index == 0 else cell.rjust(width) for index, (cell, width) in enumerate(zip(row, widths))) for row in rows)
+
+
+def regressions(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[Tuple[str, str]]:
+    # time is compared with a tolerance for noise; the blocks an op leaves behind do not depend on the machine
+    found = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result["ns"] > old["ns"] * (1 + threshold / 100):
+            found.append((name, f"{old['ns']:.1f} -> {result['ns']:.1f} ns/op"))
+        if round(result["retained_blocks"], 2) > round(old["retained_blocks"], 2):
+            found.append((name, f"{old['retained_blocks']:.2f} -> {result['retained_blocks']:.2f} retained blocks/op"))
+    return found
+
+
+def confirm(results: Dict[str, dict], found: List[Tuple[str, str]], repeat: int, warmup: float) -> Dict[str, dict]:
+    # a busy machine slows a single run down, a benchmark only counts as slower when a second run agrees
+    for name in dict(found):
+        again = run([name], repeat, warmup)[name]
+        if again["ns"] < results[name]["ns"]:
+            results[name] = again
+    return results
+
+
+def load(path: str) -> Dict[str, dict]:
+    with open(path) as file:
+        return json.load(file)
+
+
+def save(path: str, results: Dict[str, dict]):
+    # a run of some benchmarks updates only theirs
+    baseline = load(path) if os.path.isfile(path) else {}
+    baseline.update(results)
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2)
+        file.write("\n")
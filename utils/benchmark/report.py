@@ -0,0 +1,94 @@
+import csv
+import json
+from itertools import groupby
+from statistics import median
+from typing import List, Optional, Tuple
+
+# measured per run and compared with a baseline, True where a larger value is better
+METRICS = {
+    "completion": False,
+    "goodput": True,
+    "retransmission_ratio": False,
+    "packets_per_byte": False,
+}
+COLUMNS = ["size", "drop", "delay", "runs", "delivered"] + list(METRICS)
+
+
+def scenario(result: dict) -> Tuple[int, float, float]:
+    return (result["size"], result["drop"], result["delay"])
+
+
+def summarize(runs: List[dict]) -> List[dict]:
+    # medians of the runs of every combination, failed runs only count in delivered
+    results = []
+    for key, group in groupby(sorted(runs, key=scenario), key=scenario):
+        group = list(group)
+        delivered = [run for run in group if run["delivered"]]
+        result = dict(zip(("size", "drop", "delay"), key), runs=len(group), delivered=len(delivered))
+        for metric in METRICS:
+            values = [run[metric] for run in delivered]
+            result[metric] = median(values) if values else None
+        results.append(result)
+    return results
+
+
+def write_json(path: str, settings: dict, runs: List[dict], results: List[dict]):
+    with open(path, "w") as file:
+        json.dump({ "settings": settings, "results": results, "runs": runs }, file, indent=2)
+
+
+def write_csv(path: str, results: List[dict]):
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def format_value(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, int):
+        return str(value)
+    return f"{value:.4g}"
+
+
+def format_table(results: List[dict]) -> str:
+    rows = [COLUMNS] + [[format_value(result[column]) for column in COLUMNS] for result in results]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(COLUMNS))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def change(metric: str, before: Optional[float], after: Optional[float]) -> Optional[float]:
+    # percent by which after is worse than before, negative when it got better
+    if before is None or after is None:
+        return None
+    if before == after:
+        return 0.0
+    if before == 0:
+        return float("inf") if (after < before) == METRICS[metric] else float("-inf")
+    worse = (before - after) if METRICS[metric] else (after - before)
+    return worse / abs(before) * 100
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> Tuple[str, List[str]]:
+    # a table of the changes against the baseline and a line for every regression past the tolerance
+    before = { scenario(result): result for result in baseline["results"] }
+    rows = [["size", "drop", "delay"] + [f"{metric} %" for metric in METRICS]]
+    regressions = []
+    for result in results:
+        old = before.get(scenario(result))
+        if old is None:
+            continue
+        name = f"size={result['size']} drop={result['drop']} delay={result['delay']}"
+        if result["delivered"] < result["runs"] and old["delivered"] == old["runs"]:
+            regressions.append(f"{name}: {result['runs'] - result['delivered']} of {result['runs']} runs failed")
+        row = [format_value(value) for value in scenario(result)]
+        for metric in METRICS:
+            worse = change(metric, old[metric], result[metric])
+            row.append("-" if worse is None else f"{0.0 - worse:+.1f}")
+            if worse is not None and worse > tolerance:
+                regressions.append(f"{name}: {metric} {format_value(old[metric])} -> {format_value(result[metric])}")
+        rows.append(row)
+    widths = [max(len(row[index]) for row in rows) for index in range(len(rows[0]))]
+    table = "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+    return table, regressions
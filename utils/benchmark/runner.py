@@ -0,0 +1,160 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import suppress
+from socket import SHUT_RDWR
+from string import ascii_letters
+from threading import Thread
+from time import perf_counter, sleep
+from typing import List, Optional
+
+from proxy import Proxy
+from utils.reliableUDP import ReliableUDP
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LOOPBACK = "127.0.0.1"
+STARTUP = 0.5 # seconds a script gets to bind its socket
+SETTLE = 1 # seconds the server gets to hand over the message after the client finished
+
+
+def payload(size: int) -> str:
+    # printable and without newlines, the server script writes what it receives to stdout
+    return (ascii_letters * (size // len(ascii_letters) + 1))[:size]
+
+
+def proxy_arguments(drop: float, delay: float, seed: int) -> List[str]:
+    arguments = ["--cdrop", str(drop), "--sdrop", str(drop), "--seed", str(seed)]
+    if delay:
+        arguments += ["--cdelay", "100", "--sdelay", "100", "--cdt", str(delay), "--sdt", str(delay)]
+    return arguments
+
+
+def measure(size: int, drop: float, delay: float, run: int, elapsed: Optional[float], snapshot: dict) -> dict:
+    # elapsed is None for a payload that did not arrive whole within the limit
+    client, server = snapshot["client"], snapshot["server"]
+    datagrams = client["sent"] + server["sent"]
+    return {
+        "size": size,
+        "drop": drop,
+        "delay": delay,
+        "run": run,
+        "delivered": elapsed is not None,
+        "completion": elapsed,
+        "goodput": size * 8 / elapsed / 1e6 if elapsed else None,
+        "retransmission_ratio": client["retransmitted"] / client["sent"] if client["sent"] else 0.0,
+        "packets_per_byte": datagrams / size,
+        "datagrams": datagrams,
+        "dropped": client["dropped"] + server["dropped"],
+    }
+
+
+def run_inprocess(size: int, drop: float, delay: float, run: int, seed: int, port: int, limit: float, client_options: dict) -> dict:
+    # the proxy script is imported rather than started, its datagrams are counted without a metrics file
+    proxy = Proxy(
+        listen_ip=LOOPBACK,
+        listen_port=port,
+        target_ip=LOOPBACK,
+        target_port=port + 1,
+        client_drop=drop,
+        client_delay=100 if delay else 0,
+        client_delay_time=(delay, delay),
+        server_drop=drop,
+        server_delay=100 if delay else 0,
+        server_delay_time=(delay, delay),
+        seed=seed,
+    )
+    proxy_thread = Thread(target=proxy.run, daemon=True)
+    proxy_thread.start()
+
+    server = ReliableUDP().create()
+    server.bind(LOOPBACK, port + 1)
+    received = []
+
+    def serve():
+        try:
+            while True:
+                received.append(server.recv())
+        except OSError:
+            pass
+
+    server_thread = Thread(target=serve, daemon=True)
+    server_thread.start()
+    client = ReliableUDP(**client_options).create()
+    data = payload(size)
+    sleep(0.1)
+
+    def send():
+        try:
+            client.send(data, LOOPBACK, port)
+        except OSError:
+            # closed after the limit, the run already counts as failed
+            pass
+
+    start = perf_counter()
+    sender = Thread(target=send, daemon=True)
+    sender.start()
+    sender.join(limit)
+    elapsed = perf_counter() - start
+    deadline = perf_counter() + SETTLE
+    while not sender.is_alive() and not received and perf_counter() < deadline:
+        sleep(0.01)
+    delivered = not sender.is_alive() and received == [data]
+
+    snapshot = proxy.snapshot()
+    proxy.stop()
+    client.socket.close()
+    # closing alone does not wake a recv() blocked on the socket, shutting it down does (and raises, it is not connected)
+    with suppress(OSError):
+        server.socket.shutdown(SHUT_RDWR)
+    server.socket.close()
+    # so that runs do not pile up threads, and nothing of one run is left on the ports of the next
+    proxy_thread.join()
+    server_thread.join()
+    return measure(size, drop, delay, run, elapsed if delivered else None, snapshot)
+
+
+def run_subprocess(size: int, drop: float, delay: float, run: int, seed: int, port: int, limit: float, client_options: dict) -> dict:
+    metrics = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "metrics.json")
+    proxy = subprocess.Popen(
+        [sys.executable, "proxy.py", "--headless", "--lip", LOOPBACK, "--lp", str(port), "--tip", LOOPBACK, "--tp", str(port + 1), "--metrics-file", metrics]
+        + proxy_arguments(drop, delay, seed),
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--listen-ip", LOOPBACK, "--listen-port", str(port + 1)],
+        cwd=ROOT, stdout=subprocess.PIPE,
+    )
+    output = bytearray()
+    Thread(target=lambda: [output.extend(chunk) for chunk in iter(lambda: server.stdout.read1(1 << 16), b"")], daemon=True).start()
+    sleep(STARTUP)
+
+    data = payload(size).encode()
+    options = ["--target", LOOPBACK, "--port", str(port), "--timeout", str(client_options["timeout"]), "--window-size", str(client_options["window_size"]), "--congestion-control", client_options["congestion_control"]]
+    if client_options["segment_size"]:
+        options += ["--segment-size", str(client_options["segment_size"])]
+    client = subprocess.Popen([sys.executable, "client.py"] + options, cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    start = perf_counter()
+    try:
+        client.communicate(data, timeout=limit)
+        elapsed = perf_counter() - start
+    except subprocess.TimeoutExpired:
+        client.kill()
+        client.wait()
+        elapsed = None
+    deadline = perf_counter() + SETTLE
+    while elapsed is not None and data not in output and perf_counter() < deadline:
+        sleep(0.01)
+    delivered = elapsed is not None and client.returncode == 0 and data in output
+
+    server.kill()
+    server.wait()
+    # the proxy writes its last numbers when it is asked to stop
+    proxy.terminate()
+    proxy.wait()
+    with open(metrics) as file:
+        snapshot = json.load(file)
+    os.remove(metrics)
+    os.rmdir(os.path.dirname(metrics))
+    return measure(size, drop, delay, run, elapsed if delivered else None, snapshot)
@@ -1,11 +1,16 @@
 import argparse
+from typing import Optional
 
 from utils.constants import (
     CLIENT_DEFAULT_TARGET_IP,
     CLIENT_DEFAULT_TARGET_PORT,
     CLIENT_DEFAULT_TIMEOUT,
+    CLIENT_DEFAULT_WINDOW_SIZE,
+    CLIENT_DEFAULT_CONGESTION_CONTROL,
 )
-from utils.validations import validate_ipv4, validate_port, validate_range
+from utils.congestion import ALGORITHMS
+from utils.packet import MAX_SEGMENT_SIZE
+from utils.validations import validate_between, validate_greater_than, validate_ipv4, validate_port, validate_range
 
 
 class ArgParser:
@@ -47,15 +52,58 @@ class ArgParser:
             help="Timeout for client",
         )
 
+        parser.add_argument(
+            "--segment-size",
+            "-s",
+            type=lambda value: validate_between(value, 1, MAX_SEGMENT_SIZE),
+            default=None,
+            help="Payload bytes per packet. Defaults to the path MTU minus IP, UDP and protocol headers.",
+        )
+
+        parser.add_argument(
+            "--window-size",
+            "-w",
+            type=lambda value: validate_greater_than(value, 1),
+            default=CLIENT_DEFAULT_WINDOW_SIZE,
+            help="Number of segments that can be in flight before waiting for an ACK.",
+        )
+
+        parser.add_argument(
+            "--congestion-control",
+            "-c",
+            choices=list(ALGORITHMS),
+            default=CLIENT_DEFAULT_CONGESTION_CONTROL,
+            help="Congestion control algorithm. 'none' only uses the window size.",
+        )
+
+        parser.add_argument(
+            "--batch-delay",
+            "-b",
+            type=validate_range(min=0),
+            default=None,
+            help="Send every input line as its own message and coalesce lines into shared segments, waiting at most this many seconds for a segment to fill.",
+        )
+
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Print the time spent in each protocol state after sending.",
+        )
+
         args = parser.parse_args()
 
         self.input = args.input
         self.target: str = args.target
         self.target_port: int = args.port
         self.timeout: int = args.timeout
+        self.segment_size: Optional[int] = args.segment_size
+        self.window_size: int = args.window_size
+        self.congestion_control: str = args.congestion_control
+        self.batch_delay: Optional[float] = args.batch_delay
+        self.profile: bool = args.profile
 
     def __str__(self):
-        return f"Targeting: {self.target}:{self.target_port}, timeout: {self.timeout}, input: {self.input}"
+        return f"Targeting: {self.target}:{self.target_port}, timeout: {self.timeout}, segment size: {self.segment_size or 'path MTU'}, window size: {self.window_size}, congestion control: {self.congestion_control}, batch delay: {self.batch_delay}, profile: {self.profile}, input: {self.input}"
 
     def __repr__(self):
         return self.__str__()
@@ -0,0 +1,118 @@
+import math
+from typing import Optional
+
+
+class CongestionControl:
+    name = "none"
+
+    def __init__(self):
+        self.cwnd: float = math.inf
+        self.ssthresh: float = math.inf
+
+    def reset(self):
+        self.__init__()
+
+    def window(self) -> int:
+        # congestion window in whole segments, never below one so the sender can always make progress
+        return max(1, int(self.cwnd)) if self.cwnd != math.inf else 1 << 30
+
+    def on_ack(self, acked_segments: int, rtt: Optional[float]):
+        pass
+
+    def on_loss(self):
+        pass
+
+    def on_timeout(self):
+        pass
+
+    def stats(self):
+        return {
+            "algorithm": self.name,
+            "cwnd": self.cwnd,
+            "ssthresh": self.ssthresh,
+        }
+
+    def __str__(self):
+        return f"{self.name}: cwnd {self.cwnd:.1f}, ssthresh {self.ssthresh:.1f}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Reno(CongestionControl):
+    name = "reno"
+    INITIAL_WINDOW = 2
+    MIN_SSTHRESH = 2
+
+    def __init__(self):
+        super().__init__()
+        self.cwnd = Reno.INITIAL_WINDOW
+
+    def on_ack(self, acked_segments: int, rtt: Optional[float]):
+        if self.cwnd < self.ssthresh:
+            # slow start, one segment per acknowledged segment
+            self.cwnd += acked_segments
+        else:
+            # congestion avoidance, roughly one segment per RTT
+            self.cwnd += acked_segments / self.cwnd
+
+    def on_loss(self):
+        self.ssthresh = max(self.cwnd / 2, Reno.MIN_SSTHRESH)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self):
+        self.ssthresh = max(self.cwnd / 2, Reno.MIN_SSTHRESH)
+        self.cwnd = 1
+
+
+class Vegas(Reno):
+    name = "vegas"
+    # bounds on the segments this flow may keep queued at the bottleneck
+    ALPHA = 2
+    BETA = 4
+    GAMMA = 1
+
+    def __init__(self):
+        super().__init__()
+        self.base_rtt: Optional[float] = None
+        self.queued: float = 0
+
+    def on_ack(self, acked_segments: int, rtt: Optional[float]):
+        if rtt is None:
+            # no clean sample (Karn's rule), fall back to loss-based growth
+            return super().on_ack(acked_segments, rtt)
+
+        self.base_rtt = rtt if self.base_rtt is None else min(self.base_rtt, rtt)
+        # expected minus actual throughput, expressed in segments sitting in queues
+        self.queued = self.cwnd * (1 - self.base_rtt / rtt)
+
+        if self.cwnd < self.ssthresh:
+            if self.queued > Vegas.GAMMA:
+                self.ssthresh = self.cwnd
+            else:
+                self.cwnd += acked_segments
+        elif self.queued < Vegas.ALPHA:
+            self.cwnd += acked_segments / self.cwnd
+        elif self.queued > Vegas.BETA:
+            self.cwnd = max(self.cwnd - acked_segments / self.cwnd, Reno.MIN_SSTHRESH)
+
+    def stats(self):
+        return {
+            **super().stats(),
+            "base_rtt": self.base_rtt,
+            "queued": self.queued,
+        }
+
+
+ALGORITHMS = {
+    CongestionControl.name: CongestionControl,
+    Reno.name: Reno,
+    Vegas.name: Vegas,
+}
+
+
+def create_congestion_control(name: str) -> CongestionControl:
+    try:
+        return ALGORITHMS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown congestion control '{name}', expected one of {', '.join(ALGORITHMS)}")
@@ -0,0 +1,131 @@
+import heapq
+from typing import Any, Iterable, Optional, Tuple
+from time import monotonic
+
+from utils.packet import SACK_BLOCKS
+from utils.rtt import RTTEstimator
+from utils.sequence import SEQ_MODULO, WIDE_SEQ_MODULO, unwrap
+
+
+class Connection:
+    class STATE:
+        RECEIVING = "RECEIVING"
+        FIN_WAIT = "FIN_WAIT"
+        # dropped for being idle before its message was complete, see Receiver.sweep()
+        EXPIRED = "EXPIRED"
+
+    RECEIVE_WINDOW = 256 # out-of-order segments buffered per connection
+
+    def __init__(self, addr, conn_id: int, random_number: int, initial_rto = 1, is_wide = False):
+        self.addr: Any = addr
+        self.conn_id = conn_id
+        self.random_number = random_number
+        # the sender offered 32 bit sequence numbers in its SYN, so ACKs carry them and later segments will too
+        self.is_wide = is_wide
+        self.modulo = WIDE_SEQ_MODULO if is_wide else SEQ_MODULO
+        self.state = Connection.STATE.RECEIVING
+        self.message_pointer = 0
+        self.message_length: Optional[int] = None
+        # received bytes from message_start on, None once everything up to the FIN has been delivered
+        self.buffer: Optional[bytearray] = bytearray()
+        self.message_start = 0
+        # end offsets of messages on a persistent connection, smallest first
+        self.boundaries = []
+        # end offsets of the messages that are empty, their single byte is only a placeholder
+        self.empty = set()
+        self.is_persistent = False
+        # offset -> payload of segments that arrived ahead of message_pointer
+        self.out_of_order = {}
+        self.last_activity = monotonic()
+        self.rtt = RTTEstimator(initial_rto=initial_rto)
+        # timestamp of the latest data segment, echoed in the next ACK
+        self.timestamp = 0
+        # FIN retransmission: attempts left, first FIN time, deadline of the current attempt, send time if not retransmitted
+        self.fin_retries = 0
+        self.fin_started = 0.0
+        self.fin_deadline = 0.0
+        self.fin_sent_at: Optional[float] = None
+
+    @property
+    def key(self):
+        return (self.addr, self.conn_id)
+
+    def receive(self, seq_num: int, payload: bytes, is_fin: bool, is_eom = False, ends: Iterable[int] = (), modulo: Optional[int] = None, is_empty = False) -> int:
+        # ends are the message ends listed by a batched segment, relative to its start. modulo is that of the segment's
+        # layout, segments sent before the sender switched to the wide layouts only carry 16 bits
+        self.last_activity = monotonic()
+        offset = unwrap(seq_num - self.random_number, self.message_pointer, modulo or self.modulo)
+        if is_fin:
+            self.message_length = offset + len(payload)
+        ends = [offset + end for end in ends]
+        if is_eom:
+            ends.append(offset + len(payload))
+            if is_empty and offset + len(payload) > self.message_start:
+                self.empty.add(offset + len(payload))
+        for end in ends:
+            self.is_persistent = True
+            if end > self.message_start and end not in self.boundaries:
+                heapq.heappush(self.boundaries, end)
+        if offset == self.message_pointer and payload and self.buffer is not None:
+            self.buffer += payload
+            self.message_pointer += len(payload)
+            while self.message_pointer in self.out_of_order:
+                payload = self.out_of_order.pop(self.message_pointer)
+                self.buffer += payload
+                self.message_pointer += len(payload)
+        elif offset > self.message_pointer and payload and len(self.out_of_order) < Connection.RECEIVE_WINDOW:
+            self.out_of_order[offset] = payload
+        return offset
+
+    def is_complete(self) -> bool:
+        return self.message_pointer == self.message_length
+
+    def message_end(self) -> Optional[int]:
+        # end offset of the oldest undelivered message once all of it has arrived
+        if self.buffer is None:
+            return None
+        if self.boundaries and self.boundaries[0] <= self.message_pointer:
+            return self.boundaries[0]
+        if self.is_complete() and (self.message_start < self.message_pointer or not self.is_persistent):
+            # a one-shot message ends with the FIN, a persistent connection may close with data left over
+            return self.message_pointer
+        return None
+
+    def take_chunk(self) -> Tuple[bytes, bool]:
+        # in-order bytes of the current message, and whether they complete it
+        if self.buffer is None:
+            return (b"", True)
+        end = self.message_end()
+        limit = (end if end is not None else self.message_pointer) - self.message_start
+        chunk = bytes(self.buffer[:limit])
+        del self.buffer[:limit]
+        self.message_start += limit
+        if end is None:
+            return (chunk, False)
+        if self.boundaries and self.boundaries[0] == end:
+            heapq.heappop(self.boundaries)
+        if end in self.empty:
+            self.empty.discard(end)
+            chunk = b""
+        if self.is_complete() and self.message_start == self.message_pointer and not self.boundaries:
+            self.buffer = None
+        return (chunk, True)
+
+    def take_message(self) -> bytes:
+        chunk, _ = self.take_chunk()
+        return chunk
+
+    def window(self) -> int:
+        return Connection.RECEIVE_WINDOW - len(self.out_of_order)
+
+    def sack_blocks(self, latest):
+        blocks = []
+        for offset in sorted(self.out_of_order):
+            end = offset + len(self.out_of_order[offset])
+            if blocks and blocks[-1][1] == offset:
+                blocks[-1][1] = end
+            else:
+                blocks.append([offset, end])
+        # the block holding the segment that triggered this ACK goes first (RFC 2018)
+        blocks.sort(key=lambda block: not block[0] <= latest < block[1])
+        return blocks[:SACK_BLOCKS]
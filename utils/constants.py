@@ -1,6 +1,8 @@
 CLIENT_DEFAULT_TARGET_IP = "127.0.0.1"
 CLIENT_DEFAULT_TARGET_PORT = 4000
 CLIENT_DEFAULT_TIMEOUT = 1
+CLIENT_DEFAULT_WINDOW_SIZE = 8
+CLIENT_DEFAULT_CONGESTION_CONTROL = "reno"
 
 SERVER_DEFAULT_LISTEN_IP = "0.0.0.0"
 SERVER_DEFAULT_LISTEN_PORT = 5000
@@ -12,3 +14,7 @@ PROXY_LISTEN_PORT = 4000
 # Server info that proxy will forward packets to
 PROXY_TARGET_IP = "127.0.0.1"
 PROXY_TARGET_PORT = 5000
+# recent datagrams the proxy remembers to spot retransmissions
+PROXY_MEMORY = 500
+# first of the loopback ports the benchmark gives its proxies and servers
+BENCHMARK_PORT = 7100
@@ -1,5 +1,7 @@
+from collections import deque
 from enum import Enum
-from typing import Any
+from time import monotonic
+from typing import Any, Callable, Optional
 
 
 class FSM:
@@ -9,36 +11,161 @@ class FSM:
 
     def __init__(self, transitions, initial_state, verbose = False):
         self.transitions = transitions
+        self.initial_state = initial_state
         self.curret_state = initial_state
         self.prev_state = FSM.STATE.START
         self.verbose = verbose
+        self.on_enter = []
+        self.on_exit = []
+        # (source, dest) -> action, so every step is one dict lookup instead of a scan over the transitions
+        self.table = {}
+        for transition in transitions:
+            if "source" not in transition or "dest" not in transition:
+                raise ValueError("transition {val} needs a source and a dest".format(val=transition))
+            key = (transition["source"], transition["dest"])
+            if key in self.table:
+                raise ValueError("transition from {val1} to {val2} is defined twice".format(val1=key[0], val2=key[1]))
+            self.table[key] = transition.get("action")
+        if (FSM.STATE.START, initial_state) not in self.table:
+            raise ValueError("transition from {val1} to {val2} is not defined".format(val1=FSM.STATE.START, val2=initial_state))
+        sources = {source for source, _ in self.table}
+        for source, dest in self.table:
+            if dest != FSM.STATE.EXIT and dest not in sources:
+                raise ValueError("state {val} is entered from {val2} but never left".format(val=dest, val2=source))
 
 
     def run(self, *args):
+        # the same machine runs again from its initial state on every call
+        self.prev_state = FSM.STATE.START
+        self.curret_state = self.initial_state
+        if self.verbose or self.on_enter or self.on_exit:
+            return self.run_observed(args)
+
+        table = self.table
+        exit_state = FSM.STATE.EXIT
+        prev_state = FSM.STATE.START
+        current_state = self.initial_state
+        next_args: Any = args
+        while prev_state is not exit_state:
+            try:
+                action = table[(prev_state, current_state)]
+            except KeyError:
+                self.prev_state, self.curret_state = prev_state, current_state
+                raise Exception("transition from {val1} to {val2} is not defined".format(val1=prev_state, val2=current_state))
+            prev_state = current_state
+            if not action:
+                current_state = None
+                continue
+            result = action(*next_args)
+            if result.__class__ is tuple:
+                current_state, *next_args = result
+            elif prev_state is exit_state:
+                next_args = (result,)
+            else:
+                current_state = result
+                next_args = ()
+        self.prev_state, self.curret_state = prev_state, current_state
+        return next_args[0] if len(next_args) > 0 else None
+
+
+    def add_hook(self, on_enter: Optional[Callable] = None, on_exit: Optional[Callable] = None):
+        # on_enter(source, dest, now) runs before the action of a transition, on_exit(source, dest, now) after it,
+        # now is a monotonic timestamp. Machines with hooks leave the fast path
+        if on_enter is not None:
+            self.on_enter.append(on_enter)
+        if on_exit is not None:
+            self.on_exit.append(on_exit)
+
+
+    def run_observed(self, args):
         next_args: Any = args
         while self.prev_state != FSM.STATE.EXIT:
-            next_transition = next((item for item in self.transitions if (item['source'] == self.prev_state and item['dest'] == self.curret_state)), None)
+            key = (self.prev_state, self.curret_state)
+            if key not in self.table:
+                raise Exception("transition from {val1} to {val2} is not defined".format(val1=self.prev_state, val2=self.curret_state))
             temp_prev = self.prev_state
             temp_current = self.curret_state
+            for hook in self.on_enter:
+                hook(temp_prev, temp_current, monotonic())
 
-            if next_transition:
-                self.prev_state = self.curret_state
-                if "action" in next_transition and next_transition["action"]:
-                    result = next_transition["action"](*next_args)
-                    if type(result) is tuple:
-                        self.curret_state, *next_args = result
-                    else:
-                        if self.prev_state == FSM.STATE.EXIT:
-                            next_args = (result,)
-                        else:
-                            self.curret_state = result
-                            next_args = ()
+            self.prev_state = self.curret_state
+            action = self.table[key]
+            if action:
+                result = action(*next_args)
+                if type(result) is tuple:
+                    self.curret_state, *next_args = result
                 else:
-                    self.curret_state = None
-
-                if self.verbose:
-                    print("{val1} -> {val2} -> {val3}".format(val1=temp_prev, val2=temp_current, val3=self.curret_state))
-
+                    if self.prev_state == FSM.STATE.EXIT:
+                        next_args = (result,)
+                    else:
+                        self.curret_state = result
+                        next_args = ()
             else:
-                raise Exception("transition from {val1} to {val2} is not defined".format(val1=self.prev_state, val2=self.curret_state))
+                self.curret_state = None
+
+            for hook in self.on_exit:
+                hook(temp_prev, temp_current, monotonic())
+            if self.verbose:
+                print("{val1} -> {val2} -> {val3}".format(val1=temp_prev, val2=temp_current, val3=self.curret_state))
         return next_args[0] if len(next_args) > 0 else None
+
+
+class FSMStats:
+    # time spent in each state (the action that entered it) and in each transition, over the latest samples
+    MAX_SAMPLES = 10000
+
+    def __init__(self, max_samples = MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.states = {}
+        self.transitions = {}
+        self.entered = 0.0
+
+    def attach(self, fsm: FSM):
+        fsm.add_hook(self.on_enter, self.on_exit)
+        return self
+
+    def on_enter(self, source, dest, now):
+        self.entered = now
+
+    def on_exit(self, source, dest, now):
+        duration = now - self.entered
+        for table, key in ((self.states, FSMStats.name(dest)), (self.transitions, f"{FSMStats.name(source)} -> {FSMStats.name(dest)}")):
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = [0, 0.0, deque(maxlen=self.max_samples)]
+            entry[0] += 1
+            entry[1] += duration
+            entry[2].append(duration)
+
+    @staticmethod
+    def name(state) -> str:
+        return state.value if isinstance(state, Enum) else str(state)
+
+    @staticmethod
+    def summary(entry) -> dict:
+        count, total, samples = entry
+        ordered = sorted(samples)
+        percentile = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+        return { "count": count, "total": total, "p50": percentile(0.5), "p99": percentile(0.99) }
+
+    def report(self) -> dict:
+        return {
+            "states": {key: FSMStats.summary(entry) for key, entry in self.states.items()},
+            "transitions": {key: FSMStats.summary(entry) for key, entry in self.transitions.items()},
+        }
+
+    def reset(self):
+        self.states = {}
+        self.transitions = {}
+
+    def __str__(self):
+        lines = []
+        for title, table in (("state", self.states), ("transition", self.transitions)):
+            lines.append(f"{title:<28} {'count':>8} {'total':>10} {'p50':>10} {'p99':>10}")
+            for key, entry in sorted(table.items(), key=lambda item: -item[1][1]):
+                summary = FSMStats.summary(entry)
+                lines.append(f"{key:<28} {summary['count']:>8} {summary['total']:>9.3f}s {summary['p50'] * 1000:>8.3f}ms {summary['p99'] * 1000:>8.3f}ms")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return self.__str__()
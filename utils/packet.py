@@ -1,4 +1,6 @@
-from typing import Optional, Union 
+from typing import List, Optional, Tuple, Union
+
+from utils.schema import HeaderLayout, LayoutRegistry
 
 custom_header = {
     "seq_num": 2,
@@ -6,83 +8,193 @@ custom_header = {
     "syn": 1/8,
     "ack": 1/8,
     "fin": 1/8,
-    "offset": 5/8, # offset to make header length nice number
+    "version": 5/8, # layout of the extension fields that follow, 0 for none. Also pads the header to a nice number
+}
+
+layouts = LayoutRegistry(custom_header, "version")
+
+# Extended layouts. Every one of them starts with custom_header, so the version can always be read from the base fields
+EXTENDED_HEADER = 1
+SACK_HEADER = 2
+# the same two layouts with the upper half of 32 bit sequence numbers, used once the receiver accepted the offer
+WIDE_HEADER = 3
+WIDE_SACK_HEADER = 4
+# data segments of persistent connections, which frame many messages between one SYN and one FIN
+MESSAGE_HEADER = 5
+SACK_BLOCKS = 3
+
+extended_header = {
+    "conn_id": 4,
+    # sender's clock in microseconds on data segments, echoed back by the ACKs they trigger (RFC 7323), 0 for none
+    "timestamp": 4,
+    # set on the segments a sender cuts before its first ACK, an offer to switch to the wide layouts. Builds that
+    # predate it ignore the bit, and receive windows never grow large enough to reach it
+    "wide": 1/8,
+    "window": 15/8,
+}
+sack_header = {
+    **extended_header,
+    "sack_count": 1,
+    **{f"sack_{i}_{edge}": 4 for i in range(1, SACK_BLOCKS + 1) for edge in ("start", "end")},
+}
+
+wide_fields = {
+    "seq_num_hi": 2,
+    "ack_num_hi": 2,
+}
+
+message_fields = {
+    "eom": 1/8, # the segment ends a message
+    "batch": 1/8, # the payload starts with the ends of the messages coalesced into it, see set_batch()
+    # the segment's single payload byte stands in for an empty message, so that it takes up a sequence number to be
+    # acknowledged by and retransmitted on like any other
+    "empty": 1/8,
+    "reserved": 5/8,
+}
+BATCH_LIMIT = 255 # message ends per segment, counted in one byte
+
+layouts.register(EXTENDED_HEADER, extended_header)
+layouts.register(SACK_HEADER, sack_header)
+layouts.register(WIDE_HEADER, {**extended_header, **wide_fields})
+layouts.register(WIDE_SACK_HEADER, {**sack_header, **wide_fields})
+layouts.register(MESSAGE_HEADER, {**extended_header, **wide_fields, **message_fields})
+# longest header in front of a payload, segment sizes leave room for it whichever layout a segment ends up on
+DATA_HEADER_SIZE = max(layouts.get(version).length for version in (EXTENDED_HEADER, WIDE_HEADER, MESSAGE_HEADER))
+# largest payload next to that header in a single UDP datagram over IPv4 (65535 bytes, 28 of them IP and UDP headers)
+MAX_SEGMENT_SIZE = 65535 - 20 - 8 - DATA_HEADER_SIZE
+
+field_labels = {
+    "seq_num": "Sequence Number",
+    "ack_num": "Acknowledgment Number",
+    "syn": "SYN",
+    "ack": "ACK",
+    "fin": "FIN",
+    "conn_id": "Connection ID",
+    "wide": "32 bit Sequence Numbers Offered",
+    "seq_num_hi": "Sequence Number (high)",
+    "ack_num_hi": "Acknowledgment Number (high)",
+    "eom": "End of Message",
+    "batch": "Batched Messages",
+    "empty": "Empty Message",
+    "sack_count": "SACK Blocks",
 }
 
+
 class Packet():
-    def __init__(self, packet: Optional[bytes] = None, header_definition = custom_header):
-        self.header_definition = header_definition
-        self.header_length_bits = int(sum(header_definition.values()) * 8)
-        self.binary = bin(int(packet.hex(), 16))[2:].zfill(len(packet.hex()) * 4) if packet else "0" * self.header_length_bits
+    def __init__(self, packet: Optional[bytes] = None, header_definition = None, version = 0):
+        if header_definition is not None:
+            self.layout = HeaderLayout.of(header_definition)
+        elif packet:
+            self.layout = layouts.detect(packet)
+        else:
+            self.layout = layouts.get(version)
+        self.header_definition = self.layout.header_definition
+        self.header_length_bits = self.layout.length_bits
+        if packet:
+            self.header = bytearray(packet[:self.layout.length])
+            if len(self.header) < self.layout.length:
+                self.header.extend(bytes(self.layout.length - len(self.header)))
+            self.payload = bytes(packet[self.layout.length:])
+        else:
+            self.header = bytearray(self.layout.length)
+            self.payload = b""
+            if self.layout.version:
+                self.set(layouts.version_field, self.layout.version)
 
 
     def get_header_field_position(self, field_name):
-        bit_pointer = 0
-        for key, size in self.header_definition.items():
-            if key == field_name:
-                bit_length = int(size * 8)
-                return (bit_pointer, bit_pointer + bit_length)
-            bit_pointer += int(size * 8)
-        raise ValueError(f"Field '{field_name}' not found in header definition")
+        _, _, _, _, bit_start, bit_length, _ = self.layout.field(field_name)
+        return (bit_start, bit_start + bit_length)
+
+
+    def has(self, field_name: str) -> bool:
+        return field_name in self.layout.getters
+
+
+    def get(self, field_name: str) -> int:
+        return self.layout.unpack(self.header, field_name)
+
+
+    def set(self, field_name: str, value: int):
+        self.layout.pack(self.header, field_name, value)
+        return self
+
+
+    def is_wide(self) -> bool:
+        return self.has("seq_num_hi")
+
+
+    def get_wide(self, field_name: str) -> int:
+        # seq_num and ack_num, joined with their upper half when the layout carries one
+        value = self.get(field_name)
+        if self.has(f"{field_name}_hi"):
+            value |= self.get(f"{field_name}_hi") << self.layout.field(field_name)[5]
+        return value
+
+
+    def set_wide(self, field_name: str, value: int):
+        self.set(field_name, value)
+        if self.has(f"{field_name}_hi"):
+            self.set(f"{field_name}_hi", value >> self.layout.field(field_name)[5])
+        return self
+
+
+    def set_batch(self, data: bytes, ends: List[int]):
+        # count, then the end of every message relative to the start of data, then data itself
+        self.set("batch", 1)
+        self.payload = bytes([len(ends)]) + b"".join(end.to_bytes(2, "big") for end in ends) + data
+        return self
+
+
+    def get_batch(self) -> Tuple[List[int], bytes]:
+        # message ends and data of a batched payload, a plain payload has no ends
+        if not self.has("batch") or self.get("batch") == 0 or not self.payload:
+            return ([], self.payload)
+        table = 1 + 2 * self.payload[0]
+        ends = [int.from_bytes(self.payload[i:i + 2], "big") for i in range(1, table, 2)]
+        return (ends, self.payload[table:])
 
 
     def get_header_field(self, field_name: str, base: int = 16):
-        bit_start, bit_end = self.get_header_field_position(field_name)
-        binary_value = self.binary[bit_start:bit_end]
+        value = self.get(field_name)
 
         if base == 2:
-            return binary_value
+            _, _, _, _, _, bit_length, _ = self.layout.field(field_name)
+            return bin(value)[2:].zfill(bit_length)
         elif base == 10:
-            return str(int(binary_value, 2))
+            return str(value)
         elif base == 16:
-            return hex(int(binary_value, 2))[2:]
+            return hex(value)[2:]
         else:
             raise ValueError("Unsupported base")
 
 
     def set_header_field(self, field_name: str, value: str, base = 16):
-        bit_start, bit_end = self.get_header_field_position(field_name)
-
-        if base == 16:
-            binary_value = bin(int(value, 16))[2:]
-        elif base == 10:
-            binary_value = bin(int(value))[2:]
-        elif base == 2:
-            binary_value = value
-        else:
+        if base not in (2, 10, 16):
             raise ValueError("Unsupported base")
-
-        field_length = bit_end - bit_start
-        binary_value = binary_value.zfill(field_length)[-field_length:]
-        self.binary = self.binary[:bit_start] + binary_value + self.binary[bit_end:]
+        self.set(field_name, int(value, base))
 
 
-    def set_payload(self, data: str):
+    def set_payload(self, data: Union[str, bytes]):
         if len(data) == 0:
             return
-        payload_hex = data.encode().hex()
-        payload_binary = bin(int(payload_hex, 16))[2:].zfill(len(payload_hex) * 4)
-        self.binary = self.binary[:self.header_length_bits] + payload_binary
+        self.payload = data.encode() if isinstance(data, str) else bytes(data)
 
 
     def get_payload(self) -> Union[str, None]:
-        payload_binary = self.binary[self.header_length_bits:]
-        if len(payload_binary) == 0:
+        if len(self.payload) == 0:
             return None
-        payload_hex = hex(int(payload_binary, 2))[2:].zfill(len(payload_binary) // 4)
-        return bytes.fromhex(payload_hex).decode()
+        return self.payload.decode()
 
 
     def get_hex(self) -> str:
-        return hex(int(self.binary, 2))[2:].zfill(len(self.binary) // 4)
+        return self.to_byte().hex()
 
 
     def to_byte(self) -> bytes:
-        return bytes.fromhex(self.get_hex())
+        return bytes(self.header) + self.payload
 
     def __eq__(self, value: object) -> bool:
         if isinstance(value, Packet):
-            return value.get_hex() == self.get_hex()
+            return value.header == self.header and value.payload == self.payload
         return False
-
-
@@ -0,0 +1,454 @@
+from random import getrandbits
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.congestion import CongestionControl
+from utils.connection import Connection
+from utils.packet import EXTENDED_HEADER, MESSAGE_HEADER, SACK_BLOCKS, SACK_HEADER, WIDE_HEADER, WIDE_SACK_HEADER, Packet
+from utils.rtt import RTTEstimator
+from utils.sequence import SEQ_MODULO, WIDE_SEQ_MODULO, unwrap
+from utils.stream import SendBuffer
+
+# the protocol without any I/O: transports feed Sender and Receiver the packets they read and the times their
+# timers fire, and pass a send callback that puts datagrams on the wire, so the blocking socket of ReliableUDP
+# and the event loop of AsyncReliableUDP run the same code
+
+RETRIES = 20
+# a sender gives up once it has retransmitted without an answer for RETRIES initial RTOs, 20 seconds with the default
+# timeout of 1 second. Backoff alone would take RETRIES timeouts of up to MAX_RTO each
+DUPLICATE_ACKS = 3 # duplicate ACKs that trigger a fast retransmit
+FIN_WAIT = 10 # seconds the receiver keeps repeating its FIN for a missing final ACK
+IDLE_TIMEOUT = 60 # seconds after which a connection that stopped sending is dropped
+SWEEP_INTERVAL = 1 # seconds between two looks for idle and expired connections
+TIMESTAMP_MODULO = 1 << 32 # microsecond timestamps wrap after about 71 minutes
+# seconds a persistent connection may stay quiet before its next message goes out after a fresh SYN, well within
+# IDLE_TIMEOUT and the time NATs keep a UDP mapping (the proxy's NATTable uses the same 60 seconds)
+REOPEN_AFTER = IDLE_TIMEOUT / 2
+
+
+class Sender:
+    # one outgoing transfer: a message, or the open buffer of a persistent connection
+    def __init__(
+        self,
+        source: SendBuffer,
+        segment_size: int,
+        send: Callable[[bytes], Any],
+        rtt: RTTEstimator,
+        congestion: CongestionControl,
+        window_size: int,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.source = source
+        # segments are cut to max_in_flight until the receiver accepted 32 bit sequence numbers, see on_ack()
+        self.max_segment_size = segment_size
+        self.segment_size = min(segment_size, SEQ_MODULO // 2 - 1)
+        self.send = send
+        self.rtt = rtt
+        self.congestion = congestion
+        self.window_size = window_size
+        self.clock = clock
+        # the SYN goes out on a 16 bit layout, so the initial sequence number has to fit it
+        self.random_number = getrandbits(16)
+        # tells this transfer apart from others the receiver gets from the same address
+        self.conn_id = getrandbits(32)
+        self.message_pointer = 0
+        self.next_offset = 0
+        # offset -> [end offset, last send time, retries left, first send time or None once retransmitted, SACKed]
+        self.in_flight = {}
+        # offsets of in-flight segments that are due for retransmission once the congestion window allows it
+        self.retransmit_queue = []
+        self.duplicate_acks = 0
+        self.recovery_point = 0
+        self.peer_window = window_size
+        # an open buffer frames messages, the last segment of each one carries an end of message flag
+        self.is_persistent = not source.eof and source.chunks is None
+        self.fin_sent = False
+        # sequence number of the receiver's FIN once it arrived, see acknowledge_fin()
+        self.peer_fin: Optional[int] = None
+        # 32 bit sequence numbers are offered on every segment until the first ACK shows whether the receiver uses them,
+        # None until then
+        self.is_wide: Optional[bool] = None
+        self.modulo = SEQ_MODULO
+        # bytes in flight must stay within half the sequence space to keep acks unambiguous
+        self.max_in_flight = SEQ_MODULO // 2 - 1
+        self.started = clock()
+        # when the receiver was last heard from
+        self.last_heard = self.started
+        # first timeout since then, see poll()
+        self.stalled_since: Optional[float] = None
+        # why poll() gave up on a message that was not delivered, for the application to report
+        self.abort_reason: Optional[str] = None
+
+    @property
+    def delivered(self) -> bool:
+        return self.source.is_end(self.message_pointer)
+
+    def is_idle(self) -> bool:
+        # the receiver, or a NAT on the way, may have forgotten the connection
+        return self.clock() - self.last_heard > REOPEN_AFTER
+
+    def is_acknowledged(self, offset: int) -> bool:
+        # the receiver answered and holds everything up to offset, 0 for the handshake alone
+        return self.is_wide is not None and self.message_pointer >= offset
+
+    def send_segment(self, offset, retries):
+        # a retransmission repeats the segment as it was first cut, even if more messages were appended since
+        source = self.source
+        payload = source.slice(offset, self.in_flight[offset][0]) if offset in self.in_flight else source.segment(offset, self.segment_size)
+        end = offset + len(payload)
+        if self.is_wide is None:
+            # on the layout every build knows, an older receiver that cannot parse the wide ones still answers
+            packet = Packet(version=EXTENDED_HEADER)
+            packet.set("wide", 1)
+        elif self.is_persistent:
+            packet = Packet(version=MESSAGE_HEADER)
+            packet.set("eom", 1 if source.is_boundary(end) else 0)
+            packet.set("empty", 1 if source.is_empty(end) else 0)
+        else:
+            packet = Packet(version=WIDE_HEADER if self.is_wide else EXTENDED_HEADER)
+        packet.set("conn_id", self.conn_id)
+        packet.set_wide("seq_num", self.random_number + offset)
+        packet.set("ack_num", 0)
+        packet.set("timestamp", self.timestamp())
+        if offset == 0:
+            packet.set("syn", 1)
+        if source.is_end(end):
+            packet.set("fin", 1)
+            self.fin_sent = True
+        if source.coalesce and packet.has("batch") and not source.is_empty(end):
+            packet.set_batch(payload, source.ends_within(offset, end))
+        else:
+            packet.set_payload(payload)
+        self.send(packet.to_byte())
+        now = self.clock()
+        self.in_flight[offset] = [end, now, retries - 1, now if retries == RETRIES else None, False]
+        return end
+
+    def timestamp(self) -> int:
+        # 0 stands for no timestamp, older builds neither set nor echo one
+        return int(self.clock() * 1_000_000) % TIMESTAMP_MODULO or 1
+
+    def echoed_rtt(self, packet: Packet) -> Optional[float]:
+        # the RTT of the very transmission an ACK answers, retransmitted or not
+        echoed = packet.get("timestamp") if packet.has("timestamp") else 0
+        if not echoed:
+            return None
+        return max((self.timestamp() - echoed) % TIMESTAMP_MODULO, 1) / 1_000_000
+
+    def mark_lost(self, offsets):
+        offsets = [offset for offset in offsets if offset not in self.retransmit_queue]
+        if not offsets:
+            return
+        self.retransmit_queue = sorted(self.retransmit_queue + offsets)
+        # one window reduction per loss episode, however many segments of that window went missing
+        if self.message_pointer >= self.recovery_point:
+            self.congestion.on_loss()
+            self.recovery_point = self.next_offset
+
+    def read_sack(self, packet) -> bool:
+        if not packet.has("sack_count") or packet.get("sack_count") == 0:
+            return False
+        for i in range(1, min(packet.get("sack_count"), SACK_BLOCKS) + 1):
+            start = unwrap(packet.get(f"sack_{i}_start") - self.random_number, self.message_pointer, self.modulo)
+            end = unwrap(packet.get(f"sack_{i}_end") - self.random_number, self.message_pointer, self.modulo)
+            for offset, segment in self.in_flight.items():
+                if start <= offset and segment[0] <= end:
+                    segment[4] = True
+        return True
+
+    def deadline(self) -> float:
+        # when the oldest segment still in the network times out, or poll() gives up on a silent receiver
+        deadline = min(
+            (sent for offset, (_, sent, _, _, sacked) in self.in_flight.items() if not sacked and offset not in self.retransmit_queue),
+            default=self.clock(),
+        ) + self.rtt.rto
+        if self.stalled_since is not None:
+            deadline = min(deadline, self.stalled_since + RETRIES * self.rtt.initial_rto)
+        return deadline
+
+    def poll(self) -> bool:
+        # retransmits what timed out and sends what the windows allow, False once a segment ran out of retries, see
+        # abort_reason
+        now = self.clock()
+        # timers follow the current RTO instead of the one at send time
+        expired = [
+            offset for offset, (_, sent, _, _, sacked) in self.in_flight.items()
+            if not sacked and sent + self.rtt.rto <= now and offset not in self.retransmit_queue
+        ]
+        if expired and expired[0] == next(iter(self.in_flight)):
+            # the oldest segment timing out is what a single TCP retransmission timer would see
+            self.rtt.backoff()
+            self.congestion.on_timeout()
+        if expired and self.stalled_since is None:
+            self.stalled_since = now
+        is_silent = self.stalled_since is not None and self.in_flight and now - self.stalled_since >= RETRIES * self.rtt.initial_rto
+        if is_silent or any(self.in_flight[offset][2] < 1 for offset in expired):
+            if not self.delivered:
+                self.abort_reason = f"Aborted after {now - self.started:.1f} seconds (no answer for {now - (self.stalled_since or now):.1f} seconds, last timeout {self.rtt.rto:.3f} seconds), {self.message_pointer} bytes delivered"
+            return False
+        self.retransmit_queue = sorted(self.retransmit_queue + expired)
+
+        # segments the receiver has SACKed or that wait for retransmission are no longer in the network
+        source = self.source
+        window = min(self.window_size, self.congestion.window(), self.peer_window)
+        outstanding = sum(1 for _, _, _, _, sacked in self.in_flight.values() if not sacked) - len(self.retransmit_queue)
+        while self.retransmit_queue and outstanding < window:
+            offset = self.retransmit_queue.pop(0)
+            self.send_segment(offset, self.in_flight[offset][2])
+            outstanding += 1
+
+        if self.is_persistent and self.is_wide is False:
+            # the receiver cannot frame messages
+            return False
+        if self.is_persistent and self.is_wide is None:
+            # messages are only framed on the wide layouts, so a persistent connection opens with an empty SYN
+            # and sends nothing else until the answer shows what the receiver speaks
+            if not self.in_flight:
+                self.in_flight[0] = [0, 0.0, RETRIES, None, False]
+                self.send_segment(0, RETRIES)
+            return True
+
+        while (
+            source.available(self.next_offset)
+            and outstanding < window
+            and (not self.in_flight or source.segment_end(self.next_offset, self.segment_size) - self.message_pointer <= self.max_in_flight)
+        ):
+            self.next_offset = self.send_segment(self.next_offset, RETRIES)
+            outstanding += 1
+
+        if not self.in_flight and source.is_end(self.next_offset):
+            if self.fin_sent:
+                # everything is acknowledged, probe with an empty FIN segment until the receiver closes
+                self.in_flight[self.next_offset] = [self.next_offset, self.clock(), RETRIES, None, False]
+            else:
+                # an empty message, or a persistent connection closing after its last message
+                self.send_segment(self.next_offset, RETRIES)
+        return True
+
+    def on_ack(self, packet: Packet) -> bool:
+        # False for packets of other transfers and ACKs outside the window, which change nothing
+        if packet.has("conn_id") and packet.get("conn_id") != self.conn_id:
+            return False
+        if packet.get("ack") != 1:
+            return False
+        if self.is_wide is None:
+            self.is_wide = packet.is_wide()
+            if self.is_wide:
+                self.modulo = WIDE_SEQ_MODULO
+                self.max_in_flight = WIDE_SEQ_MODULO // 2 - 1
+                self.segment_size = self.max_segment_size
+            handshake = self.in_flight.get(0)
+            if self.is_persistent and handshake is not None and handshake[0] == 0:
+                # the empty SYN of a persistent connection, nothing later acknowledges it
+                del self.in_flight[0]
+                self.retransmit_queue = [offset for offset in self.retransmit_queue if offset != 0]
+                rtt = self.echoed_rtt(packet)
+                if rtt is None and handshake[3] is not None:
+                    rtt = self.clock() - handshake[3]
+                if rtt is not None:
+                    self.rtt.sample(rtt)
+        acked = unwrap(packet.get_wide("ack_num") - self.random_number, self.message_pointer, self.modulo)
+        if not self.message_pointer <= acked <= self.next_offset:
+            return False
+        self.last_heard = self.clock()
+        self.stalled_since = None
+        if packet.has("window"):
+            # the receiver only buffers so many segments ahead of its cumulative ACK
+            self.peer_window = max(1, packet.get("window"))
+        if acked > self.message_pointer:
+            self.message_pointer = acked
+            self.source.release(acked)
+            self.duplicate_acks = 0
+            sent_at = None
+            is_clean = True
+            acked_segments = 0
+            while self.in_flight:
+                offset = next(iter(self.in_flight))
+                if self.in_flight[offset][0] > acked:
+                    break
+                _, _, _, first_sent, sacked = self.in_flight.pop(offset)
+                is_clean = is_clean and first_sent is not None
+                sent_at = first_sent if first_sent is not None else sent_at
+                acked_segments += 0 if sacked else 1
+            self.retransmit_queue = [offset for offset in self.retransmit_queue if offset in self.in_flight]
+            # Karn's rule: without an echoed timestamp, an ACK that covers a retransmitted segment says nothing about the RTT
+            rtt = self.echoed_rtt(packet)
+            if rtt is None and is_clean and sent_at is not None:
+                rtt = self.clock() - sent_at
+            if rtt is not None:
+                self.rtt.sample(rtt)
+            else:
+                self.rtt.restore()
+            self.congestion.on_ack(acked_segments, rtt)
+        elif self.in_flight and not self.delivered:
+            self.duplicate_acks += 1
+
+        # with only a few segments in flight there can never be three duplicates (early retransmit, RFC 5827)
+        threshold = max(1, min(DUPLICATE_ACKS, len(self.in_flight) - 1))
+        if self.read_sack(packet):
+            # a hole is lost once enough segments above it have arrived (RFC 6675)
+            sacked_above = 0
+            lost = []
+            for offset in reversed(self.in_flight):
+                if self.in_flight[offset][4]:
+                    sacked_above += 1
+                elif sacked_above >= threshold and self.in_flight[offset][3] is not None:
+                    lost.append(offset)
+            self.mark_lost(lost)
+        elif self.duplicate_acks == threshold:
+            # fast retransmit: the receiver keeps asking for the oldest segment
+            self.mark_lost([next(iter(self.in_flight))])
+
+        if self.source.is_end(acked) and packet.get("fin") == 1:
+            self.in_flight = {}
+            self.peer_fin = packet.get("seq_num")
+        return True
+
+    def acknowledge_fin(self):
+        # the last datagram of a transfer, the receiver closes once it arrives
+        packet = Packet(version=WIDE_HEADER if self.is_wide else EXTENDED_HEADER)
+        packet.set("conn_id", self.conn_id)
+        packet.set_wide("seq_num", self.random_number + self.message_pointer)
+        packet.set("ack_num", (self.peer_fin or 0) + 1)
+        packet.set("ack", 1)
+        self.send(packet.to_byte())
+
+
+class Receiver:
+    # every incoming transfer of one bound socket, each in its own Connection until it is closed
+    def __init__(self, send: Callable[[bytes, Any], Any], initial_rto = 1, clock: Callable[[], float] = monotonic):
+        self.send = send
+        self.initial_rto = initial_rto
+        self.clock = clock
+        # (address, connection id) -> Connection, for every transfer still in progress
+        self.connections: Dict[Tuple[Any, int], Connection] = {}
+        # (address, connection id) -> (initial sequence number, expiry) of recently closed connections
+        self.closed: Dict[Tuple[Any, int], Tuple[int, float]] = {}
+        # connections whose FIN is waiting for the final ACK
+        self.closing: Set[Connection] = set()
+        self.next_sweep = 0.0
+
+    def sweep(self, now: float) -> List[Connection]:
+        # the connections dropped for being idle, a message that is read as it arrives has to be given up on
+        if now < self.next_sweep:
+            return []
+        self.next_sweep = now + SWEEP_INTERVAL
+        expired = []
+        for key, conn in list(self.connections.items()):
+            # connections use the monotonic clock, which is what the default event loop uses as well
+            if conn.state == Connection.STATE.RECEIVING and now - conn.last_activity > IDLE_TIMEOUT:
+                del self.connections[key]
+                conn.state = Connection.STATE.EXPIRED
+                expired.append(conn)
+        self.closed = {key: entry for key, entry in self.closed.items() if entry[1] > now}
+        return expired
+
+    def due(self, now: float) -> Optional[Connection]:
+        # the closing connection whose FIN timed out, with its timer backed off for the next attempt
+        conn = min(self.closing, key=lambda conn: conn.fin_deadline, default=None)
+        if conn is None or conn.fin_deadline > now:
+            return None
+        conn.rtt.backoff()
+        return conn
+
+    def deadline(self) -> Optional[float]:
+        # wake up for the next FIN retransmission and for the idle sweep
+        deadlines = [self.next_sweep] if self.connections else []
+        deadlines += [conn.fin_deadline for conn in self.closing]
+        return min(deadlines, default=None)
+
+    def on_ack(self, packet: Packet, addr) -> bool:
+        # final ACK of the handshake that a FIN started, False for ACKs that belong to a sender on the same socket
+        conn = self.connections.get((addr, packet.get("conn_id") if packet.has("conn_id") else 0))
+        if conn is None or conn.state != Connection.STATE.FIN_WAIT:
+            return False
+        if packet.get("ack_num") == 1:
+            if conn.fin_sent_at is not None:
+                conn.rtt.sample(self.clock() - conn.fin_sent_at)
+            self.close(conn)
+        return True
+
+    def on_data(self, packet: Packet, addr) -> Optional[Tuple[Connection, int]]:
+        # the connection a data segment belongs to and its offset, None for segments there is nothing to acknowledge for
+        key = (addr, packet.get("conn_id") if packet.has("conn_id") else 0)
+        seq_num = packet.get_wide("seq_num")
+        is_wide = packet.is_wide()
+        conn = self.connections.get(key)
+        if packet.get("syn") == 1 and (conn is None or seq_num != conn.random_number):
+            if key in self.closed and self.closed[key][0] == seq_num:
+                # retransmitted SYN of a transfer that is already delivered
+                return None
+            if conn is not None:
+                self.closing.discard(conn)
+            # builds before the offer bit sent their SYN on the wide layouts right away
+            conn = Connection(addr, key[1], seq_num, self.initial_rto, is_wide or (packet.has("wide") and packet.get("wide") == 1))
+            self.connections[key] = conn
+        if conn is None:
+            # nothing to acknowledge before the SYN of a transfer
+            return None
+
+        if packet.has("timestamp"):
+            conn.timestamp = packet.get("timestamp")
+        ends, payload = packet.get_batch()
+        offset = conn.receive(
+            seq_num, payload, packet.get("fin") == 1, packet.has("eom") and packet.get("eom") == 1, ends,
+            WIDE_SEQ_MODULO if is_wide else SEQ_MODULO, packet.has("empty") and packet.get("empty") == 1,
+        )
+        return (conn, offset)
+
+    def acknowledge(self, conn: Connection, latest: int) -> bool:
+        # True once the connection is complete and its FIN has to go out, see send_fin()
+        blocks = conn.sack_blocks(latest)
+        if conn.is_wide:
+            packet = Packet(version=WIDE_SACK_HEADER if blocks else WIDE_HEADER)
+        else:
+            packet = Packet(version=SACK_HEADER if blocks else EXTENDED_HEADER)
+        packet.set("ack", 1)
+        packet.set("conn_id", conn.conn_id)
+        packet.set("window", conn.window())
+        packet.set("timestamp", conn.timestamp)
+        packet.set("seq_num", 0)
+        packet.set_wide("ack_num", conn.random_number + conn.message_pointer)
+        if blocks:
+            packet.set("sack_count", len(blocks))
+            for i, (start, end) in enumerate(blocks, 1):
+                packet.set(f"sack_{i}_start", conn.random_number + start)
+                packet.set(f"sack_{i}_end", conn.random_number + end)
+        self.send(packet.to_byte(), conn.addr)
+
+        if not conn.is_complete():
+            return False
+        if conn.state == Connection.STATE.RECEIVING:
+            conn.state = Connection.STATE.FIN_WAIT
+            conn.fin_retries = RETRIES
+            conn.fin_started = self.clock()
+            self.closing.add(conn)
+        # the sender is still retransmitting, so it has not seen the FIN either
+        return True
+
+    def send_fin(self, conn: Connection) -> bool:
+        # False once the final ACK is given up on and the connection is closed
+        if conn.fin_retries < 1 or self.clock() - conn.fin_started >= FIN_WAIT:
+            self.close(conn)
+            return False
+
+        packet = Packet(version=WIDE_HEADER if conn.is_wide else EXTENDED_HEADER)
+        packet.set("fin", 1)
+        packet.set("ack", 1)
+        packet.set("conn_id", conn.conn_id)
+        packet.set("window", conn.window())
+        packet.set("timestamp", conn.timestamp)
+        packet.set("seq_num", 0)
+        packet.set_wide("ack_num", conn.random_number + (conn.message_length or 0))
+        self.send(packet.to_byte(), conn.addr)
+        sent_at = self.clock()
+        conn.fin_sent_at = sent_at if conn.fin_retries == RETRIES else None
+        # a backed off RTO must not keep the connection around long past FIN_WAIT
+        conn.fin_deadline = min(sent_at + conn.rtt.rto, conn.fin_started + FIN_WAIT)
+        conn.fin_retries -= 1
+        return True
+
+    def close(self, conn: Connection):
+        self.connections.pop(conn.key, None)
+        self.closing.discard(conn)
+        self.closed[conn.key] = (conn.random_number, self.clock() + IDLE_TIMEOUT)
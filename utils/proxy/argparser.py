@@ -1,7 +1,8 @@
 import argparse
+from typing import Optional
 
-from utils.constants import PROXY_LISTEN_IP, PROXY_LISTEN_PORT, PROXY_TARGET_IP, PROXY_TARGET_PORT
-from utils.validations import validate_ipv4, validate_port, validate_range, validate_range_input
+from utils.constants import PROXY_LISTEN_IP, PROXY_LISTEN_PORT, PROXY_MEMORY, PROXY_TARGET_IP, PROXY_TARGET_PORT
+from utils.validations import validate_file, validate_flow, validate_greater_than, validate_ipv4, validate_jitter, validate_loss_model, validate_port, validate_range, validate_range_input, validate_rate, validate_reorder
 
 class ArgParser:
     def __init__(self):
@@ -78,6 +79,149 @@ class ArgParser:
             type=validate_range_input(min=0),
             help="Delay time in milliseconds(fixed or range. eg) 1000 for 1 second, or 1000-2000 for 1-2 seconds",
         )
+        parser.add_argument(
+            "--client-rate",
+            "--crate",
+            default=0,
+            type=validate_rate,
+            help="Bandwidth of the link for packets from the client in bits/s, eg) 500k or 10M. 0 for unlimited.",
+        )
+        parser.add_argument(
+            "--client-queue",
+            "--cqueue",
+            default=0,
+            type=lambda value: validate_greater_than(value, 0),
+            help="Packets from the client that can wait for the link before new ones are dropped. 0 for unlimited.",
+        )
+        parser.add_argument(
+            "--client-red",
+            "--cred",
+            action="store_true",
+            help="Drop packets from the client early as the queue fills (RED) instead of only when it is full.",
+        )
+        parser.add_argument(
+            "--server-rate",
+            "--srate",
+            default=0,
+            type=validate_rate,
+            help="Bandwidth of the link for packets from the server in bits/s, eg) 500k or 10M. 0 for unlimited.",
+        )
+        parser.add_argument(
+            "--server-queue",
+            "--squeue",
+            default=0,
+            type=lambda value: validate_greater_than(value, 0),
+            help="Packets from the server that can wait for the link before new ones are dropped. 0 for unlimited.",
+        )
+        parser.add_argument(
+            "--server-red",
+            "--sred",
+            action="store_true",
+            help="Drop packets from the server early as the queue fills (RED) instead of only when it is full.",
+        )
+        parser.add_argument(
+            "--client-loss",
+            "--closs",
+            default=None,
+            type=validate_loss_model,
+            help="Burst loss (Gilbert-Elliott) for packets from the client: P,R[,LOSS_GOOD[,LOSS_BAD]] in %%, the chances to enter and leave a burst and to lose a packet outside and inside one. eg) 1,30",
+        )
+        parser.add_argument(
+            "--client-jitter",
+            "--cjitter",
+            default=None,
+            type=validate_jitter,
+            help="Delay in milliseconds added to every packet from the client, normal:MEAN,STDDEV or pareto:SCALE,SHAPE. eg) normal:20,5",
+        )
+        parser.add_argument(
+            "--client-reorder",
+            "--creorder",
+            default=(0, 1),
+            type=validate_reorder,
+            help="Chance(0%% -100%%) that a packet from the client is held back until DISTANCE later ones went ahead: PERCENT[,DISTANCE]. eg) 5,3",
+        )
+        parser.add_argument(
+            "--client-duplicate",
+            "--cdup",
+            default=0,
+            type=validate_range(min=0, max=100),
+            help="Chance(0%% -100%%) that a packet from the client is sent twice.",
+        )
+        parser.add_argument(
+            "--server-loss",
+            "--sloss",
+            default=None,
+            type=validate_loss_model,
+            help="Burst loss (Gilbert-Elliott) for packets from the server: P,R[,LOSS_GOOD[,LOSS_BAD]] in %%, the chances to enter and leave a burst and to lose a packet outside and inside one. eg) 1,30",
+        )
+        parser.add_argument(
+            "--server-jitter",
+            "--sjitter",
+            default=None,
+            type=validate_jitter,
+            help="Delay in milliseconds added to every packet from the server, normal:MEAN,STDDEV or pareto:SCALE,SHAPE. eg) normal:20,5",
+        )
+        parser.add_argument(
+            "--server-reorder",
+            "--sreorder",
+            default=(0, 1),
+            type=validate_reorder,
+            help="Chance(0%% -100%%) that a packet from the server is held back until DISTANCE later ones went ahead: PERCENT[,DISTANCE]. eg) 5,3",
+        )
+        parser.add_argument(
+            "--server-duplicate",
+            "--sdup",
+            default=0,
+            type=validate_range(min=0, max=100),
+            help="Chance(0%% -100%%) that a packet from the server is sent twice.",
+        )
+        parser.add_argument(
+            "--seed",
+            default=None,
+            type=lambda value: validate_greater_than(value, 0),
+            help="Seed of the drop, delay and impairment decisions, the same seed and traffic give the same run.",
+        )
+        parser.add_argument(
+            "--trace",
+            default=None,
+            help="Write every packet with the drop/delay decision taken for it to a pcapng file, for Wireshark and --replay.",
+        )
+        parser.add_argument(
+            "--replay",
+            default=None,
+            type=validate_file,
+            help="Take the drop/delay decisions from a file written with --trace, packet by packet, instead of drawing them.",
+        )
+        parser.add_argument(
+            "--memory",
+            "--mem",
+            default=PROXY_MEMORY,
+            type=lambda value: validate_greater_than(value, 1),
+            help="Number of recent datagrams remembered to count retransmissions.",
+        )
+        parser.add_argument(
+            "--flow",
+            action="append",
+            default=[],
+            type=validate_flow,
+            help="Drop/delay settings for the clients at IP[:PORT] that override the ones above, repeatable. eg) 127.0.0.2,cdrop=10,sdelay=50,sdt=100-200",
+        )
+        parser.add_argument(
+            "--headless",
+            action="store_true",
+            help="Run without the interactive settings and the live graph, for CI and servers without a display.",
+        )
+        parser.add_argument(
+            "--metrics-file",
+            default=None,
+            help="File rewritten every second with the proxy counters, as JSON if it ends in .json and as Prometheus text otherwise.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            default=None,
+            type=validate_port,
+            help="Serve the proxy counters at http://127.0.0.1:PORT/metrics (Prometheus text) and /metrics.json.",
+        )
         args = parser.parse_args()
 
         self.listen_ip = args.listen_ip
@@ -90,6 +234,28 @@ class ArgParser:
         self.server_drop = args.server_drop
         self.server_delay = args.server_delay
         self.server_delay_time = args.server_delay_time
+        self.memory: int = args.memory
+        self.client_rate: int = args.client_rate
+        self.client_queue: int = args.client_queue
+        self.client_red: bool = args.client_red
+        self.server_rate: int = args.server_rate
+        self.server_queue: int = args.server_queue
+        self.server_red: bool = args.server_red
+        self.client_loss: Optional[tuple] = args.client_loss
+        self.client_jitter: Optional[tuple] = args.client_jitter
+        self.client_reorder: tuple = args.client_reorder
+        self.client_duplicate = args.client_duplicate
+        self.server_loss: Optional[tuple] = args.server_loss
+        self.server_jitter: Optional[tuple] = args.server_jitter
+        self.server_reorder: tuple = args.server_reorder
+        self.server_duplicate = args.server_duplicate
+        self.seed: Optional[int] = args.seed
+        self.trace: Optional[str] = args.trace
+        self.replay: Optional[str] = args.replay
+        self.flows = args.flow
+        self.headless: bool = args.headless
+        self.metrics_file: Optional[str] = args.metrics_file
+        self.metrics_port: Optional[int] = args.metrics_port
 
 
     def __str__(self):
@@ -0,0 +1,65 @@
+import random
+from bisect import bisect_right
+from collections import deque
+from typing import Optional
+
+
+class Bottleneck:
+    # a link of one direction: a token bucket refilled at config["rate"] bits/s drains a FIFO queue of at most
+    # config["queue"] datagrams, which drops arrivals at its tail or, with config["red"], early (RED)
+    BURST = 3000 # bytes that may pass back to back on an idle link
+    RED_MIN = 0.25 # average queue, as a fraction of the limit, where early drops start
+    RED_MAX = 0.75 # and where every arrival is dropped
+    RED_MAX_P = 0.1 # drop probability just below RED_MAX
+    RED_WEIGHT = 0.002 # weight of each arrival in the average queue length
+
+    def __init__(self, config: dict, rng: Optional[random.Random] = None):
+        # read on every datagram, so settings changed from the CLI apply right away
+        self.config = config
+        # seeded by the proxy so early drops are reproducible
+        self.random = rng or random.Random()
+        self.tokens = float(Bottleneck.BURST)
+        self.last_refill = 0.0
+        # departure times of the queued datagrams, oldest first
+        self.departures = deque()
+        self.average = 0.0
+
+    def __len__(self):
+        return len(self.departures)
+
+    def depth(self, now: float) -> int:
+        # datagrams still waiting at now. Departed ones are only dropped on the next enqueue, and this is read from
+        # other threads, so it counts instead of popping them
+        return len(self.departures) - bisect_right(self.departures, now)
+
+    def enqueue(self, size: int, now: float) -> Optional[float]:
+        # seconds the datagram waits for the link, or None when the queue drops it
+        rate = self.config.get("rate", 0)
+        while self.departures and self.departures[0] <= now:
+            self.departures.popleft()
+        if not rate:
+            self.tokens = float(Bottleneck.BURST)
+            self.last_refill = now
+            return 0.0
+
+        limit = self.config.get("queue", 0)
+        if limit:
+            if self.config.get("red"):
+                self.average += Bottleneck.RED_WEIGHT * (len(self.departures) - self.average)
+                low, high = Bottleneck.RED_MIN * limit, Bottleneck.RED_MAX * limit
+                if self.average >= high:
+                    return None
+                if self.average > low and self.random.random() < Bottleneck.RED_MAX_P * (self.average - low) / (high - low):
+                    return None
+            if len(self.departures) >= limit:
+                return None
+
+        # tokens go negative while datagrams queue up, the debt is how long the newest one waits
+        bytes_per_second = rate / 8
+        self.tokens = min(float(Bottleneck.BURST), self.tokens + (now - self.last_refill) * bytes_per_second)
+        self.last_refill = now
+        self.tokens -= size
+        wait = max(0.0, -self.tokens / bytes_per_second)
+        if wait > 0:
+            self.departures.append(now + wait)
+        return wait
@@ -0,0 +1,112 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from typing import Callable, Optional
+
+from utils.proxy.metrics import LatencyHistogram
+
+PREFIX = "reliable_udp_proxy"
+
+
+def to_prometheus(snapshot: dict) -> str:
+    # Prometheus text exposition format, every metric family with the series of both sides grouped under its TYPE
+    sides = ("client", "server")
+    quantile = lambda value: value if value is not None else "NaN"
+    lines = [f"# TYPE {PREFIX}_datagrams_total counter"]
+    for side in sides:
+        for event in ("sent", "received", "dropped", "retransmitted", "duplicated", "reordered"):
+            lines.append(f'{PREFIX}_datagrams_total{{side="{side}",event="{event}"}} {snapshot[side][event]}')
+    lines.append(f"# TYPE {PREFIX}_latency_milliseconds summary")
+    for side in sides:
+        latency = snapshot[side]["latency"]
+        for q in LatencyHistogram.PERCENTILES:
+            lines.append(f'{PREFIX}_latency_milliseconds{{side="{side}",quantile="{q}"}} {quantile(latency[f"p{round(q * 100)}"])}')
+        lines.append(f'{PREFIX}_latency_milliseconds_sum{{side="{side}"}} {(latency["mean"] or 0) * latency["count"]}')
+        lines.append(f'{PREFIX}_latency_milliseconds_count{{side="{side}"}} {latency["count"]}')
+    lines.append(f"# TYPE {PREFIX}_queue_depth gauge")
+    for side in sides:
+        lines.append(f'{PREFIX}_queue_depth{{side="{side}"}} {snapshot[side]["queue"]["depth"]}')
+    lines.append(f"# TYPE {PREFIX}_queue_dropped_total counter")
+    for side in sides:
+        lines.append(f'{PREFIX}_queue_dropped_total{{side="{side}"}} {snapshot[side]["queue"]["dropped"]}')
+    lines.append(f"# TYPE {PREFIX}_queue_delay_milliseconds summary")
+    for side in sides:
+        delay = snapshot[side]["queue"]["delay"]
+        for q in LatencyHistogram.PERCENTILES:
+            lines.append(f'{PREFIX}_queue_delay_milliseconds{{side="{side}",quantile="{q}"}} {quantile(delay[f"p{round(q * 100)}"])}')
+        lines.append(f'{PREFIX}_queue_delay_milliseconds_sum{{side="{side}"}} {(delay["mean"] or 0) * delay["count"]}')
+        lines.append(f'{PREFIX}_queue_delay_milliseconds_count{{side="{side}"}} {delay["count"]}')
+    lines.append(f"# TYPE {PREFIX}_flows gauge")
+    lines.append(f"{PREFIX}_flows {snapshot['flows']}")
+    lines.append(f"# TYPE {PREFIX}_delayed gauge")
+    lines.append(f"{PREFIX}_delayed {snapshot['delayed']}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    # publishes snapshots for benchmarks to scrape: rewritten to a file every interval (JSON for *.json,
+    # Prometheus text otherwise) and/or served over HTTP at /metrics and /metrics.json
+    INTERVAL = 1
+
+    def __init__(self, snapshot: Callable[[], dict], path: Optional[str] = None, port: Optional[int] = None, interval = INTERVAL):
+        self.snapshot = snapshot
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.stopped = Event()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def render(self, as_json: bool) -> str:
+        snapshot = self.snapshot()
+        return json.dumps(snapshot) if as_json else to_prometheus(snapshot)
+
+    def write(self):
+        if self.path is None:
+            return
+        # replaced in one step, a reader never sees half a file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.render(self.path.endswith(".json")))
+        os.replace(temporary, self.path)
+
+    def serve(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/metrics", "/metrics.json"):
+                    self.send_error(404)
+                    return
+                body = exporter.render(self.path.endswith(".json")).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json" if self.path.endswith(".json") else "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port or 0), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def start(self):
+        if self.port is not None:
+            self.serve()
+        if self.path is not None:
+            Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        # the last numbers of a run are kept for whoever reads the file afterwards
+        self.write()
@@ -0,0 +1,176 @@
+import random
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class Decision:
+    # what happens to one datagram, drawn when it arrives or replayed from a trace. seq counts the arrivals
+    # of its direction, drop is None, "drop" or "loss", delay is in milliseconds and hold the later datagrams
+    # that go ahead of it
+    def __init__(self, seq: int, drop: Optional[str] = None, delay = 0.0, duplicate = False, hold = 0):
+        self.seq = seq
+        self.drop = drop
+        self.delay = delay
+        self.duplicate = duplicate
+        self.hold = hold
+
+
+class ImpairmentModel:
+    # one effect on the datagrams of a direction. apply() reads its settings, those of the direction's config with
+    # the flow's drop and delay on top, and changes the decision the models before it made. Every model draws from
+    # a generator of its own, so turning one on does not change what the others draw for the same seed
+    name = "none"
+
+    def __init__(self, random: random.Random):
+        self.random = random
+
+    def chance(self, percent) -> bool:
+        return self.random.random() < percent / 100
+
+    def apply(self, decision: Decision, settings: dict):
+        pass
+
+
+class Reorder(ImpairmentModel):
+    # (%, distance): datagrams held back until `distance` later ones went ahead of them
+    name = "reorder"
+
+    def apply(self, decision: Decision, settings: dict):
+        percent, distance = settings.get("reorder") or (0, 0)
+        decision.hold = distance if percent and self.chance(percent) else 0
+
+
+class GilbertElliott(ImpairmentModel):
+    # (p, r, loss in good, loss in bad): burst loss, all in %
+    name = "loss"
+
+    def __init__(self, random: random.Random):
+        super().__init__(random)
+        # channel state, starts good
+        self.bad = False
+
+    def apply(self, decision: Decision, settings: dict):
+        loss = settings.get("loss")
+        if not loss:
+            return
+        p, r, loss_good, loss_bad = loss
+        # the channel moves first, then the datagram is lost with the chance of the state it finds. It moves on
+        # every datagram, dropped by the other rules or not
+        self.bad = not self.chance(r) if self.bad else self.chance(p)
+        if self.chance(loss_bad if self.bad else loss_good):
+            decision.drop = "loss"
+
+
+class Drop(ImpairmentModel):
+    # % of datagrams dropped, ahead of any other reason
+    name = "drop"
+
+    def apply(self, decision: Decision, settings: dict):
+        if self.chance(settings.get("drop", 0)):
+            decision.drop = "drop"
+
+
+class Delay(ImpairmentModel):
+    # % of datagrams delayed by a uniform (min, max) "delay_time" in milliseconds
+    name = "delay"
+
+    def apply(self, decision: Decision, settings: dict):
+        delay_min, delay_max = settings.get("delay_time") or (0, 0)
+        delay = self.random.uniform(delay_min, delay_max or delay_min)
+        if self.chance(settings.get("delay", 0)) and not decision.drop:
+            decision.delay += delay
+
+
+class Jitter(ImpairmentModel):
+    # ("normal", mean, stddev) or ("pareto", scale, shape): milliseconds added to every datagram
+    name = "jitter"
+
+    def apply(self, decision: Decision, settings: dict):
+        jitter = settings.get("jitter")
+        if not jitter or decision.drop:
+            return
+        distribution, first, second = jitter
+        if distribution == "normal":
+            decision.delay += max(0.0, self.random.gauss(first, second))
+        else:
+            # pareto: mostly small, with a heavy tail of late datagrams
+            decision.delay += first * (self.random.paretovariate(second) - 1)
+
+
+class Duplicate(ImpairmentModel):
+    # % of datagrams sent twice
+    name = "duplicate"
+
+    def apply(self, decision: Decision, settings: dict):
+        if not decision.drop:
+            decision.duplicate = self.chance(settings.get("duplicate", 0))
+
+
+# applied in this order, a model sees what the ones before it decided
+MODELS = {
+    Reorder.name: Reorder,
+    GilbertElliott.name: GilbertElliott,
+    Drop.name: Drop,
+    Delay.name: Delay,
+    Jitter.name: Jitter,
+    Duplicate.name: Duplicate,
+}
+
+
+def create_impairment_model(name: str, random: random.Random) -> ImpairmentModel:
+    try:
+        return MODELS[name](random)
+    except KeyError:
+        raise ValueError(f"Unknown impairment model '{name}', expected one of {', '.join(MODELS)}")
+
+
+class Impairment:
+    # the models of one direction of the link, see MODELS, read from config on every datagram like the bottleneck
+    REORDER_TIMEOUT = 0.1 # seconds a held back datagram waits for later ones before it goes anyway
+
+    def __init__(self, config: dict, seed: Optional[int] = None, name = "", schedule: Optional[Dict[int, Decision]] = None):
+        self.config = config
+        # decisions of a recorded run by seq, replayed instead of drawn. Arrivals past its end are drawn
+        self.schedule = schedule or {}
+        self.arrivals = 0
+        # a generator per model, and one for the random early detection of the bottleneck
+        self.random = {
+            model: random.Random(None if seed is None else f"{seed}:{name}:{model}") for model in (*MODELS, "red")
+        }
+        self.models = [create_impairment_model(model, self.random[model]) for model in MODELS]
+        # [datagrams still to go ahead, deadline, send] of the held back datagrams, oldest first
+        self.held = deque()
+
+    def decide(self, drop_percent: float, delay_percent: float, delay_time: Tuple[float, float]) -> Decision:
+        # drop and delay are those of the datagram's flow, which may differ from the direction's
+        seq = self.arrivals
+        self.arrivals += 1
+        if seq in self.schedule:
+            return self.schedule[seq]
+        settings = { **self.config, "drop": drop_percent, "delay": delay_percent, "delay_time": delay_time }
+        decision = Decision(seq)
+        for model in self.models:
+            model.apply(decision, settings)
+        return decision
+
+    def hold(self, distance: int, send: Callable[[], None], now: float):
+        self.held.append([distance, now + Impairment.REORDER_TIMEOUT, send])
+
+    def passed(self) -> List[Callable[[], None]]:
+        # a datagram went ahead of every held one, those it was the last for go now
+        released = []
+        for entry in list(self.held):
+            entry[0] -= 1
+            if entry[0] <= 0:
+                self.held.remove(entry)
+                released.append(entry[2])
+        return released
+
+    def expired(self, now: float) -> List[Callable[[], None]]:
+        released = []
+        while self.held and self.held[0][1] <= now:
+            released.append(self.held.popleft()[2])
+        return released
+
+    def next_deadline(self) -> Optional[float]:
+        return self.held[0][1] if self.held else None
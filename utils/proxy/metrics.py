@@ -0,0 +1,103 @@
+from collections import deque
+from typing import Optional
+
+
+class LatencyHistogram:
+    # HDR-style histogram: values below 2^SUB_BUCKET_BITS microseconds get a bucket each, larger ones share
+    # half as many buckets per power of two, so every bucket is within 1/64 of its value and memory stays fixed
+    SUB_BUCKET_BITS = 7
+    PERCENTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def index(value: int) -> int:
+        bits = LatencyHistogram.SUB_BUCKET_BITS
+        if value < 1 << bits:
+            return value
+        shift = value.bit_length() - bits
+        return (1 << bits) + (shift - 1) * (1 << (bits - 1)) + (value >> shift) - (1 << (bits - 1))
+
+    @staticmethod
+    def value_at(index: int) -> int:
+        # lower bound of a bucket, the inverse of index()
+        bits = LatencyHistogram.SUB_BUCKET_BITS
+        if index < 1 << bits:
+            return index
+        shift, offset = divmod(index - (1 << bits), 1 << (bits - 1))
+        return (offset + (1 << (bits - 1))) << (shift + 1)
+
+    def record(self, milliseconds: float):
+        index = LatencyHistogram.index(int(milliseconds * 1000))
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                # middle of the bucket, never past the largest value seen. Buckets below 128 us hold a single value
+                low, high = LatencyHistogram.value_at(index), LatencyHistogram.value_at(index + 1)
+                return min((low if high - low == 1 else (low + high) / 2) / 1000, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        summary = { "count": self.count, "mean": self.total / self.count if self.count else None }
+        for q in LatencyHistogram.PERCENTILES:
+            summary[f"p{round(q * 100)}"] = self.percentile(q)
+        summary["max"] = self.max if self.count else None
+        return summary
+
+
+class TrafficStats:
+    # counters of the datagrams one side sent through the proxy, with recent latencies for the graph
+    # and a histogram of all of them
+    RECENT = 50
+
+    def __init__(self, recent = RECENT):
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.retransmitted = 0
+        # impairments: extra copies sent and datagrams held back behind later ones
+        self.duplicated = 0
+        self.reordered = 0
+        self.latency = deque(maxlen=recent)
+        self.histogram = LatencyHistogram()
+        # bottleneck queue of this direction: datagrams waiting as of the last snapshot, tail/RED drops and time spent waiting
+        self.queue_depth = 0
+        self.queue_dropped = 0
+        self.queue_delay = LatencyHistogram()
+
+    def record_latency(self, milliseconds: float):
+        self.latency.append(milliseconds)
+        self.histogram.record(milliseconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+            "retransmitted": self.retransmitted,
+            "duplicated": self.duplicated,
+            "reordered": self.reordered,
+            "latency": self.histogram.summary(),
+            "queue": {
+                "depth": self.queue_depth,
+                "dropped": self.queue_dropped,
+                "delay": self.queue_delay.summary(),
+            },
+        }
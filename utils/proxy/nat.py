@@ -0,0 +1,67 @@
+from selectors import EVENT_READ, BaseSelector
+from socket import AF_INET, SOCK_DGRAM, socket
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+
+class Flow:
+    # one client behind the proxy, talking to the server from an upstream socket of its own
+    def __init__(self, client: Tuple[str, int], upstream: socket, config: Optional[dict] = None):
+        self.client = client
+        self.upstream = upstream
+        self.last_activity = monotonic()
+        # "client"/"server" -> drop/delay/delay_time settings that override the proxy's for this flow
+        self.config = config or { "client": {}, "server": {} }
+
+
+class NATTable:
+    IDLE_TIMEOUT = 60 # seconds after which a flow without datagrams in either direction is closed
+    SWEEP_INTERVAL = 1
+
+    def __init__(self, selector: BaseSelector, server: Tuple[str, int], rules: Optional[List[tuple]] = None, idle_timeout = IDLE_TIMEOUT):
+        self.selector = selector
+        self.server = server
+        self.idle_timeout = idle_timeout
+        # (ip, port or None for any port, overrides) applied to new flows from a matching client
+        self.rules = rules or []
+        self.flows: Dict[Tuple[str, int], Flow] = {}
+        self.next_sweep = monotonic() + NATTable.SWEEP_INTERVAL
+
+    def flow(self, client: Tuple[str, int]) -> Flow:
+        flow = self.flows.get(client)
+        if flow is None:
+            upstream = socket(AF_INET, SOCK_DGRAM)
+            # the server sees every client on a port of its own and replies to it there
+            upstream.connect(self.server)
+            upstream.setblocking(False)
+            flow = Flow(client, upstream, self.config_for(client))
+            self.flows[client] = flow
+            self.selector.register(upstream, EVENT_READ, flow)
+        flow.last_activity = monotonic()
+        return flow
+
+    def config_for(self, client: Tuple[str, int]) -> dict:
+        config = { "client": {}, "server": {} }
+        for ip, port, overrides in self.rules:
+            if ip == client[0] and port in (None, client[1]):
+                for target in config:
+                    config[target].update(overrides.get(target, {}))
+        return config
+
+    def expire(self):
+        now = monotonic()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + NATTable.SWEEP_INTERVAL
+        for client, flow in list(self.flows.items()):
+            if now - flow.last_activity > self.idle_timeout:
+                self.close(flow)
+
+    def close(self, flow: Flow):
+        self.flows.pop(flow.client, None)
+        self.selector.unregister(flow.upstream)
+        flow.upstream.close()
+
+    def close_all(self):
+        for flow in list(self.flows.values()):
+            self.close(flow)
@@ -0,0 +1,47 @@
+import heapq
+import itertools
+from threading import Condition
+from time import monotonic
+
+
+class DelayScheduler:
+    # a single thread releases delayed datagrams from a min-heap of release times,
+    # instead of parking one sleeping worker per datagram
+    def __init__(self):
+        self.heap = []
+        # breaks ties between equal release times in the order the datagrams arrived
+        self.counter = itertools.count()
+        self.condition = Condition()
+        # cleared by stop() only, so a stop() before run() starts still ends it
+        self.running = True
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, delay: float, callback, *args):
+        release_time = monotonic() + delay
+        with self.condition:
+            heapq.heappush(self.heap, (release_time, next(self.counter), callback, args))
+            # only a new earliest deadline shortens the current wait
+            if self.heap[0][0] == release_time:
+                self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and (not self.heap or self.heap[0][0] > monotonic()):
+                    self.condition.wait(self.heap[0][0] - monotonic() if self.heap else None)
+                if not self.running:
+                    return
+                now = monotonic()
+                due = []
+                while self.heap and self.heap[0][0] <= now:
+                    due.append(heapq.heappop(self.heap))
+            # callbacks send outside the lock, so the receiving thread never waits on a sendto
+            for _, _, callback, args in due:
+                callback(*args)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
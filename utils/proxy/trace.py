@@ -0,0 +1,98 @@
+import socket
+import struct
+import time
+from typing import Dict, Optional, Tuple
+
+from utils.proxy.impairment import Decision
+
+# pcapng blocks, https://www.ietf.org/archive/id/draft-ietf-opsawg-pcapng-02.html
+SECTION_HEADER = 0x0A0D0D0A
+INTERFACE_DESCRIPTION = 0x00000001
+ENHANCED_PACKET = 0x00000006
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+LINKTYPE_RAW = 101 # packets start at their IPv4 header
+OPTION_END = 0
+OPTION_COMMENT = 1
+
+
+def pad(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 4)
+
+
+def block(block_type: int, body: bytes) -> bytes:
+    length = 12 + len(body)
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+
+def checksum(header: bytes) -> int:
+    total = sum(struct.unpack(f"!{len(header) // 2}H", header))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def ipv4_udp(data: bytes, source: Tuple[str, int], destination: Tuple[str, int]) -> bytes:
+    # the proxy only sees payloads, the headers are rebuilt around them as they travel end to end,
+    # client to server and back, so the dissector finds the protocol on the usual ports
+    addresses = socket.inet_aton(source[0]) + socket.inet_aton(destination[0])
+    header = struct.pack("!BBHHHBBH", 0x45, 0, 28 + len(data), 0, 0, 64, socket.IPPROTO_UDP, 0) + addresses
+    header = header[:10] + struct.pack("!H", checksum(header)) + header[12:]
+    # a zero UDP checksum means none over IPv4
+    return header + struct.pack("!HHHH", source[1], destination[1], 8 + len(data), 0) + data
+
+
+class TraceWriter:
+    # every datagram the proxy handled as a pcapng file: Wireshark opens it with wireshark.lua, and the comment
+    # of each packet holds the decision taken for it, eg) "client seq=12 drop=- delay=20.125 wait=0.000 dup=0 hold=0"
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        section = struct.pack("<IHHq", BYTE_ORDER_MAGIC, 1, 0, -1) + struct.pack("<HH", OPTION_END, 0)
+        interface = struct.pack("<HHI", LINKTYPE_RAW, 0, 0) + struct.pack("<HH", OPTION_END, 0)
+        self.file.write(block(SECTION_HEADER, section) + block(INTERFACE_DESCRIPTION, interface))
+
+    def record(self, side: str, data: bytes, source, destination, decision: Decision, drop: Optional[str], wait: float):
+        packet = ipv4_udp(data, source, destination)
+        comment = (
+            f"{side} seq={decision.seq} drop={drop or '-'} delay={decision.delay:.3f} "
+            f"wait={wait:.3f} dup={int(decision.duplicate)} hold={decision.hold}"
+        ).encode()
+        # timestamps in microseconds, the default resolution of an interface
+        timestamp = int(time.time() * 1_000_000)
+        body = (
+            struct.pack("<IIIII", 0, timestamp >> 32, timestamp & 0xFFFFFFFF, len(packet), len(packet))
+            + pad(packet)
+            + struct.pack("<HH", OPTION_COMMENT, len(comment)) + pad(comment)
+            + struct.pack("<HH", OPTION_END, 0)
+        )
+        self.file.write(block(ENHANCED_PACKET, body))
+
+    def close(self):
+        self.file.close()
+
+
+def read_schedule(path: str) -> Dict[str, Dict[int, Decision]]:
+    # the decisions of a trace written by TraceWriter, by side and seq. Queue drops are left out,
+    # the bottleneck decides them again from the traffic of the new run
+    schedule = { "client": {}, "server": {} }
+    with open(path, "rb") as file:
+        data = file.read()
+    offset = 0
+    while offset + 12 <= len(data):
+        block_type, length = struct.unpack_from("<II", data, offset)
+        if block_type == ENHANCED_PACKET:
+            captured = struct.unpack_from("<I", data, offset + 20)[0]
+            options = offset + 28 + captured + (-captured % 4)
+            while options < offset + length - 4:
+                code, size = struct.unpack_from("<HH", data, options)
+                if code == OPTION_END:
+                    break
+                if code == OPTION_COMMENT:
+                    side, *fields = data[options + 4:options + 4 + size].decode().split()
+                    values = dict(field.split("=") for field in fields)
+                    drop = values["drop"] if values["drop"] in ("drop", "loss") else None
+                    schedule[side][int(values["seq"])] = Decision(
+                        int(values["seq"]), drop, float(values["delay"]), values["dup"] == "1", int(values["hold"])
+                    )
+                options += 4 + size + (-size % 4)
+        offset += length
+    return schedule
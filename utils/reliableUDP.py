@@ -1,22 +1,63 @@
 import ipaddress
-from socket import AF_INET, SOCK_DGRAM, socket 
-from typing import Any 
-from utils.packet import Packet 
-from utils.fsm import FSM
-from random import randint
+import sys
+from socket import AF_INET, IPPROTO_IP, SOCK_DGRAM, socket 
+from collections import deque
+from threading import RLock, Timer
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union 
+from utils.packet import BATCH_LIMIT, DATA_HEADER_SIZE, MAX_SEGMENT_SIZE, Packet 
+from utils.fsm import FSM, FSMStats
+from utils.rtt import RTTEstimator
+from utils.congestion import create_congestion_control
+from utils.connection import Connection
+from utils.protocol import Receiver, Sender
+from utils.sequence import SEQ_MODULO
+from utils.stream import SendBuffer
+from time import monotonic
 
 class ReliableUDP():
-    BUFFER_SIZE = 1024
-    RETRIES = 20
-    PAYLOAD_SIZE = 1
+    # blocking socket transport of the protocol in utils/protocol.py, every call runs its machine until it is done
+    BUFFER_SIZE = 65535
+    DEFAULT_MTU = 1500
+    IP_MTU = 14 # linux getsockopt option, not exposed by the socket module
+    IP_UDP_HEADER_SIZE = 20 + 8
 
-    def __init__(self, timeout=1):
+    def __init__(self, timeout=1, segment_size: Optional[int] = None, window_size = 8, congestion_control = "reno", batch_delay: Optional[float] = None, profile = False):
         self.socket: socket
-        self.message_pointer = 0 
-        self.random_number = 0
-        self.prev_random_number = None
-        self.target_addr: Any = None
-        self.retransmission_timeout = timeout
+        if segment_size is not None and not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise ValueError(f"Segment size {segment_size} does not fit a UDP datagram, expected 1 to {MAX_SEGMENT_SIZE} bytes")
+        self.rtt = RTTEstimator(initial_rto=timeout)
+        self.segment_size = segment_size
+        self.window_size = window_size
+        self.congestion = create_congestion_control(congestion_control)
+        # sender: the latest transfer, kept for its counters
+        self.sender: Optional[Sender] = None
+        # sender: address, open buffer, transfer and Sender of a persistent connection, see connect()
+        self.peer: Optional[Tuple[str, int]] = None
+        self.stream: Optional[SendBuffer] = None
+        self.transfer: Optional[Callable[[Optional[int]], bool]] = None
+        self.connection: Optional[Sender] = None
+        # sender: seconds a message on a persistent connection may wait to share a segment with the ones after it, None sends right away
+        self.batch_delay = batch_delay
+        self.batch_size = 0
+        self.batch_timer: Optional[Timer] = None
+        # the batch timer flushes from its own thread
+        self.lock = RLock()
+        # receiver: every connection of the bound socket
+        self.receiver = Receiver(lambda data, addr: self.socket.sendto(data, addr), self.rtt.initial_rto)
+        # receiver: complete connections whose message has not been returned yet
+        self.completed = deque()
+        # receiver: built on the first receive() and reused by every later one
+        self.receive_fsm: Optional[FSM] = None
+        self.is_ready: Callable[[Connection], bool] = lambda conn: False
+        # time spent in every state and transition of the send and receive machines, see FSMStats
+        self.send_stats: Optional[FSMStats] = FSMStats() if profile else None
+        self.recv_stats: Optional[FSMStats] = FSMStats() if profile else None
+        # sender: the send machine, shared by every transfer
+        self.send_fsm = self.create_sender()
+
+    @property
+    def retransmission_timeout(self) -> float:
+        return self.rtt.rto
 
     def create(self):
         self.socket = socket(AF_INET, SOCK_DGRAM)
@@ -28,176 +69,298 @@ class ReliableUDP():
     def flush_recv_buffer(self):
         try:
             self.socket.setblocking(False)
-            while _ := self.socket.recvfrom(65535):
+            while _ := self.socket.recvfrom(ReliableUDP.BUFFER_SIZE):
                 continue
         except BlockingIOError:
             pass
         finally:
             self.socket.setblocking(True)
 
-    def send(self, message, ip, port):
+    @staticmethod
+    def path_mtu(ip, port) -> int:
+        if not sys.platform.startswith("linux"):
+            return ReliableUDP.DEFAULT_MTU
+        probe = socket(AF_INET, SOCK_DGRAM)
+        try:
+            probe.connect((str(ipaddress.ip_address(ip)), port))
+            return probe.getsockopt(IPPROTO_IP, ReliableUDP.IP_MTU)
+        except OSError:
+            return ReliableUDP.DEFAULT_MTU
+        finally:
+            probe.close()
+
+    def get_segment_size(self, ip, port) -> int:
+        return self.segment_size or ReliableUDP.path_segment_size(ip, port)
+
+    @staticmethod
+    def path_segment_size(ip, port) -> int:
+        # largest payload that fits the path MTU (or a UDP datagram) without IP fragmentation
+        mtu = min(ReliableUDP.path_mtu(ip, port), ReliableUDP.BUFFER_SIZE)
+        # a single segment must also stay within half the sequence space, or its ACK cannot be told apart (loopback MTU is 64 KiB)
+        return min(mtu - ReliableUDP.IP_UDP_HEADER_SIZE - DATA_HEADER_SIZE, SEQ_MODULO // 2 - 1)
+
+    def connect(self, ip, port):
+        # one handshake for many messages, each send() then costs a single round trip until disconnect()
+        self.peer = (ip, port)
+        self.stream = SendBuffer(None, coalesce=self.batch_delay is not None)
+        self.batch_size = self.get_segment_size(ip, port)
+        self.transfer = self.open_transfer(self.stream, ip, port)
+        self.connection = self.sender
+        # the handshake shows whether the receiver frames messages, builds before persistent connections do not
+        if not self.transfer(0):
+            self.transfer = self.stream = self.connection = None
+            raise ConnectionError(f"No answer from {ip}:{port}")
+        if self.sender is None or not self.sender.is_wide:
+            self.transfer = self.stream = self.connection = None
+            raise ConnectionError(f"{ip}:{port} does not support persistent connections")
+        return self
+
+    def disconnect(self):
+        with self.lock:
+            # raises while messages are not acknowledged, the connection stays open for another try then
+            self.flush()
+            transfer, stream, connection = self.transfer, self.stream, self.connection
+            self.transfer = self.stream = self.connection = None
+            if transfer is None or stream is None or connection is None or connection.is_idle():
+                # lost, or quiet for so long that the receiver dropped it without a FIN
+                return
+            stream.close()
+            transfer(None)
+
+    def flush(self):
+        # sends the messages waiting for a batch and returns once the receiver acknowledged them. If it never does they
+        # stay buffered, the next flush() sends them again after a fresh SYN
+        with self.lock:
+            if self.batch_timer is not None:
+                self.batch_timer.cancel()
+                self.batch_timer = None
+            if self.stream is None or self.peer is None or not self.stream.pending:
+                return
+            if self.transfer is None or self.connection is None or self.connection.is_idle():
+                # the receiver and NATs on the way forget a connection that stays quiet, it starts over with the
+                # messages that are not acknowledged as a whole
+                self.stream = self.stream.reopen()
+                self.transfer = self.open_transfer(self.stream, *self.peer)
+                self.connection = self.sender
+            if not self.transfer(self.stream.end):
+                self.transfer = None
+                ip, port = self.peer
+                raise ConnectionError(f"Connection to {ip}:{port} lost, {self.stream.pending} bytes are not acknowledged")
+
+    def flush_batch(self):
+        # the batch timer's thread has nobody to report to, the messages stay buffered and the next flush() raises
+        try:
+            self.flush()
+        except ConnectionError:
+            pass
+
+    def send(self, message: Union[str, bytes, Iterable], ip = None, port = None) -> bool:
+        with self.lock:
+            if self.stream is not None:
+                message = message.encode() if isinstance(message, str) else message
+                if not isinstance(message, (bytes, bytearray)):
+                    message = b"".join(chunk.encode() if isinstance(chunk, str) else chunk for chunk in message)
+                self.stream.append(message)
+                if self.batch_delay is None or self.stream.pending >= self.batch_size or len(self.stream.boundaries) >= BATCH_LIMIT:
+                    self.flush()
+                elif self.batch_timer is None:
+                    # Nagle-like: the first message of a batch waits at most batch_delay for others to fill its segment
+                    self.batch_timer = Timer(self.batch_delay, self.flush_batch)
+                    self.batch_timer.daemon = True
+                    self.batch_timer.start()
+                return True
+        # segments are cut on byte offsets, so multi-byte characters survive being split across packets.
+        # files and iterators are read as the window moves, never held in memory as a whole
+        # False when the receiver stopped answering, sender.abort_reason says why
+        return self.open_transfer(SendBuffer(message), ip, port)(None)
+
+    def open_transfer(self, source: SendBuffer, ip, port) -> Callable[[Optional[int]], bool]:
         self.flush_recv_buffer()
-        self.message_pointer = 0 
-        self.random_number = randint(1, 5000)
-
-        def send_data(retries = ReliableUDP.RETRIES):
-            message_end_pointer = min(self.message_pointer + ReliableUDP.PAYLOAD_SIZE, len(message))
-            is_first = self.message_pointer == 0
-            is_last = message_end_pointer == len(message)
-
-            if retries < 1:
-                if not is_last:
-                    print(f"\033[91mAborted after {ReliableUDP.RETRIES * self.retransmission_timeout} seconds ({ReliableUDP.RETRIES} retries * {self.retransmission_timeout} second timeout) {f"\n'{message[:self.message_pointer]}'" if self.message_pointer > 0 else ""} \033[0m")
-                return FSM.STATE.EXIT
-
-            packet = Packet()
-            packet.set_header_field("seq_num", str(self.message_pointer + self.random_number), base=10)
-            packet.set_header_field("ack_num", "0", base=10)
-            if is_first:
-                packet.set_header_field("syn", "1", base=2)
-            if is_last:
-                packet.set_header_field("fin", "1", base=2)
-            packet.set_payload(message[self.message_pointer:message_end_pointer])
-            self.socket.sendto(packet.to_byte(), (str(ip), port))
-            return ("WAIT_ACK", is_last, message_end_pointer - self.message_pointer, retries - 1)
+        self.congestion.reset()
+        target = (str(ipaddress.ip_address(ip)), port)
+        sender = Sender(
+            source,
+            self.get_segment_size(ip, port),
+            lambda data: self.socket.sendto(data, target),
+            self.rtt,
+            self.congestion,
+            self.window_size,
+        )
+        self.sender = sender
+        # sends until the receiver holds everything up to the offset, or until it closed for None
+        return lambda acknowledged_offset: self.send_fsm.run(sender, acknowledged_offset)
+
+    def create_sender(self) -> FSM:
+        # built once, every transfer and every message of a persistent connection runs it with its own Sender and
+        # the offset it waits for, threaded through the actions
+        def send_data(sender: Sender, until: Optional[int]):
+            return ("WAIT_ACK" if sender.poll() else FSM.STATE.EXIT), sender, until
 
-        def wait_ack(is_last, payload_length, retries):
+        def wait_ack(sender: Sender, until: Optional[int]):
             try:
-                self.socket.settimeout(self.retransmission_timeout)
-                data, _ = self.socket.recvfrom(1024)
+                self.socket.settimeout(max(sender.deadline() - monotonic(), 0))
+                data, _ = self.socket.recvfrom(ReliableUDP.BUFFER_SIZE)
                 packet = Packet(data)
-                ack_num = int(packet.get_header_field("ack_num", base=10))
-                seq_num = int(packet.get_header_field("seq_num", base=10))
-                is_valid = ack_num == self.random_number + self.message_pointer + payload_length
-                is_ack = is_valid and packet.get_header_field("ack", base=2) == "1"
-                is_fin = is_valid and packet.get_header_field("fin", base=2) == "1"
-
-                if not is_valid:
-                    return ("WAIT_ACK", is_last, payload_length, retries)
-                if is_ack:
-                    self.message_pointer = ack_num - self.random_number
-                if is_fin:
-                    return ("SEND_ACK", seq_num)
-                if is_last:
-                    return ("WAIT_ACK", True, 0, retries)
-                return ("SEND_DATA", ReliableUDP.RETRIES if is_valid else retries)
-            except TimeoutError:
-                return ("SEND_DATA", retries)
-
-        def send_ack(last_seq_num):
-            packet = Packet()
-            packet.set_header_field("seq_num", str(self.random_number + self.message_pointer), base=10)
-            packet.set_header_field("ack_num", str(last_seq_num + 1), base=10)
-            packet.set_header_field("ack", "1", base=2)
-            self.socket.sendto(packet.to_byte(), (str(ipaddress.ip_address(ip)), port))
-            return FSM.STATE.EXIT
-            
-
-        fsm = FSM(
-            [
-                { "source": FSM.STATE.START, "dest": "SEND_DATA", "action": send_data },
-                { "source": "SEND_DATA", "dest": "WAIT_ACK", "action": wait_ack },
-                { "source": "SEND_DATA", "dest": FSM.STATE.EXIT, "action": self.flush_recv_buffer },
-                { "source": "WAIT_ACK", "dest": "SEND_DATA", "action": send_data },
-                { "source": "WAIT_ACK", "dest": "SEND_ACK", "action": send_ack },
-                { "source": "WAIT_ACK", "dest": "WAIT_ACK", "action": wait_ack },
-                { "source": "SEND_ACK", "dest": FSM.STATE.EXIT, "action": self.flush_recv_buffer },
-            ],
-            initial_state="SEND_DATA",
-        )
-        fsm.run()
+            except (TimeoutError, BlockingIOError):
+                return "SEND_DATA", sender, until
+            except ValueError:
+                # a header layout this version does not know
+                return "WAIT_ACK", sender, until
+            if not sender.on_ack(packet):
+                return "WAIT_ACK", sender, until
+            if sender.peer_fin is not None:
+                return "SEND_ACK", sender, until
+            if until is not None and sender.is_acknowledged(until):
+                return FSM.STATE.EXIT, sender, until
+            return "SEND_DATA", sender, until
 
+        def send_ack(sender: Sender, until: Optional[int]):
+            sender.acknowledge_fin()
+            return FSM.STATE.EXIT, sender, until
+
+        def abort(sender: Sender, until: Optional[int]) -> bool:
+            self.flush_recv_buffer()
+            # a FIN probe that ran out of retries still delivered everything, only the closing handshake got lost
+            return until is None and sender.delivered
+
+        def close(sender: Sender, until: Optional[int]) -> bool:
+            self.flush_recv_buffer()
+            return True
+
+        transitions = [
+            { "source": FSM.STATE.START, "dest": "SEND_DATA", "action": send_data },
+            { "source": "SEND_DATA", "dest": "WAIT_ACK", "action": wait_ack },
+            { "source": "SEND_DATA", "dest": FSM.STATE.EXIT, "action": abort },
+            { "source": "WAIT_ACK", "dest": "SEND_DATA", "action": send_data },
+            { "source": "WAIT_ACK", "dest": "SEND_ACK", "action": send_ack },
+            { "source": "WAIT_ACK", "dest": "WAIT_ACK", "action": wait_ack },
+            { "source": "WAIT_ACK", "dest": FSM.STATE.EXIT, "action": lambda sender, until: True },
+            { "source": "SEND_ACK", "dest": FSM.STATE.EXIT, "action": close },
+        ]
+        fsm = FSM(transitions, initial_state="SEND_DATA")
+        if self.send_stats is not None:
+            self.send_stats.attach(fsm)
+        return fsm
+
+
+    def recv(self) -> str:
+        # completed holds connections with a whole message waiting, a persistent one may have several
+        while self.completed and self.completed[0].message_end() is None:
+            self.completed.popleft()
+        if self.completed:
+            conn = self.completed[0]
+        else:
+            conn = self.receive(lambda conn: conn.message_end() is not None)
+        message = conn.take_message()
+        if conn.message_end() is not None and conn not in self.completed:
+            # the same segment completed more messages, later calls return them without waiting
+            self.completed.append(conn)
+        return message.decode(errors="replace")
+
+    def recv_stream(self) -> Iterator[bytes]:
+        # the next message, yielded in order as it arrives instead of after the last segment
+        while self.completed and self.completed[0].message_end() is None:
+            self.completed.popleft()
+        conn = self.completed[0] if self.completed else None
+
+        def is_ready(other):
+            if other is conn and other.state == Connection.STATE.EXPIRED:
+                return True
+            if conn is None or other is conn:
+                return other.buffer is not None and (other.message_start < other.message_pointer or other.message_end() is not None)
+            if other.message_end() is not None and other not in self.completed:
+                # another sender finished a message while this one was streaming, recv() returns it later
+                self.completed.append(other)
+            return False
+
+        while True:
+            if conn is None or not is_ready(conn):
+                conn = self.receive(is_ready)
+            chunk, is_last = conn.take_chunk()
+            if is_last and conn.message_end() is not None and conn not in self.completed:
+                self.completed.append(conn)
+            if chunk:
+                yield chunk
+            if is_last:
+                return
+            if conn.state == Connection.STATE.EXPIRED:
+                # the sender went quiet for IDLE_TIMEOUT in the middle of the message, the rest of it never comes
+                conn.buffer = None
+                ip, port = conn.addr
+                raise ConnectionError(f"Connection from {ip}:{port} timed out in the middle of a message")
+
+    def receive(self, is_ready: Callable[[Connection], bool]) -> Connection:
+        # runs until a packet leaves some connection in a state is_ready accepts
+        self.is_ready = is_ready
+        if self.receive_fsm is None:
+            self.receive_fsm = self.create_receiver()
+            if self.recv_stats is not None:
+                self.recv_stats.attach(self.receive_fsm)
+        return self.receive_fsm.run()
+
+    def create_receiver(self) -> FSM:
+        # one bound socket serves every sender, each transfer lives in its own Connection until it is closed
+        receiver = self.receiver
+
+        def receive_data():
+            now = monotonic()
+            for conn in receiver.sweep(now):
+                if self.is_ready(conn):
+                    return (FSM.STATE.EXIT, conn)
+            conn = receiver.due(now)
+            if conn is not None:
+                return ("SEND_FIN", conn)
+
+            try:
+                deadline = receiver.deadline()
+                self.socket.settimeout(max(deadline - now, 0) if deadline is not None else None)
+                data, addr = self.socket.recvfrom(ReliableUDP.BUFFER_SIZE)
+            except (TimeoutError, BlockingIOError):
+                return "RECEIVE_DATA"
 
-    def recv(self):
-        self.flush_recv_buffer()
-        self.message_pointer = 0
-        self.random_number = 0
-
-        def receive_data(buffer = ""):
-            self.socket.settimeout(None)
-            data, addr = self.socket.recvfrom(1024)
-            packet = Packet(data)
-            seq_num = int(packet.get_header_field("seq_num", base=10))
-            payload = packet.get_payload() or ""
-            is_last_message = packet.get_header_field("fin", base=2) == "1"
-            is_syn = packet.get_header_field("syn", base=2) == "1"
-            is_valid = (self.message_pointer == 0 and is_syn) or seq_num - self.random_number == self.message_pointer
-            is_new_connection = is_syn and not is_valid 
-            is_duplicate_syn = is_syn and seq_num == self.prev_random_number
-
-            if is_syn and not is_duplicate_syn:
-                self.random_number = seq_num
-                self.message_pointer = 0
-                self.target_addr = addr
-                buffer = ""
-
-            if (is_valid or is_new_connection) and not is_duplicate_syn:
-                self.message_pointer = len(buffer + payload)
-                return ("SEND_ACK", buffer + payload, is_last_message)
-            return ("SEND_ACK", buffer, False)
-
-        def send_ack(acknowledged_message, is_last_message):
-            if not self.target_addr:
-                return ("RECEIVE_DATA", "")
-            packet = Packet()
-            packet.set_header_field("ack", "1", base=2)
-            packet.set_header_field("seq_num", "0", base=10)
-            packet.set_header_field("ack_num", str(self.random_number + len(acknowledged_message)), base=10)
-            self.socket.sendto(packet.to_byte(), self.target_addr)
-            
-            if is_last_message:
-                return ("SEND_FIN", acknowledged_message, 20)
-            return ("RECEIVE_DATA", acknowledged_message)
-
-        def send_fin(message, retries):
-            if retries < 1:
-                return (FSM.STATE.EXIT, message)
-
-            packet = Packet()
-            packet.set_header_field("fin", "1", base=2)
-            packet.set_header_field("ack", "1", base=2)
-            packet.set_header_field("seq_num", "0", base=10)
-            packet.set_header_field("ack_num", str(self.random_number + len(message)), base=10)
-            self.socket.sendto(packet.to_byte(), self.target_addr)
-            return ("WAIT_ACK", message, retries - 1)
-
-        def wait_ack(message, retries):
             try:
-                self.socket.settimeout(0.5)
-                data, _ = self.socket.recvfrom(1024)
                 packet = Packet(data)
-                is_ack = packet.get_header_field("ack", base=2) == "1"
-                ack_num = int(packet.get_header_field("ack_num", base=10))
-                is_valid = ack_num  == 1
-                if is_ack and is_valid:
-                    return (FSM.STATE.EXIT, message)
-                return ("SEND_FIN", message, retries)
-            except TimeoutError:
-                return ("SEND_FIN", message, retries)
-
-        def clean_up(message):
-            self.message_pointer = 0 
-            self.prev_random_number = self.random_number
-            self.random_number = 0
-            self.flush_recv_buffer()
-            return message
+            except ValueError:
+                # a header layout this version does not know
+                return "RECEIVE_DATA"
+            if packet.get("ack") == 1:
+                receiver.on_ack(packet, addr)
+                return "RECEIVE_DATA"
+            received = receiver.on_data(packet, addr)
+            if received is None:
+                return "RECEIVE_DATA"
+            return ("SEND_ACK", *received)
 
+        def send_ack(conn, latest):
+            if receiver.acknowledge(conn, latest):
+                return ("SEND_FIN", conn)
+            return (FSM.STATE.EXIT, conn) if self.is_ready(conn) else "RECEIVE_DATA"
 
-        fsm = FSM(
+        def send_fin(conn):
+            if not receiver.send_fin(conn):
+                return "RECEIVE_DATA"
+            # the message is complete, hand it over while the FIN handshake goes on in later calls
+            return (FSM.STATE.EXIT, conn) if self.is_ready(conn) else "RECEIVE_DATA"
+
+
+        return FSM(
             [
                 { "source": FSM.STATE.START, "dest": "RECEIVE_DATA", "action": receive_data },
+                { "source": "RECEIVE_DATA", "dest": "RECEIVE_DATA", "action": receive_data },
                 { "source": "RECEIVE_DATA", "dest": "SEND_ACK", "action": send_ack },
+                { "source": "RECEIVE_DATA", "dest": "SEND_FIN", "action": send_fin },
+                { "source": "RECEIVE_DATA", "dest": FSM.STATE.EXIT, "action": lambda conn: conn },
                 { "source": "SEND_ACK", "dest": "RECEIVE_DATA", "action": receive_data },
                 { "source": "SEND_ACK", "dest": "SEND_FIN", "action": send_fin },
-                { "source": "SEND_FIN", "dest": "WAIT_ACK", "action": wait_ack },
-                { "source": "SEND_FIN", "dest": FSM.STATE.EXIT, "action": clean_up },
-                { "source": "WAIT_ACK", "dest": "SEND_FIN", "action": send_fin },
-                { "source": "WAIT_ACK", "dest": FSM.STATE.EXIT, "action": clean_up },
+                { "source": "SEND_ACK", "dest": FSM.STATE.EXIT, "action": lambda conn: conn },
+                { "source": "SEND_FIN", "dest": "RECEIVE_DATA", "action": receive_data },
+                { "source": "SEND_FIN", "dest": FSM.STATE.EXIT, "action": lambda conn: conn },
             ],
             initial_state="RECEIVE_DATA",
         )
-        return fsm.run()
 
     def close(self):
-        self.socket.close()
-
+        try:
+            self.disconnect()
+        finally:
+            self.socket.close()
@@ -0,0 +1,68 @@
+from collections import deque
+from typing import Optional
+
+
+class RTTEstimator:
+    # RFC 6298 smoothing factors
+    ALPHA = 1/8
+    BETA = 1/4
+    K = 4
+    MIN_RTO = 0.01
+    MAX_RTO = 60
+    MAX_SAMPLES = 100
+
+    def __init__(self, initial_rto = 1, min_rto = MIN_RTO, max_rto = MAX_RTO):
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.rto = initial_rto
+        self.backoffs = 0
+        self.samples = deque(maxlen=RTTEstimator.MAX_SAMPLES)
+
+    def sample(self, rtt: float):
+        # callers only pass samples of segments that were never retransmitted (Karn's rule), or ones timed by an
+        # echoed timestamp, which tells a retransmission from the original
+        if self.srtt is None or self.rttvar is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTTEstimator.BETA) * self.rttvar + RTTEstimator.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTTEstimator.ALPHA) * self.srtt + RTTEstimator.ALPHA * rtt
+        self.samples.append(rtt)
+        self.backoffs = 0
+        self.rto = min(max(self.srtt + RTTEstimator.K * self.rttvar, self.min_rto), self.max_rto)
+
+    def restore(self):
+        # new data got through, so drop the backoff without waiting for a clean sample
+        if not self.backoffs:
+            return
+        self.backoffs = 0
+        if self.srtt is None or self.rttvar is None:
+            self.rto = self.initial_rto
+        else:
+            self.rto = min(max(self.srtt + RTTEstimator.K * self.rttvar, self.min_rto), self.max_rto)
+
+    def backoff(self):
+        self.backoffs += 1
+        self.rto = min(self.rto * 2, self.max_rto)
+
+    def reset(self):
+        self.__init__(self.initial_rto, self.min_rto, self.max_rto)
+
+    def stats(self):
+        return {
+            "rto": self.rto,
+            "srtt": self.srtt,
+            "rttvar": self.rttvar,
+            "backoffs": self.backoffs,
+            "samples": list(self.samples),
+        }
+
+    def __str__(self):
+        srtt = f"{self.srtt * 1000:.1f}ms" if self.srtt is not None else "-"
+        return f"rto: {self.rto * 1000:.1f}ms, srtt: {srtt}, samples: {len(self.samples)}, backoffs: {self.backoffs}"
+
+    def __repr__(self):
+        return self.__str__()
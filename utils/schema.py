@@ -0,0 +1,182 @@
+import struct
+
+STRUCT_FORMATS = {1: "!B", 2: "!H", 4: "!I", 8: "!Q"}
+
+
+class HeaderLayout():
+    _cache = {}
+
+    def __init__(self, header_definition, version = None):
+        self.header_definition = header_definition
+        self.version = version
+        self.fields = {}
+        self.getters = {}
+        self.setters = {}
+
+        bit_pointer = 0
+        for name, size in header_definition.items():
+            bit_length = int(size * 8)
+            byte_start, bit_offset = divmod(bit_pointer, 8)
+            byte_end = (bit_pointer + bit_length + 7) // 8
+            span = byte_end - byte_start
+            shift = span * 8 - bit_offset - bit_length
+            mask = (1 << bit_length) - 1
+            codec = struct.Struct(STRUCT_FORMATS[span]) if span in STRUCT_FORMATS else None
+            # (byte offset, byte span, shift, mask, bit position, bit length, struct codec)
+            self.fields[name] = (byte_start, span, shift, mask, bit_pointer, bit_length, codec)
+            self.getters[name], self.setters[name] = HeaderLayout.accessors(byte_start, span, shift, mask, codec)
+            bit_pointer += bit_length
+
+        self.length_bits = bit_pointer
+        self.length = (bit_pointer + 7) // 8
+
+    @staticmethod
+    def accessors(offset, span, shift, mask, codec):
+        if codec and shift == 0 and mask == (1 << (span * 8)) - 1:
+            # whole bytes, a single struct call each way
+            unpack_from, pack_into = codec.unpack_from, codec.pack_into
+            return (
+                lambda buffer: unpack_from(buffer, offset)[0],
+                lambda buffer, value: pack_into(buffer, offset, value & mask),
+            )
+        if span == 1:
+            # bit field inside one byte
+            cleared = 0xFF & ~(mask << shift)
+            def set_bits(buffer, value):
+                buffer[offset] = (buffer[offset] & cleared) | ((value & mask) << shift)
+            return (lambda buffer: (buffer[offset] >> shift) & mask, set_bits)
+
+        cleared = ~(mask << shift)
+        def get_span(buffer):
+            return (int.from_bytes(buffer[offset:offset + span], "big") >> shift) & mask
+        def set_span(buffer, value):
+            current = int.from_bytes(buffer[offset:offset + span], "big")
+            buffer[offset:offset + span] = ((current & cleared) | ((value & mask) << shift)).to_bytes(span, "big")
+        return (get_span, set_span)
+
+    @classmethod
+    def of(cls, header_definition):
+        cached = cls._cache.get(id(header_definition))
+        if cached is None or cached.header_definition is not header_definition:
+            cached = cls._cache[id(header_definition)] = cls(header_definition)
+        return cached
+
+    def field(self, field_name):
+        try:
+            return self.fields[field_name]
+        except KeyError:
+            raise ValueError(f"Field '{field_name}' not found in header definition")
+
+    def unpack(self, buffer, field_name) -> int:
+        try:
+            return self.getters[field_name](buffer)
+        except KeyError:
+            raise ValueError(f"Field '{field_name}' not found in header definition")
+
+    def pack(self, buffer: bytearray, field_name, value: int):
+        try:
+            self.setters[field_name](buffer, value)
+        except KeyError:
+            raise ValueError(f"Field '{field_name}' not found in header definition")
+
+
+class LayoutRegistry():
+    def __init__(self, base_definition, version_field: str):
+        self.base = HeaderLayout(base_definition, 0)
+        self.version_field = version_field
+        self.version_getter = self.base.getters[version_field]
+        self.layouts = {0: self.base}
+
+    def register(self, version: int, extension) -> HeaderLayout:
+        _, _, _, mask, _, _, _ = self.base.field(self.version_field)
+        if not 0 < version <= mask:
+            raise ValueError(f"Layout version has to be between 1 and {mask}")
+        if version in self.layouts:
+            raise ValueError(f"Layout version {version} is already registered")
+
+        definition = {**self.base.header_definition}
+        for name, size in extension.items():
+            if name in definition:
+                raise ValueError(f"Field '{name}' is already part of the base header")
+            definition[name] = size
+        layout = HeaderLayout(definition, version)
+        self.layouts[version] = layout
+        return layout
+
+    def get(self, version: int) -> HeaderLayout:
+        try:
+            return self.layouts[version]
+        except KeyError:
+            raise ValueError(f"Unsupported header layout version {version}")
+
+    def detect(self, buffer) -> HeaderLayout:
+        if len(buffer) < self.base.length:
+            return self.base
+        return self.get(self.version_getter(buffer))
+
+    def generate_dissector(self, labels, ports) -> str:
+        declared = {}
+        for layout in self.layouts.values():
+            for name, (offset, span, shift, mask, _, bit_length, _) in layout.fields.items():
+                if name not in declared:
+                    declared[name] = (span, shift, mask, bit_length)
+                elif declared[name] != (span, shift, mask, bit_length):
+                    raise ValueError(f"Field '{name}' changes size between layouts")
+
+        lines = [
+            "-- Generated from the header layouts in utils/packet.py, do not edit by hand.",
+            "-- Regenerate with: python -m utils.wireshark",
+            "my_proto = Proto(\"reliableUDP\", \"Custom Reliable UDP\")",
+            "",
+            "-- Define fields",
+        ]
+        for name, (span, shift, mask, bit_length) in declared.items():
+            label = labels.get(name, name.replace("_", " ").title())
+            whole = shift == 0 and bit_length == span * 8
+            if bit_length == 1:
+                field = f"ProtoField.bool(\"reliableUDP.{name}\", \"{label}\", {span * 8}, nil, 0x{mask << shift:X})"
+            elif whole:
+                field = f"ProtoField.uint{span * 8}(\"reliableUDP.{name}\", \"{label}\", base.DEC)"
+            else:
+                field = f"ProtoField.uint{span * 8}(\"reliableUDP.{name}\", \"{label}\", base.DEC, nil, 0x{mask << shift:X})"
+            lines.append(f"local f_{name} = {field}")
+        lines.append("local f_payload = ProtoField.bytes(\"reliableUDP.payload\", \"Payload\")")
+        lines += [
+            "",
+            "-- Add fields to protocol",
+            "my_proto.fields = {" + ", ".join(f"f_{name}" for name in declared) + ", f_payload}",
+            "",
+            "-- Header layouts by version",
+            "local layouts = {",
+        ]
+        for version, layout in self.layouts.items():
+            fields = ", ".join(f"{{f_{name}, {offset}, {span}}}" for name, (offset, span, *_) in layout.fields.items())
+            lines.append(f"    [{version}] = {{ length = {layout.length}, fields = {{ {fields} }} }},")
+
+        version_offset, version_span, version_shift, version_mask, _, _, _ = self.base.field(self.version_field)
+        lines += [
+            "}",
+            "",
+            "-- Dissector function",
+            "function my_proto.dissector(buffer, pinfo, tree)",
+            "    pinfo.cols.protocol = \"ReliableUDP\"",
+            "",
+            "    local subtree = tree:add(my_proto, buffer(), \"Custom Reliable UDP Protocol Data\")",
+            f"    if buffer:len() < {self.base.length} then return end",
+            "",
+            f"    local version = bit.band(bit.rshift(buffer({version_offset}, {version_span}):uint(), {version_shift}), 0x{version_mask:X})",
+            "    local layout = layouts[version]",
+            "    if layout == nil or buffer:len() < layout.length then return end",
+            "",
+            "    for _, field in ipairs(layout.fields) do",
+            "        subtree:add(field[1], buffer(field[2], field[3]))",
+            "    end",
+            "    if buffer:len() > layout.length then",
+            "        subtree:add(f_payload, buffer(layout.length))",
+            "    end",
+            "end",
+            "",
+            "local udp_port = DissectorTable.get(\"udp.port\")",
+        ]
+        lines += [f"udp_port:add({port}, my_proto)" for port in ports]
+        return "\n".join(lines) + "\n"
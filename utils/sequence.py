@@ -0,0 +1,16 @@
+SEQ_MODULO = 1 << 16
+# peers that both speak the wide header layouts
+WIDE_SEQ_MODULO = 1 << 32
+
+
+def serial_delta(a, b, modulo = SEQ_MODULO) -> int:
+    # serial number arithmetic (RFC 1982), the signed distance from b to a on a circle of modulo numbers
+    delta = (a - b) % modulo
+    if delta >= modulo // 2:
+        delta -= modulo
+    return delta
+
+
+def unwrap(sequence_offset, reference, modulo = SEQ_MODULO) -> int:
+    # sequence numbers only carry the low bits of an offset, pick the one closest to reference
+    return reference + serial_delta(sequence_offset, reference, modulo)
@@ -24,14 +24,20 @@ class ArgParser:
             default=SERVER_DEFAULT_LISTEN_PORT,
             help="Port number to listen on.",
         )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Print the time spent in each protocol state when the server is stopped.",
+        )
 
         args = parser.parse_args()
 
         self.listen_ip: str = args.listen_ip
         self.listen_port: int = args.listen_port
+        self.profile: bool = args.profile
 
     def __str__(self):
-        return f"Listening: {self.listen_ip}:{self.listen_port}"
+        return f"Listening: {self.listen_ip}:{self.listen_port}, profile: {self.profile}"
 
     def __repr__(self):
         return self.__str__()
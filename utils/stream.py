@@ -0,0 +1,140 @@
+from typing import Iterable, Iterator, List, Optional, Union
+
+from utils.packet import BATCH_LIMIT
+
+
+class SendBuffer:
+    # window over a message that is read lazily from bytes, a file object or an iterator of chunks,
+    # holding only the bytes between the oldest unacknowledged offset and the furthest segment read
+    READ_SIZE = 1 << 16
+
+    def __init__(self, source: Union[str, bytes, bytearray, memoryview, Iterable, None], coalesce = False):
+        self.base = 0
+        self.buffer = bytearray()
+        # bytes the receiver acknowledged, an open buffer holds on to the start of a message until all of it is
+        self.acknowledged = 0
+        self.eof = False
+        self.chunks: Optional[Iterator] = None
+        # end offsets of the messages appended to an open buffer
+        self.boundaries = set()
+        # end offsets of the empty messages among them, each sent as a placeholder byte the receiver drops
+        self.empty = set()
+        # small messages share a segment, which then lists where each of them ends
+        self.coalesce = coalesce
+        if isinstance(source, str):
+            source = source.encode()
+        self.is_open = source is None
+        if source is None:
+            # open buffer of a persistent connection, filled by append() until close()
+            pass
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self.buffer += source
+            self.eof = True
+        elif hasattr(source, "read"):
+            self.chunks = SendBuffer.read_file(getattr(source, "read"))
+        else:
+            self.chunks = iter(source)
+
+    @staticmethod
+    def read_file(read):
+        while chunk := read(SendBuffer.READ_SIZE):
+            yield chunk
+
+    @property
+    def length(self) -> Optional[int]:
+        return self.base + len(self.buffer) if self.eof else None
+
+    def append(self, message: Union[str, bytes]) -> int:
+        self.buffer += (message.encode() if isinstance(message, str) else message) or b"\0"
+        end = self.base + len(self.buffer)
+        self.boundaries.add(end)
+        if not message:
+            self.empty.add(end)
+        return end
+
+    @property
+    def end(self) -> int:
+        return self.base + len(self.buffer)
+
+    @property
+    def pending(self) -> int:
+        # bytes appended that are not acknowledged yet
+        return self.end - max(self.base, self.acknowledged)
+
+    def close(self):
+        self.eof = True
+
+    def fill(self, end):
+        while not self.eof and self.chunks is not None and self.base + len(self.buffer) < end:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+            else:
+                # text streams (sys.stdin, files opened in text mode) are sent as UTF-8
+                self.buffer += chunk.encode() if isinstance(chunk, str) else chunk
+
+    def available(self, offset) -> bool:
+        self.fill(offset + 1)
+        return offset < self.base + len(self.buffer)
+
+    def is_end(self, offset) -> bool:
+        self.fill(offset + 1)
+        return self.eof and offset >= self.base + len(self.buffer)
+
+    def segment_end(self, offset, size) -> int:
+        self.fill(offset + size)
+        if self.coalesce:
+            # as many whole messages as fit next to the table of their ends
+            end = None
+            for count, boundary in enumerate(sorted(boundary for boundary in self.boundaries if boundary > offset), 1):
+                if boundary in self.empty:
+                    # the placeholder of an empty message goes alone, flagged instead of listed
+                    end = end or boundary
+                    break
+                if count > BATCH_LIMIT or boundary - offset + 1 + 2 * count > size:
+                    break
+                end = boundary
+            if end is not None:
+                return end
+            # a message larger than a segment is split, each piece lists one end at most
+            size = max(size - 3, 1)
+        # a segment never spans two messages, so the last one of each can carry the boundary
+        boundary = min((end for end in self.boundaries if end > offset), default=offset + size)
+        return min(offset + size, boundary, self.base + len(self.buffer))
+
+    def segment(self, offset, size) -> bytes:
+        return self.slice(offset, self.segment_end(offset, size))
+
+    def slice(self, offset, end) -> bytes:
+        return bytes(self.buffer[offset - self.base:end - self.base])
+
+    def is_boundary(self, offset) -> bool:
+        return offset in self.boundaries
+
+    def is_empty(self, end) -> bool:
+        return end in self.empty
+
+    def ends_within(self, offset, end) -> List[int]:
+        # ends of the messages in a segment, relative to its start
+        return sorted(boundary - offset for boundary in self.boundaries if offset < boundary <= end)
+
+    def release(self, offset):
+        # acknowledged bytes are never sent again
+        self.acknowledged = max(self.acknowledged, offset)
+        if self.is_open:
+            # so that reopen() can hand a message that is only acknowledged in part to a new connection whole
+            offset = max((end for end in self.boundaries if end <= offset), default=self.base)
+        if offset > self.base:
+            del self.buffer[:offset - self.base]
+            self.base = offset
+            self.boundaries = {end for end in self.boundaries if end > offset}
+            self.empty = {end for end in self.empty if end > offset}
+
+    def reopen(self) -> "SendBuffer":
+        # the messages of an open buffer that are not acknowledged as a whole, from offset 0 of a new one
+        reopened = SendBuffer(None, coalesce=self.coalesce)
+        start = self.base
+        for end in sorted(self.boundaries):
+            reopened.append(b"" if end in self.empty else self.slice(start, end))
+            start = end
+        return reopened
@@ -1,4 +1,5 @@
 import ipaddress
+import os
 import sys
 from typing import Optional
 
@@ -36,6 +37,18 @@ def validate_greater_than(value, min: int):
         )
 
 
+def validate_between(value, min: int, max: int):
+    try:
+        num = int(value)
+        if not min <= num <= max:
+            raise ValueError
+        return num
+    except:
+        sys.exit(
+            f"Invalid number {value}. Value needs to be an integer between {min} and {max}."
+        )
+
+
 def validate_range(min: Optional[float] = None, max: Optional[float] = None):
     def validation(value):
         try:
@@ -82,3 +95,104 @@ def validate_range_input(delimiter="-", min: Optional[float] = None):
             print(e)
             sys.exit(f"Invalid input {value}")
     return validation
+
+
+def validate_rate(value):
+    # bits per second, with an optional k, M or G suffix. 0 for an unlimited link
+    units = { "k": 1e3, "m": 1e6, "g": 1e9 }
+    try:
+        text = str(value).strip().lower().removesuffix("bit").removesuffix("bps")
+        multiplier = units.get(text[-1:], 1)
+        rate = float(text[:-1] if text[-1:] in units else text) * multiplier
+        if rate < 0:
+            raise ValueError
+        return int(rate)
+    except:
+        sys.exit(f"Invalid rate {value}. Use bits per second, eg) 500k, 10M or 1G.")
+
+
+def validate_loss_model(value):
+    # Gilbert-Elliott burst loss in %: P,R[,LOSS_GOOD[,LOSS_BAD]] eg) 1,30 or 1,30,0,80
+    try:
+        parts = [float(part) for part in value.split(",")]
+        if not 2 <= len(parts) <= 4 or any(not 0 <= part <= 100 for part in parts):
+            raise ValueError
+        p, r, loss_good, loss_bad = parts + [0, 100][len(parts) - 2:]
+        return (p, r, loss_good, loss_bad)
+    except:
+        sys.exit(f"Invalid loss model {value}. Use P,R[,LOSS_GOOD[,LOSS_BAD]] in %, eg) 1,30 for bursts entered 1% of the time and left 30%.")
+
+
+def validate_jitter(value):
+    # normal:MEAN,STDDEV or pareto:SCALE,SHAPE in milliseconds
+    try:
+        distribution, _, parameters = value.partition(":")
+        first, second = (float(part) for part in parameters.split(","))
+        if distribution not in ("normal", "pareto") or first < 0 or second <= 0:
+            raise ValueError
+        return (distribution, first, second)
+    except:
+        sys.exit(f"Invalid jitter {value}. Use normal:MEAN,STDDEV or pareto:SCALE,SHAPE in milliseconds, eg) normal:20,5.")
+
+
+def validate_reorder(value):
+    # PERCENT[,DISTANCE] eg) 5,3 holds 5% of the packets back until 3 later ones went ahead
+    try:
+        percent, _, distance = value.partition(",")
+        percent, distance = float(percent), int(distance or 1)
+        if not 0 <= percent <= 100 or distance < 1:
+            raise ValueError
+        return (percent, distance)
+    except:
+        sys.exit(f"Invalid reorder {value}. Use PERCENT[,DISTANCE], eg) 5,3.")
+
+
+def validate_file(value):
+    if not os.path.isfile(value):
+        sys.exit(f"Invalid file {value}. It does not exist.")
+    return value
+
+
+def validate_size(value):
+    # bytes, with an optional k or M suffix for KiB and MiB
+    units = { "k": 1 << 10, "m": 1 << 20 }
+    try:
+        text = str(value).strip().lower().removesuffix("b")
+        multiplier = units.get(text[-1:], 1)
+        size = int(float(text[:-1] if text[-1:] in units else text) * multiplier)
+        if size < 1:
+            raise ValueError
+        return size
+    except:
+        sys.exit(f"Invalid size {value}. Use bytes, eg) 512, 64k or 1M.")
+
+
+def validate_list(validation):
+    # comma separated values, each checked by validation
+    def validate(value):
+        return [validation(item) for item in str(value).split(",") if item]
+    return validate
+
+
+FLOW_SETTINGS = {
+    "cdrop": ("client", "drop", validate_range(min=0, max=100)),
+    "cdelay": ("client", "delay", validate_range(min=0, max=100)),
+    "cdt": ("client", "delay_time", validate_range_input(min=0)),
+    "sdrop": ("server", "drop", validate_range(min=0, max=100)),
+    "sdelay": ("server", "delay", validate_range(min=0, max=100)),
+    "sdt": ("server", "delay_time", validate_range_input(min=0)),
+}
+
+
+def validate_flow(value):
+    # IP[:PORT],setting=value,... eg) 127.0.0.2,cdrop=10,sdt=100-200
+    address, *settings = value.split(",")
+    ip, _, port = address.partition(":")
+    overrides = { "client": {}, "server": {} }
+    for setting in settings:
+        name, _, setting_value = setting.partition("=")
+        if name not in FLOW_SETTINGS or not setting_value:
+            sys.exit(f"Invalid flow setting {setting}. Use name=value with one of {', '.join(FLOW_SETTINGS)}.")
+        target, field, validation = FLOW_SETTINGS[name]
+        overrides[target][field] = validation(setting_value)
+    return (validate_ipv4(ip), validate_port(port) if port else None, overrides)
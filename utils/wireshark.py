@@ -0,0 +1,17 @@
+import os
+
+from utils.constants import CLIENT_DEFAULT_TARGET_PORT, SERVER_DEFAULT_LISTEN_PORT
+from utils.packet import field_labels, layouts
+
+DISSECTOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "wireshark.lua")
+DISSECTOR_PORTS = sorted({1000, 2000, 3000, 6000, 7000, 8000, 9000, CLIENT_DEFAULT_TARGET_PORT, SERVER_DEFAULT_LISTEN_PORT})
+
+
+def main():
+    with open(DISSECTOR_PATH, "w") as file:
+        file.write(layouts.generate_dissector(field_labels, DISSECTOR_PORTS))
+    print(f"Wrote {DISSECTOR_PATH}")
+
+
+if __name__ == "__main__":
+    main()
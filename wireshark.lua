@@ -1,36 +1,63 @@
--- Define custom protocol
+-- Generated from the header layouts in utils/packet.py, do not edit by hand.
+-- Regenerate with: python -m utils.wireshark
 my_proto = Proto("reliableUDP", "Custom Reliable UDP")
 
 -- Define fields
 local f_seq_num = ProtoField.uint16("reliableUDP.seq_num", "Sequence Number", base.DEC)
 local f_ack_num = ProtoField.uint16("reliableUDP.ack_num", "Acknowledgment Number", base.DEC)
-local f_flags = ProtoField.uint8("reliableUDP.flags", "Flags", base.HEX)
-local f_syn = ProtoField.bool("reliableUDP.flags.syn", "SYN", 8, nil, 0x80)
-local f_ack = ProtoField.bool("reliableUDP.flags.ack", "ACK", 8, nil, 0x40)
-local f_fin = ProtoField.bool("reliableUDP.flags.fin", "FIN", 8, nil, 0x20)
-local f_rst = ProtoField.bool("reliableUDP.flags.rst", "RST", 8, nil, 0x10)
-local f_offset = ProtoField.uint8("reliableUDP.flags.offset", "Offset", base.DEC, nil, 0x0F)
+local f_syn = ProtoField.bool("reliableUDP.syn", "SYN", 8, nil, 0x80)
+local f_ack = ProtoField.bool("reliableUDP.ack", "ACK", 8, nil, 0x40)
+local f_fin = ProtoField.bool("reliableUDP.fin", "FIN", 8, nil, 0x20)
+local f_version = ProtoField.uint8("reliableUDP.version", "Version", base.DEC, nil, 0x1F)
+local f_conn_id = ProtoField.uint32("reliableUDP.conn_id", "Connection ID", base.DEC)
+local f_timestamp = ProtoField.uint32("reliableUDP.timestamp", "Timestamp", base.DEC)
+local f_wide = ProtoField.bool("reliableUDP.wide", "32 bit Sequence Numbers Offered", 8, nil, 0x80)
+local f_window = ProtoField.uint16("reliableUDP.window", "Window", base.DEC, nil, 0x7FFF)
+local f_sack_count = ProtoField.uint8("reliableUDP.sack_count", "SACK Blocks", base.DEC)
+local f_sack_1_start = ProtoField.uint32("reliableUDP.sack_1_start", "Sack 1 Start", base.DEC)
+local f_sack_1_end = ProtoField.uint32("reliableUDP.sack_1_end", "Sack 1 End", base.DEC)
+local f_sack_2_start = ProtoField.uint32("reliableUDP.sack_2_start", "Sack 2 Start", base.DEC)
+local f_sack_2_end = ProtoField.uint32("reliableUDP.sack_2_end", "Sack 2 End", base.DEC)
+local f_sack_3_start = ProtoField.uint32("reliableUDP.sack_3_start", "Sack 3 Start", base.DEC)
+local f_sack_3_end = ProtoField.uint32("reliableUDP.sack_3_end", "Sack 3 End", base.DEC)
+local f_seq_num_hi = ProtoField.uint16("reliableUDP.seq_num_hi", "Sequence Number (high)", base.DEC)
+local f_ack_num_hi = ProtoField.uint16("reliableUDP.ack_num_hi", "Acknowledgment Number (high)", base.DEC)
+local f_eom = ProtoField.bool("reliableUDP.eom", "End of Message", 8, nil, 0x80)
+local f_batch = ProtoField.bool("reliableUDP.batch", "Batched Messages", 8, nil, 0x40)
+local f_empty = ProtoField.bool("reliableUDP.empty", "Empty Message", 8, nil, 0x20)
+local f_reserved = ProtoField.uint8("reliableUDP.reserved", "Reserved", base.DEC, nil, 0x1F)
+local f_payload = ProtoField.bytes("reliableUDP.payload", "Payload")
 
 -- Add fields to protocol
-my_proto.fields = {f_seq_num, f_ack_num, f_flags, f_syn, f_ack, f_fin, f_rst, f_offset}
+my_proto.fields = {f_seq_num, f_ack_num, f_syn, f_ack, f_fin, f_version, f_conn_id, f_timestamp, f_wide, f_window, f_sack_count, f_sack_1_start, f_sack_1_end, f_sack_2_start, f_sack_2_end, f_sack_3_start, f_sack_3_end, f_seq_num_hi, f_ack_num_hi, f_eom, f_batch, f_empty, f_reserved, f_payload}
+
+-- Header layouts by version
+local layouts = {
+    [0] = { length = 5, fields = { {f_seq_num, 0, 2}, {f_ack_num, 2, 2}, {f_syn, 4, 1}, {f_ack, 4, 1}, {f_fin, 4, 1}, {f_version, 4, 1} } },
+    [1] = { length = 15, fields = { {f_seq_num, 0, 2}, {f_ack_num, 2, 2}, {f_syn, 4, 1}, {f_ack, 4, 1}, {f_fin, 4, 1}, {f_version, 4, 1}, {f_conn_id, 5, 4}, {f_timestamp, 9, 4}, {f_wide, 13, 1}, {f_window, 13, 2} } },
+    [2] = { length = 40, fields = { {f_seq_num, 0, 2}, {f_ack_num, 2, 2}, {f_syn, 4, 1}, {f_ack, 4, 1}, {f_fin, 4, 1}, {f_version, 4, 1}, {f_conn_id, 5, 4}, {f_timestamp, 9, 4}, {f_wide, 13, 1}, {f_window, 13, 2}, {f_sack_count, 15, 1}, {f_sack_1_start, 16, 4}, {f_sack_1_end, 20, 4}, {f_sack_2_start, 24, 4}, {f_sack_2_end, 28, 4}, {f_sack_3_start, 32, 4}, {f_sack_3_end, 36, 4} } },
+    [3] = { length = 19, fields = { {f_seq_num, 0, 2}, {f_ack_num, 2, 2}, {f_syn, 4, 1}, {f_ack, 4, 1}, {f_fin, 4, 1}, {f_version, 4, 1}, {f_conn_id, 5, 4}, {f_timestamp, 9, 4}, {f_wide, 13, 1}, {f_window, 13, 2}, {f_seq_num_hi, 15, 2}, {f_ack_num_hi, 17, 2} } },
+    [4] = { length = 44, fields = { {f_seq_num, 0, 2}, {f_ack_num, 2, 2}, {f_syn, 4, 1}, {f_ack, 4, 1}, {f_fin, 4, 1}, {f_version, 4, 1}, {f_conn_id, 5, 4}, {f_timestamp, 9, 4}, {f_wide, 13, 1}, {f_window, 13, 2}, {f_sack_count, 15, 1}, {f_sack_1_start, 16, 4}, {f_sack_1_end, 20, 4}, {f_sack_2_start, 24, 4}, {f_sack_2_end, 28, 4}, {f_sack_3_start, 32, 4}, {f_sack_3_end, 36, 4}, {f_seq_num_hi, 40, 2}, {f_ack_num_hi, 42, 2} } },
+    [5] = { length = 20, fields = { {f_seq_num, 0, 2}, {f_ack_num, 2, 2}, {f_syn, 4, 1}, {f_ack, 4, 1}, {f_fin, 4, 1}, {f_version, 4, 1}, {f_conn_id, 5, 4}, {f_timestamp, 9, 4}, {f_wide, 13, 1}, {f_window, 13, 2}, {f_seq_num_hi, 15, 2}, {f_ack_num_hi, 17, 2}, {f_eom, 19, 1}, {f_batch, 19, 1}, {f_empty, 19, 1}, {f_reserved, 19, 1} } },
+}
 
 -- Dissector function
 function my_proto.dissector(buffer, pinfo, tree)
     pinfo.cols.protocol = "ReliableUDP"
 
     local subtree = tree:add(my_proto, buffer(), "Custom Reliable UDP Protocol Data")
+    if buffer:len() < 5 then return end
+
+    local version = bit.band(bit.rshift(buffer(4, 1):uint(), 0), 0x1F)
+    local layout = layouts[version]
+    if layout == nil or buffer:len() < layout.length then return end
 
-    subtree:add(f_seq_num, buffer(0, 2))
-    subtree:add(f_ack_num, buffer(2, 2))
-
-    -- Flags
-    local flags = buffer(4, 1)
-    local flags_subtree = subtree:add(f_flags, flags)
-    flags_subtree:add(f_syn, flags)
-    flags_subtree:add(f_ack, flags)
-    flags_subtree:add(f_fin, flags)
-    flags_subtree:add(f_rst, flags)
-    flags_subtree:add(f_offset, flags)
+    for _, field in ipairs(layout.fields) do
+        subtree:add(field[1], buffer(field[2], field[3]))
+    end
+    if buffer:len() > layout.length then
+        subtree:add(f_payload, buffer(layout.length))
+    end
 end
 
 local udp_port = DissectorTable.get("udp.port")